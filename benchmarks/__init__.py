@@ -0,0 +1,3 @@
+"""
+Throughput and latency benchmarks for BizzMQ, run with `python -m benchmarks`.
+"""
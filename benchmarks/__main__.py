@@ -0,0 +1,47 @@
+"""
+Run the BizzMQ benchmark suite.
+
+    python -m benchmarks --redis-url redis://localhost:6379/15 --output results.json
+    python -m benchmarks --scale 0.1 --baseline results.json
+
+Without --redis-url the suite runs against an in-process fakeredis server, which is
+useful to compare client-side overhead but says little about real throughput. Use a
+local redis-server with a spare database for numbers worth sizing a fleet on.
+"""
+import argparse
+import sys
+import time
+
+from .harness import connect, format_table, load_baseline, run_metadata, write_report
+from .scenarios import SCENARIOS
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="BizzMQ throughput and latency benchmarks")
+    parser.add_argument("--redis-url", help="Redis to benchmark against, e.g. redis://localhost:6379/15. Defaults to an in-process fakeredis")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run, repeatable. Defaults to all")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the number of messages per scenario")
+    parser.add_argument("--output", default="-", help="Where to write the JSON report, - for stdout")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare ops/s against")
+    args = parser.parse_args()
+    if args.scale <= 0:
+        parser.error("--scale must be greater than 0")
+
+    redis_client = connect(args.redis_url)
+    report = {"meta": run_metadata(redis_client, args.redis_url), "scale": args.scale, "results": []}
+
+    for name in args.scenario or list(SCENARIOS):
+        print(f"running {name}...", file=sys.stderr)
+        started = time.perf_counter()
+        report["results"].extend(SCENARIOS[name](redis_client, args.scale))
+        print(f"  done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    # The table goes to stderr so stdout stays valid JSON
+    print(format_table(report["results"], baseline), file=sys.stderr)
+    write_report(args.output, report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
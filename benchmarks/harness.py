@@ -0,0 +1,146 @@
+"""
+Timing, percentile and reporting helpers shared by the benchmark scenarios.
+"""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+def connect(redis_url: Optional[str]) -> Any:
+    """A Redis client for `redis_url`, or an in-process fakeredis server when it's None."""
+    if redis_url:
+        import redis
+        client = redis.from_url(redis_url)
+        client.ping()
+        return client
+    try:
+        import fakeredis
+    except ImportError as e:
+        raise ImportError("Benchmarks without --redis-url need fakeredis with Lua support: pip install 'fakeredis[lua]'") from e
+    return fakeredis.FakeRedis()
+
+
+def backend_info(redis_client: Any, redis_url: Optional[str]) -> Dict[str, Any]:
+    if not redis_url:
+        import fakeredis
+        return {"backend": "fakeredis", "version": getattr(fakeredis, "__version__", "unknown")}
+    info = redis_client.info("server")
+    return {"backend": "redis", "version": info.get("redis_version"), "url": redis_url.split("@")[-1]}
+
+
+def run_metadata(redis_client: Any, redis_url: Optional[str]) -> Dict[str, Any]:
+    """What the numbers were measured on, so runs can be told apart when comparing them."""
+    import bizzmq
+    return {
+        "bizzmq_version": bizzmq.__version__,
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "redis": backend_info(redis_client, redis_url),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, cwd=os.path.dirname(__file__)).decode().strip()
+    except Exception:
+        return None
+
+
+def queue_name(scenario: str) -> str:
+    # Unique per run, so a benchmark never reads leftovers of an earlier one
+    return f"bench:{scenario}:{uuid.uuid4().hex[:8]}"
+
+
+def delete_queue(redis_client: Any, name: str) -> None:
+    """Remove every key a benchmark queue may have created."""
+    keys = []
+    for pattern in (f"queue:{name}*", f"queue_*:{name}*", f"queue_meta:{name}"):
+        keys.extend(redis_client.scan_iter(match=pattern, count=1000))
+    if keys:
+        redis_client.delete(*set(keys))
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def result(scenario: str, params: Dict[str, Any], operations: int, seconds: float, latencies: Optional[List[float]] = None, **extra: Any) -> Dict[str, Any]:
+    """
+    One benchmark measurement.
+
+    `operations` done in `seconds` gives ops/s. `latencies` are per-operation times in
+    seconds, reported in milliseconds.
+    """
+    record: Dict[str, Any] = {
+        "scenario": scenario,
+        "params": params,
+        "operations": operations,
+        "seconds": round(seconds, 6),
+        "ops_per_sec": round(operations / seconds, 2) if seconds > 0 else None,
+    }
+    if latencies:
+        ordered = sorted(latencies)
+        record["latency_ms"] = {
+            "p50": round(percentile(ordered, 0.50) * 1000, 4),
+            "p99": round(percentile(ordered, 0.99) * 1000, 4),
+            "p999": round(percentile(ordered, 0.999) * 1000, 4),
+            "mean": round(sum(ordered) / len(ordered) * 1000, 4),
+            "max": round(ordered[-1] * 1000, 4),
+            "samples": len(ordered),
+        }
+    record.update(extra)
+    return record
+
+
+def wait_until(condition: Callable[[], bool], timeout: float, interval: float = 0.005) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
+
+
+def result_key(record: Dict[str, Any]) -> str:
+    params = ",".join(f"{k}={v}" for k, v in sorted(record["params"].items()))
+    return f"{record['scenario']}[{params}]"
+
+
+def format_table(records: List[Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    lines = [f"{'benchmark':<58} {'ops/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'p999 ms':>10}" + ("  vs baseline" if baseline else "")]
+    for record in records:
+        latency = record.get("latency_ms", {})
+        line = f"{result_key(record):<58} {record['ops_per_sec'] or 0:>12.1f} {latency.get('p50', float('nan')):>10.3f} {latency.get('p99', float('nan')):>10.3f} {latency.get('p999', float('nan')):>10.3f}"
+        if baseline:
+            previous = baseline.get(result_key(record))
+            if previous and previous.get("ops_per_sec") and record["ops_per_sec"]:
+                line += f"  {(record['ops_per_sec'] / previous['ops_per_sec'] - 1) * 100:+.1f}% ops/s"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path) as f:
+        return {result_key(record): record for record in json.load(f)["results"]}
+
+
+def write_report(path: Optional[str], report: Dict[str, Any]) -> None:
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if path in (None, "-"):
+        sys.stdout.write(data + "\n")
+    else:
+        with open(path, "w") as f:
+            f.write(data + "\n")
@@ -0,0 +1,219 @@
+"""
+Benchmark scenarios. Each takes a Redis client and a scale factor and returns result records.
+"""
+import random
+import threading
+import time
+from typing import Any, Dict, List
+
+from bizzmq.consumer import consume_message_from_queue
+from bizzmq.dlq import dead_letter_count, redrive_dead_letter_messages
+from bizzmq.message import MessageOptions
+from bizzmq.producer import publish_message_to_queue, publish_messages_to_queue
+from bizzmq.queue import QueueOptions, create_queue
+
+from .harness import delete_queue, queue_name, result, wait_until
+
+# Longest a scenario waits for consumers to catch up before giving up
+DRAIN_TIMEOUT = 120.0
+
+
+def _payload(size: int, seed: int = 0) -> Dict[str, Any]:
+    # Random letters compress about as well as typical JSON text, and the seed keeps runs comparable
+    rng = random.Random(seed)
+    return {"body": "".join(rng.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(size))}
+
+
+def publish_single(redis_client: Any, scale: float) -> List[Dict[str, Any]]:
+    """One publish_message_to_queue call per message."""
+    count = max(int(5000 * scale), 100)
+    name = queue_name("publish_single")
+    create_queue(redis_client, name, QueueOptions())
+    payload = _payload(100)
+    try:
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(count):
+            op_started = time.perf_counter()
+            publish_message_to_queue(redis_client, name, payload, None)
+            latencies.append(time.perf_counter() - op_started)
+        elapsed = time.perf_counter() - started
+    finally:
+        delete_queue(redis_client, name)
+    return [result("publish_single", {"payload_bytes": 100}, count, elapsed, latencies)]
+
+
+def publish_batch(redis_client: Any, scale: float) -> List[Dict[str, Any]]:
+    """publish_messages_to_queue at several batch sizes. Latency is per batch call, ops are messages."""
+    records = []
+    payload = _payload(100)
+    for batch_size in (10, 100, 1000):
+        total = max(int(50000 * scale), batch_size * 10)
+        name = queue_name("publish_batch")
+        create_queue(redis_client, name, QueueOptions())
+        batch = [payload] * batch_size
+        try:
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(total // batch_size):
+                op_started = time.perf_counter()
+                publish_messages_to_queue(redis_client, name, batch)
+                latencies.append(time.perf_counter() - op_started)
+            elapsed = time.perf_counter() - started
+        finally:
+            delete_queue(redis_client, name)
+        records.append(result("publish_batch", {"batch_size": batch_size, "payload_bytes": 100}, (total // batch_size) * batch_size, elapsed, latencies))
+    return records
+
+
+def end_to_end_latency(redis_client: Any, scale: float) -> List[Dict[str, Any]]:
+    """
+    Time from the publish call to the start of the callback, with a consumer already waiting.
+
+    Messages are published back to back, so the numbers include queueing behind
+    earlier messages once the consumer falls behind.
+    """
+    records = []
+    for concurrency, reliable in ((1, False), (4, False), (4, True)):
+        count = max(int(3000 * scale), 100)
+        name = queue_name("end_to_end")
+        create_queue(redis_client, name, QueueOptions())
+        latencies: List[float] = []
+        lock = threading.Lock()
+
+        def callback(message: Dict[str, Any]) -> None:
+            received = time.perf_counter()
+            with lock:
+                latencies.append(received - message["sent_at"])
+
+        cleanup, err = consume_message_from_queue(redis_client, name, callback, block_timeout=0.1, reliable=reliable, concurrency=concurrency)
+        if err:
+            raise err
+        try:
+            started = time.perf_counter()
+            for _ in range(count):
+                publish_message_to_queue(redis_client, name, {"sent_at": time.perf_counter()}, None)
+            drained = wait_until(lambda: len(latencies) >= count, DRAIN_TIMEOUT)
+            elapsed = time.perf_counter() - started
+        finally:
+            cleanup()
+            delete_queue(redis_client, name)
+        records.append(result("end_to_end", {"concurrency": concurrency, "reliable": reliable}, len(latencies), elapsed, latencies, complete=drained))
+    return records
+
+
+def consume_throughput(redis_client: Any, scale: float) -> List[Dict[str, Any]]:
+    """Drain a prefilled queue, one message per callback versus batches."""
+    records = []
+    payload = _payload(100)
+    for batch_size in (None, 100):
+        count = max(int(20000 * scale), 500)
+        name = queue_name("consume")
+        create_queue(redis_client, name, QueueOptions())
+        publish_messages_to_queue(redis_client, name, [payload] * count)
+        handled = [0]
+        lock = threading.Lock()
+
+        def callback(message: Any) -> None:
+            with lock:
+                handled[0] += len(message) if batch_size else 1
+
+        started = time.perf_counter()
+        cleanup, err = consume_message_from_queue(redis_client, name, callback, block_timeout=0.1, batch_size=batch_size)
+        if err:
+            raise err
+        try:
+            drained = wait_until(lambda: handled[0] >= count, DRAIN_TIMEOUT)
+            elapsed = time.perf_counter() - started
+        finally:
+            cleanup()
+            delete_queue(redis_client, name)
+        records.append(result("consume", {"batch_size": batch_size or 1}, handled[0], elapsed, complete=drained))
+    return records
+
+
+def failure_storm(redis_client: Any, scale: float) -> List[Dict[str, Any]]:
+    """
+    Every callback fails: each message is retried `max_retries` times, then dead-lettered.
+
+    Ops are failure transitions (retries plus DLQ moves). The DLQ is then redriven in
+    full, which is reported as its own record.
+    """
+    max_retries = 3
+    count = max(int(2000 * scale), 100)
+    name = queue_name("failure_storm")
+    create_queue(redis_client, name, QueueOptions(config_dead_letter_queue=True, max_retries=max_retries))
+    publish_messages_to_queue(redis_client, name, [_payload(100)] * count)
+
+    def callback(message: Dict[str, Any]) -> None:
+        raise RuntimeError("benchmark failure")
+
+    records = []
+    started = time.perf_counter()
+    cleanup, err = consume_message_from_queue(redis_client, name, callback, block_timeout=0.1, concurrency=4)
+    if err:
+        raise err
+    try:
+        drained = wait_until(lambda: dead_letter_count(redis_client, name) >= count, DRAIN_TIMEOUT)
+        elapsed = time.perf_counter() - started
+    finally:
+        cleanup()
+    # Each message fails max_retries + 1 times: max_retries requeues, then one DLQ move
+    records.append(result("failure_storm", {"max_retries": max_retries}, count * (max_retries + 1), elapsed, complete=drained))
+
+    try:
+        # No consumer is running any more, so redriven messages stay on the queue
+        started = time.perf_counter()
+        moved = redrive_dead_letter_messages(redis_client, name)
+        records.append(result("dlq_redrive", {"messages": count}, moved, time.perf_counter() - started))
+    finally:
+        delete_queue(redis_client, name)
+    return records
+
+
+def payload_sweep(redis_client: Any, scale: float) -> List[Dict[str, Any]]:
+    """Publish-to-callback latency and throughput across payload sizes, plain and zlib compressed."""
+    records = []
+    for size in (100, 1024, 10 * 1024, 100 * 1024, 1024 * 1024):
+        for compression in (None, "zlib"):
+            # Fewer messages for big payloads, so every size moves a comparable number of bytes
+            count = max(int(min(2000, 20 * 1024 * 1024 // size) * scale), 20)
+            name = queue_name("payload_sweep")
+            create_queue(redis_client, name, QueueOptions(compression=compression))
+            payload = _payload(size, seed=size)
+            latencies: List[float] = []
+            lock = threading.Lock()
+
+            def callback(message: Dict[str, Any]) -> None:
+                received = time.perf_counter()
+                with lock:
+                    latencies.append(received - message["sent_at"])
+
+            cleanup, err = consume_message_from_queue(redis_client, name, callback, block_timeout=0.1)
+            if err:
+                raise err
+            try:
+                started = time.perf_counter()
+                for _ in range(count):
+                    publish_message_to_queue(redis_client, name, dict(payload, sent_at=time.perf_counter()), MessageOptions())
+                drained = wait_until(lambda: len(latencies) >= count, DRAIN_TIMEOUT)
+                elapsed = time.perf_counter() - started
+            finally:
+                cleanup()
+                delete_queue(redis_client, name)
+            records.append(result(
+                "payload_sweep", {"payload_bytes": size, "compression": compression or "none"},
+                len(latencies), elapsed, latencies, complete=drained,
+                megabytes_per_sec=round(len(latencies) * size / elapsed / 1024 / 1024, 3),
+            ))
+    return records
+
+
+SCENARIOS = {
+    "publish_single": publish_single,
+    "publish_batch": publish_batch,
+    "end_to_end": end_to_end_latency,
+    "consume": consume_throughput,
+    "failure_storm": failure_storm,
+    "payload_sweep": payload_sweep,
+}
@@ -2,19 +2,31 @@
 BizzMQ - A lightweight Redis-based message queue system with Dead Letter Queue support.
 """
 
+import logging
+
 __version__ = "1.0.0"
 
+# Silent unless the application configures logging for "bizzmq"
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
 # Import main client class
 from .client import BizzMQ
+from .async_client import AsyncBizzMQ
 
 # Import queue-related classes
-from .queue import QueueOptions, create_queue
-from .producer import publish_message_to_queue
+from .queue import QueueOptions, RetryOptions, create_queue
+from .metadata import QueueMetadataCache
+from .producer import QueueFullError, publish_message_to_queue, publish_messages_to_queue, queue_depth
 from .consumer import consume_message_from_queue
+from .multi_consumer import consume_from_queues
+from .backend import Backend, Delivery, RedisBackend, consume_with_backend
+from .memory_backend import MemoryBackend
+from .cluster import hash_tag, partition_names
+from .metrics import DepthSampler, InMemoryMetrics, MetricsSink, add_metrics_sink, remove_metrics_sink
 from .message import MessageOptions
 
 # Import message-related classes
 # from .message import MessageOptions
 
 # Define what should be accessible when someone does `from bizzmq import *`
-__all__ = ["BizzMQ", "QueueOptions",  "create_queue", "publish_message_to_queue", "MessageOptions", "consume_message_from_queue"]
\ No newline at end of file
+__all__ = ["BizzMQ", "AsyncBizzMQ", "QueueOptions", "RetryOptions", "QueueMetadataCache", "create_queue", "publish_message_to_queue", "publish_messages_to_queue", "queue_depth", "QueueFullError", "MessageOptions", "consume_message_from_queue", "consume_from_queues", "Backend", "Delivery", "RedisBackend", "MemoryBackend", "consume_with_backend", "hash_tag", "partition_names", "MetricsSink", "InMemoryMetrics", "DepthSampler", "add_metrics_sink", "remove_metrics_sink"]
\ No newline at end of file
@@ -0,0 +1,537 @@
+"""
+Asyncio client for BizzMQ, built on redis.asyncio.
+
+Mirrors the BizzMQ API with coroutines so queues can be used from an event loop
+without blocking it. All operations share one connection pool.
+"""
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import redis.asyncio as aioredis
+
+from .consumer import (
+    DEFAULT_BLOCK_TIMEOUT,
+    _callback_finished,
+    _callback_started,
+    _dead_letter_script_call,
+    _decode_message,
+    _report_failed_move,
+    _report_transition,
+    _retry_script_call,
+)
+from . import metrics
+from .codecs import get_codec
+from .message import MessageOptions, update_lifecycle_status
+from .payloads import PAYLOAD_REF_FIELD, PayloadPacker, get_compressor, has_packed_payload, unpack_payload
+from .ids import new_message_id
+from .producer import (
+    DEFAULT_PUBLISH_CHUNK_SIZE,
+    PIPELINE_CHUNKS_PER_FLUSH,
+    QueueFullError,
+    _bounded_push_done,
+    _dedup_ttl_ms,
+    _record_publish,
+    _serialize_message,
+    _stream_queue_depth,
+    bounded_push_call,
+    dedup_key,
+    overflow_poll_delay,
+    target_queue,
+)
+from .metadata import DEFAULT_METADATA_TTL, QueueMetadataCache
+from .queue import OVERFLOW_BLOCK, STORAGE_STREAM, QueueOptions, partition_options, partition_queue_names, priority_queue_keys, queue_key
+from .scheduler import (
+    PROMOTE_BATCH_SIZE,
+    SCHEDULER_POLL_INTERVAL,
+    due_time_ms,
+    next_poll_delay,
+    promote_keys,
+    scheduled_key,
+)
+from .scripts import register_scripts
+from .streams import add_to_stream, queue_stream_depth
+
+logger = logging.getLogger(__name__)
+
+# Default number of callbacks a single async consumer runs at the same time
+DEFAULT_CONCURRENCY = 10
+# Default size of the shared connection pool
+DEFAULT_MAX_CONNECTIONS = 50
+
+AsyncCallback = Callable[[Dict[str, Any]], Union[Awaitable[None], None]]
+
+
+class AsyncBizzMQ:
+    def __init__(self, redis_url: str, max_connections: int = DEFAULT_MAX_CONNECTIONS, metadata_ttl: float = DEFAULT_METADATA_TTL, validate_metadata_version: bool = False) -> None:
+        if not redis_url:
+            raise ValueError("Redis URL is required")
+
+        # Every publish and consumer on this client borrows from the same pool, and callers
+        # wait for a free connection instead of failing once all of them are taken
+        pool = aioredis.BlockingConnectionPool.from_url(redis_url, max_connections=max_connections)
+        self.redisInstance = aioredis.Redis(connection_pool=pool)
+        # Queue state transitions run as server-side scripts, see scripts.py
+        self._scripts = register_scripts(self.redisInstance)
+        # Parsed queue options, so publishes and failures don't re-read queue_meta every time
+        self.metadata = QueueMetadataCache(metadata_ttl, validate_metadata_version)
+
+    async def connect(self) -> None:
+        try:
+            await self.redisInstance.ping()
+        except aioredis.RedisError as err:
+            raise ConnectionError(f"Failed to connect to Redis: {str(err)}") from err
+        logger.info("Connected to Redis")
+
+    async def close(self) -> None:
+        await self.redisInstance.close()
+        await self.redisInstance.connection_pool.disconnect()
+
+    async def __aenter__(self) -> "AsyncBizzMQ":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def create_queue(self, queue_name: str, options: Optional[QueueOptions] = None) -> None:
+        if not queue_name:
+            raise ValueError("Queue name is required")
+
+        queue_meta_key = f"queue_meta:{queue_name}"
+        if await self.redisInstance.exists(queue_meta_key):
+            logger.debug("Queue %s already exists", queue_name)
+            return
+
+        options = options or QueueOptions()
+        if options.priority_levels < 0:
+            raise ValueError("priority_levels can't be negative")
+        if options.storage == STORAGE_STREAM and options.priority_levels > 0:
+            raise ValueError("Stream queues don't support priority_levels")
+        if options.partitions < 0:
+            raise ValueError("partitions can't be negative")
+        if options.max_length is not None:
+            if options.storage == STORAGE_STREAM:
+                raise ValueError("Stream queues don't support max_length, use stream_max_length")
+            if options.max_length < 1:
+                raise ValueError("max_length must be at least 1")
+        get_codec(options.codec)
+        if options.compression:
+            get_compressor(options.compression)
+
+        queue_data = {"createdAt": int(time.time() * 1000), "version": 1}
+        queue_data.update(options.to_dict())
+
+        for name in partition_queue_names(queue_name, options):
+            await self.create_queue(name, partition_options(options))
+
+        try:
+            await self.redisInstance.hset(queue_meta_key, mapping=queue_data)
+            self.metadata.invalidate(queue_name)
+            logger.info("Queue %s created", queue_name)
+        except Exception as e:
+            error_msg = f"Failed to create queue: {str(e)}"
+            logger.error("%s", error_msg)
+            raise Exception(error_msg)
+
+    async def publish_message_to_queue(self, queue_name: str, message: Any, message_options: Optional[MessageOptions] = None) -> str:
+        if not queue_name:
+            raise ValueError("❌ Queue name not provided")
+
+        started = time.perf_counter() if metrics.enabled() else None
+        queue_options = await self._require_queue_options(queue_name)
+        options = message_options or MessageOptions()
+        target = target_queue(queue_name, queue_options, options.partition_key or options.dedup_key)
+
+        now_ms = int(time.time() * 1000)
+        message_id = new_message_id()
+        packer = PayloadPacker(get_codec(queue_options.codec), queue_name, queue_options)
+        message_json = _serialize_message(packer, message_id, message, options, now_ms)
+
+        if options.dedup_key is not None:
+            existing_id = await self._claim_dedup_key(queue_name, options, message_id)
+            if existing_id is not None:
+                logger.debug("Duplicate job skipped on queue %s - ID: %s", queue_name, existing_id)
+                return existing_id
+
+        due_ms = due_time_ms(options)
+        payload_keys = [key for key, _ in packer.offloaded]
+        try:
+            if packer.offloaded:
+                # Payloads go in first so a consumer never sees a reference it can't resolve
+                offload = self.redisInstance.pipeline(transaction=False)
+                packer.write_offloaded(offload)
+                await offload.execute()
+            if queue_options.max_length:
+                await self._push_bounded(queue_name, target, queue_options, options.priority, [message_json], due_ms)
+            elif due_ms is None and queue_options.storage == STORAGE_STREAM:
+                await add_to_stream(self.redisInstance, target, message_json, queue_options.stream_max_length)
+            elif due_ms is None:
+                await self.redisInstance.lpush(queue_key(target, options.priority, queue_options.priority_levels), message_json)
+            else:
+                await self.redisInstance.zadd(scheduled_key(target), {message_json: due_ms})
+        except QueueFullError:
+            if options.dedup_key is not None:
+                await self._release_dedup_key(queue_name, options.dedup_key)
+            await self._delete_payloads(payload_keys)
+            raise
+        except Exception as e:
+            if options.dedup_key is not None:
+                await self._release_dedup_key(queue_name, options.dedup_key)
+            await self._delete_payloads(payload_keys)
+            raise RuntimeError(f"Failed to push message to queue: {str(e)}")
+
+        _record_publish(queue_name, started, 1)
+        if due_ms is None:
+            logger.debug("Job added to queue %s - ID: %s", queue_name, message_id)
+        else:
+            logger.debug("Job scheduled on queue %s - ID: %s", queue_name, message_id)
+        return message_id
+
+    async def publish_messages_to_queue(self, queue_name: str, messages: Iterable[Any], message_options: Optional[MessageOptions] = None, chunk_size: int = DEFAULT_PUBLISH_CHUNK_SIZE) -> List[str]:
+        """Async counterpart of `producer.publish_messages_to_queue`."""
+        if not queue_name:
+            raise ValueError("❌ Queue name not provided")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be a positive integer")
+        if message_options is not None and message_options.dedup_key is not None:
+            raise ValueError("dedup_key identifies a single message, publish deduplicated messages with publish_message_to_queue")
+
+        started = time.perf_counter() if metrics.enabled() else None
+        queue_options = await self._require_queue_options(queue_name)
+        options = message_options or MessageOptions()
+        due_ms = due_time_ms(message_options)
+        if queue_options.max_length:
+            chunk_size = min(chunk_size, queue_options.max_length)
+        packer = PayloadPacker(get_codec(queue_options.codec), queue_name, queue_options)
+        message_ids: List[str] = []
+        chunk: List[str] = []
+        pipe = self.redisInstance.pipeline(transaction=False)
+        pending_chunks = 0
+        pending_payload_keys: List[str] = []
+
+        def push_chunk(chunk: List[str]) -> None:
+            target = target_queue(queue_name, queue_options, options.partition_key)
+            pending_payload_keys.extend(key for key, _ in packer.offloaded)
+            packer.write_offloaded(pipe)
+            if due_ms is None and queue_options.storage == STORAGE_STREAM:
+                for message_json in chunk:
+                    add_to_stream(pipe, target, message_json, queue_options.stream_max_length)
+            elif due_ms is None:
+                pipe.lpush(queue_key(target, options.priority, queue_options.priority_levels), *chunk)
+            else:
+                pipe.zadd(scheduled_key(target), {message_json: due_ms for message_json in chunk})
+
+        async def push_bounded_chunk(chunk: List[str]) -> None:
+            target = target_queue(queue_name, queue_options, options.partition_key)
+            payload_keys = [key for key, _ in packer.offloaded]
+            try:
+                if packer.offloaded:
+                    offload = self.redisInstance.pipeline(transaction=False)
+                    packer.write_offloaded(offload)
+                    await offload.execute()
+                await self._push_bounded(queue_name, target, queue_options, options.priority, chunk, due_ms)
+            except QueueFullError as e:
+                await self._delete_payloads(payload_keys)
+                e.message_ids = message_ids[:len(message_ids) - len(chunk)]
+                _record_publish(queue_name, started, len(e.message_ids))
+                raise
+            except Exception as e:
+                await self._delete_payloads(payload_keys)
+                raise RuntimeError(f"Failed to push messages to queue: {str(e)}")
+
+        async def flush_pipeline() -> None:
+            nonlocal pending_chunks
+            if not pending_chunks:
+                return
+            try:
+                await pipe.execute()
+            except Exception as e:
+                await self._delete_payloads(pending_payload_keys)
+                raise RuntimeError(f"Failed to push messages to queue: {str(e)}")
+            pending_chunks = 0
+            pending_payload_keys.clear()
+
+        for message in messages:
+            message_id = new_message_id()
+            # Stamped one by one, a generator may take a while to yield the whole batch
+            chunk.append(_serialize_message(packer, message_id, message, options, int(time.time() * 1000)))
+            message_ids.append(message_id)
+
+            if len(chunk) >= chunk_size and queue_options.max_length:
+                # Capped queues push chunk by chunk, the next one only goes out once this one fits
+                await push_bounded_chunk(chunk)
+                chunk = []
+            elif len(chunk) >= chunk_size:
+                push_chunk(chunk)
+                chunk = []
+                pending_chunks += 1
+                if pending_chunks >= PIPELINE_CHUNKS_PER_FLUSH:
+                    await flush_pipeline()
+
+        if chunk and queue_options.max_length:
+            await push_bounded_chunk(chunk)
+        elif chunk:
+            push_chunk(chunk)
+            pending_chunks += 1
+        await flush_pipeline()
+
+        _record_publish(queue_name, started, len(message_ids))
+        logger.debug("%d jobs added to queue %s", len(message_ids), queue_name)
+        return message_ids
+
+    async def consume_message_from_queue(self, queue_name: str, callback: AsyncCallback, concurrency: int = DEFAULT_CONCURRENCY, block_timeout: float = DEFAULT_BLOCK_TIMEOUT) -> Tuple[Optional[Callable[[], Awaitable[None]]], Optional[Exception]]:
+        """
+        Start consuming messages from a queue as a background task.
+
+        `callback` may be a coroutine function or a plain function; plain functions run
+        in the loop's default executor. At most `concurrency` callbacks run at once, and
+        the consumer stops popping while all slots are taken. Returns an async cleanup
+        function that stops the consumer and waits for running callbacks to finish.
+        """
+        if not queue_name:
+            return None, Exception("❌ Queue name not provided")
+        if concurrency <= 0:
+            return None, Exception("❌ concurrency must be greater than 0")
+        if block_timeout <= 0:
+            return None, Exception("❌ block_timeout must be greater than 0")
+
+        try:
+            queue_options = await self.metadata.get_async(self.redisInstance, queue_name) or QueueOptions()
+        except Exception as e:
+            return None, Exception(f"Failed to get queue options: {str(e)}")
+        if queue_options.storage == STORAGE_STREAM:
+            return None, Exception(f"❌ Queue \"{queue_name}\" is stream-backed, consume it with BizzMQ")
+        if queue_options.partitions:
+            return await self._consume_partitions(queue_name, queue_options, callback, concurrency, block_timeout)
+
+        use_dead_letter_queue = queue_options.config_dead_letter_queue
+        max_retries = queue_options.max_retries
+        priority_levels = queue_options.priority_levels
+        starvation_limit = queue_options.starvation_limit
+        queue_keys = priority_queue_keys(queue_name, priority_levels)
+        pops = 0
+        should_stop = asyncio.Event()
+        slots = asyncio.Semaphore(concurrency)
+        running: set = set()
+
+        async def process_job(data: Any) -> None:
+            try:
+                message_obj, message_data = _decode_message(data)
+            except ValueError as e:
+                logger.error("Failed to parse message from queue %s: %s", queue_name, e)
+                return
+
+            started = _callback_started(queue_name, (message_obj,))
+            try:
+                if has_packed_payload(message_obj):
+                    # Resolved up front, a lazy fetch would need a blocking client
+                    message_data = await self._load_payload(message_obj)
+                await _invoke_callback(callback, message_data)
+                _callback_finished(queue_name, started, processed=1)
+                if PAYLOAD_REF_FIELD in message_obj:
+                    await self.redisInstance.unlink(message_obj[PAYLOAD_REF_FIELD])
+            except Exception as err:
+                _callback_finished(queue_name, started, failed=1)
+                message_obj = update_lifecycle_status(message_obj, "failed")
+                if use_dead_letter_queue:
+                    if max_retries > 0:
+                        move_err = await self._requeue_message(queue_name, message_obj, err)
+                    else:
+                        move_err = await self._move_message_to_dlq(queue_name, message_obj, err)
+                    if move_err:
+                        _report_failed_move(queue_name, move_err, False)
+                else:
+                    logger.warning("Message failed on queue %s but no DLQ configured", queue_name)
+                    metrics.count(metrics.MESSAGES_DISCARDED, queue_name)
+                logger.warning("Error processing message from queue %s: %s", queue_name, err)
+
+        def release_slot(task: asyncio.Task) -> None:
+            running.discard(task)
+            slots.release()
+
+        async def fetch_loop() -> None:
+            nonlocal pops
+            while not should_stop.is_set():
+                # Waiting for a free slot before popping is what applies backpressure
+                await slots.acquire()
+                try:
+                    # Same anti-starvation policy as the sync consumer
+                    keys = queue_keys
+                    if len(keys) > 1 and starvation_limit > 0 and pops % starvation_limit == starvation_limit - 1:
+                        keys = keys[::-1]
+                    result = await self.redisInstance.brpop(keys, timeout=block_timeout)
+                except asyncio.CancelledError:
+                    slots.release()
+                    raise
+                except Exception as e:
+                    slots.release()
+                    logger.error("Error popping message from queue %s: %s", queue_name, e)
+                    await asyncio.sleep(block_timeout)
+                    continue
+
+                if not result:
+                    slots.release()
+                    continue
+
+                pops += 1
+                _, message = result
+                task = asyncio.ensure_future(process_job(message))
+                running.add(task)
+                task.add_done_callback(release_slot)
+
+        async def scheduler_loop() -> None:
+            # Promotes delayed messages and backed-off retries once they're due
+            while not should_stop.is_set():
+                try:
+                    moved, next_due = await self._promote_due_messages(queue_name, priority_levels)
+                    delay = next_poll_delay(moved, next_due)
+                except Exception as e:
+                    logger.error("Error promoting scheduled messages of queue %s: %s", queue_name, e)
+                    delay = SCHEDULER_POLL_INTERVAL
+                try:
+                    await asyncio.wait_for(should_stop.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+        fetcher = asyncio.ensure_future(fetch_loop())
+        scheduler = asyncio.ensure_future(scheduler_loop())
+
+        async def cleanup() -> None:
+            should_stop.set()
+            # The fetch loop notices the flag once its current BRPOP returns
+            try:
+                await asyncio.wait_for(fetcher, block_timeout + 1)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            await scheduler
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return cleanup, None
+
+    async def _consume_partitions(self, queue_name: str, queue_options: QueueOptions, callback: AsyncCallback, concurrency: int, block_timeout: float) -> Tuple[Optional[Callable[[], Awaitable[None]]], Optional[Exception]]:
+        # One consumer per partition, so every partition is drained at the same pace
+        cleanups = []
+        for name in partition_queue_names(queue_name, queue_options):
+            cleanup, err = await self.consume_message_from_queue(name, callback, concurrency, block_timeout)
+            if err:
+                await asyncio.gather(*(c() for c in cleanups))
+                return None, err
+            cleanups.append(cleanup)
+
+        async def cleanup_all() -> None:
+            await asyncio.gather(*(c() for c in cleanups))
+
+        return cleanup_all, None
+
+    async def _require_queue_options(self, queue_name: str) -> QueueOptions:
+        options = await self.metadata.get_async(self.redisInstance, queue_name)
+        if options is None:
+            raise ValueError(f"❌ Queue \"{queue_name}\" does not exist. Create it first")
+        return options
+
+    async def queue_depth(self, queue_name: str) -> int:
+        """Async counterpart of `producer.queue_depth`."""
+        queue_options = await self._require_queue_options(queue_name)
+        names = partition_queue_names(queue_name, queue_options) or [queue_name]
+        pipe = self.redisInstance.pipeline(transaction=False)
+        if queue_options.storage == STORAGE_STREAM:
+            for name in names:
+                queue_stream_depth(pipe, name)
+                pipe.zcard(scheduled_key(name))
+            return _stream_queue_depth(await pipe.execute(raise_on_error=False))
+        for name in names:
+            for key in priority_queue_keys(name, queue_options.priority_levels):
+                pipe.llen(key)
+            pipe.zcard(scheduled_key(name))
+        return sum(await pipe.execute())
+
+    async def _push_bounded(self, queue_name: str, target: str, queue_options: QueueOptions, priority: int, messages: List[Any], due_ms: Optional[int]) -> None:
+        """Async counterpart of `producer._push_bounded`, waits for room without blocking the loop."""
+        keys, args = bounded_push_call(target, queue_options, priority, messages, due_ms)
+        deadline = time.monotonic() + queue_options.overflow_timeout
+        delay = 0.0
+        while not _bounded_push_done(queue_name, await self._scripts["push_bounded"](keys=keys, args=args)):
+            remaining = deadline - time.monotonic()
+            if queue_options.overflow != OVERFLOW_BLOCK or remaining <= 0:
+                logger.debug("Queue %s is full, rejected %d messages", queue_name, len(messages))
+                metrics.count(metrics.MESSAGES_REJECTED, queue_name, len(messages))
+                raise QueueFullError(queue_name, queue_options.max_length)
+            delay = overflow_poll_delay(delay, remaining)
+            await asyncio.sleep(delay)
+
+    async def _release_dedup_key(self, queue_name: str, key: str) -> None:
+        try:
+            await self.redisInstance.delete(dedup_key(queue_name, key))
+        except aioredis.RedisError:
+            pass
+
+    async def _delete_payloads(self, payload_keys: List[str]) -> None:
+        if not payload_keys:
+            return
+        try:
+            await self.redisInstance.delete(*payload_keys)
+        except aioredis.RedisError:
+            pass
+
+    async def _claim_dedup_key(self, queue_name: str, options: MessageOptions, message_id: str) -> Optional[str]:
+        """Async counterpart of `producer._claim_dedup_key`."""
+        key = dedup_key(queue_name, options.dedup_key)
+        ttl_ms = _dedup_ttl_ms(options)
+        try:
+            while True:
+                if await self.redisInstance.set(key, message_id, nx=True, px=ttl_ms):
+                    return None
+                existing_id = await self.redisInstance.get(key)
+                if existing_id is not None:
+                    return existing_id.decode('utf-8') if isinstance(existing_id, bytes) else existing_id
+        except aioredis.RedisError as e:
+            raise RuntimeError(f"Failed to check dedup key: {str(e)}")
+
+    async def _load_payload(self, message_obj: Dict[str, Any]) -> Dict[str, Any]:
+        data = await self.redisInstance.get(message_obj[PAYLOAD_REF_FIELD]) if PAYLOAD_REF_FIELD in message_obj else None
+        payload = unpack_payload(message_obj, lambda _: data)
+        return payload if isinstance(payload, dict) else {"data": payload}
+
+    async def _requeue_message(self, queuename: str, message: dict, processing_err: Exception) -> Optional[Exception]:
+        try:
+            queue_options = await self.metadata.get_async(self.redisInstance, queuename) or QueueOptions()
+            keys, args, retry_count, delay = _retry_script_call(queuename, queue_options, message, processing_err, None)
+            result = await self._scripts["retry_message"](keys=keys, args=args)
+        except Exception as e:
+            return Exception(f"Failed to requeue message: {str(e)}")
+
+        _report_transition(queuename, int(result), retry_count, queue_options.max_retries, delay)
+        return None
+
+    async def _move_message_to_dlq(self, queuename: str, message: dict, processing_err: Exception) -> Optional[Exception]:
+        try:
+            queue_options = await self.metadata.get_async(self.redisInstance, queuename) or QueueOptions()
+            keys, args = _dead_letter_script_call(queuename, queue_options, message, processing_err, None)
+            result = await self._scripts["dead_letter_message"](keys=keys, args=args)
+        except Exception as e:
+            return Exception(f"Failed to publish message to DLQ: {str(e)}")
+
+        _report_transition(queuename, int(result), 0, 0, 0)
+        return None
+
+    async def _promote_due_messages(self, queue_name: str, priority_levels: int) -> Tuple[int, Optional[int]]:
+        moved, next_due = await self._scripts["promote_due"](
+            keys=promote_keys(queue_name, priority_levels),
+            args=[int(time.time() * 1000), PROMOTE_BATCH_SIZE],
+        )
+        return int(moved), (int(next_due) if int(next_due) >= 0 else None)
+
+
+async def _invoke_callback(callback: AsyncCallback, message_data: Dict[str, Any]) -> None:
+    if inspect.iscoroutinefunction(callback):
+        await callback(message_data)
+        return
+
+    # Plain functions would block the loop, so hand them to the default executor
+    result = await asyncio.get_running_loop().run_in_executor(None, callback, message_data)
+    if inspect.isawaitable(result):
+        await result
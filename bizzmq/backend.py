@@ -0,0 +1,424 @@
+"""
+Storage backends behind `BizzMQ`.
+
+A `Backend` is everything the client needs from a broker: creating queues, pushing
+single messages and batches, a blocking pop that hands out a `Delivery`, and settling
+that delivery by ack, requeue (retry) or dead-lettering. Retry and DLQ decisions follow
+the queue's options the same way whatever the backend is.
+
+`RedisBackend` runs on the functions and Lua scripts the rest of the package uses, so
+Redis queues behave the same whether they're used through a backend or directly.
+`MemoryBackend` (see memory_backend.py) keeps queues in the process for pipelines and
+tests that don't need Redis. `consume_with_backend` is the consumer loop for any backend.
+"""
+import abc
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import redis
+
+from . import metrics
+from .consumer import (
+    DEFAULT_BLOCK_TIMEOUT,
+    DEFAULT_VISIBILITY_TIMEOUT,
+    MIN_BLOCK_TIMEOUT,
+    PRIORITY_IDLE_MIN_DELAY,
+    _InFlight,
+    _callback_finished,
+    _callback_started,
+    _dead_letter_script_call,
+    _decode_message,
+    _default_consumer_id,
+    _reap_expired_messages,
+    _register_consumer,
+    _release_payloads,
+    _report_transition,
+    _run_retry,
+    _settle_in_flight,
+    _track_claimed,
+    _unregister_consumer,
+)
+from .dlq import DEFAULT_REDRIVE_BATCH_SIZE
+from .message import MessageOptions, update_lifecycle_status
+from .metadata import get_queue_options, metadata_cache
+from .queue import STORAGE_STREAM, QueueOptions, partition_queue_names, priority_queue_keys
+from .scheduler import next_poll_delay, promote_due_messages
+from .scripts import RESULT_DISCARDED, RESULT_SCHEDULED, preload_scripts, run_script
+
+logger = logging.getLogger(__name__)
+
+
+class Delivery(NamedTuple):
+    """A popped message, held by the consumer until it's acked, requeued or dead-lettered."""
+    queue_name: str
+    message_id: Optional[str]
+    # The stored envelope and the data handed to the callback
+    envelope: Dict[str, Any]
+    data: Any
+    # Backend-specific handle used to settle the message
+    receipt: Any
+
+
+class Backend(abc.ABC):
+    """
+    Broker operations used by `BizzMQ`.
+
+    `pop` hands out one message at a time, which stays in flight until it's settled
+    with `ack`, `requeue` or `dead_letter`. `fail` picks between the last two the way
+    consumers do: queues without a DLQ drop failed messages, queues with retries
+    requeue them until the retries run out, and the rest go straight to the DLQ.
+    """
+
+    @abc.abstractmethod
+    def create_queue(self, queue_name: str, options: Optional[QueueOptions] = None) -> None:
+        """Create a queue. Creating one that already exists leaves its options alone."""
+
+    @abc.abstractmethod
+    def get_queue_options(self, queue_name: str) -> Optional[QueueOptions]:
+        """Options of a queue, or None if it doesn't exist."""
+
+    @abc.abstractmethod
+    def push(self, queue_name: str, message: Any, options: Optional[MessageOptions] = None) -> str:
+        """Publish one message and return its ID."""
+
+    @abc.abstractmethod
+    def push_many(self, queue_name: str, messages: Iterable[Any], options: Optional[MessageOptions] = None, chunk_size: Optional[int] = None) -> List[str]:
+        """Publish many messages with the same options and return their IDs in order."""
+
+    @abc.abstractmethod
+    def pop(self, queue_name: str, timeout: float) -> Optional[Delivery]:
+        """Wait up to `timeout` seconds for the next message, or return None."""
+
+    @abc.abstractmethod
+    def ack(self, delivery: Delivery) -> None:
+        """Settle a message that was handled."""
+
+    @abc.abstractmethod
+    def requeue(self, delivery: Delivery, err: Exception) -> int:
+        """Retry a failed message, or dead-letter it once its retries are spent. Returns a RESULT_* code."""
+
+    @abc.abstractmethod
+    def dead_letter(self, delivery: Delivery, err: Exception) -> int:
+        """Move a failed message to the DLQ, or drop it if the queue has none. Returns a RESULT_* code."""
+
+    @abc.abstractmethod
+    def queue_length(self, queue_name: str) -> int:
+        """Messages ready to be popped, over every priority level."""
+
+    @abc.abstractmethod
+    def queue_depth(self, queue_name: str) -> int:
+        """Messages counted against the queue's max_length: ready plus scheduled."""
+
+    @abc.abstractmethod
+    def dead_letter_count(self, queue_name: str) -> int:
+        """Messages in the queue's DLQ."""
+
+    @abc.abstractmethod
+    def iter_dead_letter_messages(self, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Dead letters of a queue, oldest first, filtered like `bizzmq.dlq.iter_dead_letter_messages`."""
+
+    @abc.abstractmethod
+    def redrive_dead_letter_messages(self, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None, limit: Optional[int] = None, batch_size: int = DEFAULT_REDRIVE_BATCH_SIZE) -> int:
+        """Move matching dead letters back to the queue they failed on. Returns how many moved."""
+
+    @abc.abstractmethod
+    def purge_dead_letter_messages(self, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None) -> int:
+        """Delete dead letters, all of them or the matching ones. Returns how many were deleted."""
+
+    def get_dead_letter_messages(self, queue_name: str, offset: int = 0, limit: int = 100, error: Optional[str] = None, original_queue: Optional[str] = None) -> List[Dict[str, Any]]:
+        """One page of dead letters, oldest first."""
+        if offset < 0 or limit < 0:
+            raise ValueError("offset and limit can't be negative")
+        return list(itertools.islice(self.iter_dead_letter_messages(queue_name, error, original_queue), offset, offset + limit))
+
+    def fail(self, delivery: Delivery, err: Exception) -> int:
+        """Handle a message whose callback raised `err`, according to its queue's options. Returns a RESULT_* code."""
+        options = self.get_queue_options(delivery.queue_name) or QueueOptions()
+        update_lifecycle_status(delivery.envelope, "failed")
+        if not options.config_dead_letter_queue:
+            logger.warning("Message failed on queue %s but no DLQ configured", delivery.queue_name)
+            metrics.count(metrics.MESSAGES_DISCARDED, delivery.queue_name)
+            self.ack(delivery)
+            return RESULT_DISCARDED
+        if options.max_retries > 0:
+            return self.requeue(delivery, err)
+        return self.dead_letter(delivery, err)
+
+    def close(self) -> None:
+        """Release whatever the backend holds. The default has nothing to release."""
+
+
+class _RedisQueueState:
+    # What a RedisBackend keeps per queue it pops from
+    __slots__ = ("options", "keys", "in_flight_keys", "pops", "next_promotion", "next_reap")
+
+    def __init__(self, options: QueueOptions, keys: List[str], in_flight_keys: Tuple[str, str]) -> None:
+        self.options = options
+        self.keys = keys
+        self.in_flight_keys = in_flight_keys
+        self.pops = 0
+        self.next_promotion = 0.0
+        self.next_reap = 0.0
+
+
+class RedisBackend(Backend):
+    """
+    Backend on a Redis client, using the same keys and scripts as the rest of BizzMQ.
+
+    Pops are reliable: a popped message is moved to this backend's processing list and
+    stays there until it's settled. Claims older than `visibility_timeout` are requeued
+    by the reaper of any reliable consumer of the queue, and by `pop` itself. `pop` also
+    promotes delayed messages and backed-off retries once they're due, so a loop of
+    `pop` calls needs no background threads. Stream queues aren't supported by `pop`,
+    consume them with `consume_message_from_queue`.
+    """
+
+    def __init__(self, redis_client: redis.Redis, consumer_id: Optional[str] = None, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT) -> None:
+        if visibility_timeout <= 0:
+            raise ValueError("visibility_timeout must be greater than 0")
+        self.redis_client = redis_client
+        self.consumer_id = consumer_id or _default_consumer_id()
+        self.visibility_timeout = visibility_timeout
+        self._queues: Dict[str, _RedisQueueState] = {}
+        self._lock = threading.Lock()
+
+    def create_queue(self, queue_name: str, options: Optional[QueueOptions] = None) -> None:
+        from .queue import create_queue
+        create_queue(self.redis_client, queue_name, options)
+        metadata_cache(self.redis_client).invalidate(queue_name)
+
+    def get_queue_options(self, queue_name: str) -> Optional[QueueOptions]:
+        return get_queue_options(self.redis_client, queue_name)
+
+    def push(self, queue_name: str, message: Any, options: Optional[MessageOptions] = None) -> str:
+        from .producer import publish_message_to_queue
+        return publish_message_to_queue(self.redis_client, queue_name, message, options)
+
+    def push_many(self, queue_name: str, messages: Iterable[Any], options: Optional[MessageOptions] = None, chunk_size: Optional[int] = None) -> List[str]:
+        from .producer import publish_messages_to_queue, DEFAULT_PUBLISH_CHUNK_SIZE
+        return publish_messages_to_queue(self.redis_client, queue_name, messages, options, chunk_size or DEFAULT_PUBLISH_CHUNK_SIZE)
+
+    def pop(self, queue_name: str, timeout: float) -> Optional[Delivery]:
+        state = self._state(queue_name)
+        processing_key, inflight_key = state.in_flight_keys
+        consumers_key = f"queue_consumers:{queue_name}"
+        deadline = time.monotonic() + timeout
+        idle_delay = 0.0
+        while True:
+            self._maintain(queue_name, state)
+            keys = state.keys
+            limit = state.options.starvation_limit
+            if len(keys) > 1 and limit > 0 and state.pops % limit == limit - 1:
+                keys = keys[::-1]
+
+            raw = run_script(self.redis_client, "claim_message", keys + [processing_key, inflight_key, consumers_key], [int(time.time() * 1000), self.consumer_id])
+            if raw is None:
+                remaining = deadline - time.monotonic()
+                if remaining < MIN_BLOCK_TIMEOUT:
+                    return None
+                # Never sleep past the next promotion, a delayed message may be due by then
+                wait = max(min(remaining, state.next_promotion - time.monotonic()), MIN_BLOCK_TIMEOUT)
+                if len(keys) == 1:
+                    # Heartbeat first, so reapers don't drop this consumer while it's blocked
+                    _register_consumer(self.redis_client, queue_name, self.consumer_id)
+                    raw = self.redis_client.blmove(keys[0], processing_key, min(wait, self.visibility_timeout / 2), src="RIGHT", dest="LEFT")
+                    if raw is None:
+                        continue
+                    _track_claimed(self.redis_client, processing_key, inflight_key, consumers_key, self.consumer_id, raw)
+                else:
+                    idle_delay = min(max(idle_delay * 2, PRIORITY_IDLE_MIN_DELAY), wait)
+                    time.sleep(idle_delay)
+                    continue
+
+            state.pops += 1
+            in_flight = _InFlight(processing_key, inflight_key, raw)
+            try:
+                envelope, data = _decode_message(raw, self.redis_client.get)
+            except ValueError as e:
+                logger.error("Failed to parse message from queue %s: %s", queue_name, e)
+                _settle_in_flight(self.redis_client, in_flight)
+                continue
+            return Delivery(queue_name, envelope.get("message_id"), envelope, data, in_flight)
+
+    def ack(self, delivery: Delivery) -> None:
+        # A message the reaper requeued meanwhile keeps its payload for the next delivery
+        if _settle_in_flight(self.redis_client, delivery.receipt):
+            _release_payloads(self.redis_client, [delivery.envelope])
+
+    def requeue(self, delivery: Delivery, err: Exception) -> int:
+        result = _run_retry(self.redis_client, delivery.queue_name, delivery.envelope, err, delivery.receipt)
+        state = self._queues.get(delivery.queue_name)
+        if result == RESULT_SCHEDULED and state is not None:
+            # The retry may be due before the next planned promotion, so the next pop checks again
+            state.next_promotion = 0.0
+        return result
+
+    def dead_letter(self, delivery: Delivery, err: Exception) -> int:
+        options = self.get_queue_options(delivery.queue_name) or QueueOptions()
+        keys, args = _dead_letter_script_call(delivery.queue_name, options, delivery.envelope, err, delivery.receipt)
+        result = int(run_script(self.redis_client, "dead_letter_message", keys, args))
+        _report_transition(delivery.queue_name, result, 0, 0, 0)
+        return result
+
+    def queue_length(self, queue_name: str) -> int:
+        options = self.get_queue_options(queue_name) or QueueOptions()
+        if options.storage == STORAGE_STREAM:
+            # Unacknowledged entries, not XLEN, which also counts acknowledged ones still in the stream
+            from .streams import stream_depths
+            return sum(stream_depths(self.redis_client, partition_queue_names(queue_name, options) or [queue_name]))
+        pipe = self.redis_client.pipeline(transaction=False)
+        for name in partition_queue_names(queue_name, options) or [queue_name]:
+            for key in priority_queue_keys(name, options.priority_levels):
+                pipe.llen(key)
+        return sum(pipe.execute())
+
+    def queue_depth(self, queue_name: str) -> int:
+        from .producer import queue_depth
+        return queue_depth(self.redis_client, queue_name)
+
+    def dead_letter_count(self, queue_name: str) -> int:
+        from .dlq import dead_letter_count
+        return dead_letter_count(self.redis_client, queue_name)
+
+    def iter_dead_letter_messages(self, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        from .dlq import iter_dead_letter_messages
+        return iter_dead_letter_messages(self.redis_client, queue_name, error, original_queue)
+
+    def get_dead_letter_messages(self, queue_name: str, offset: int = 0, limit: int = 100, error: Optional[str] = None, original_queue: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Unfiltered pages are a single LRANGE there
+        from .dlq import get_dead_letter_messages
+        return get_dead_letter_messages(self.redis_client, queue_name, offset, limit, error, original_queue)
+
+    def redrive_dead_letter_messages(self, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None, limit: Optional[int] = None, batch_size: int = DEFAULT_REDRIVE_BATCH_SIZE) -> int:
+        from .dlq import redrive_dead_letter_messages
+        return redrive_dead_letter_messages(self.redis_client, queue_name, error, original_queue, limit, batch_size)
+
+    def purge_dead_letter_messages(self, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None) -> int:
+        from .dlq import purge_dead_letter_messages
+        return purge_dead_letter_messages(self.redis_client, queue_name, error, original_queue)
+
+    def close(self) -> None:
+        # Unsettled messages keep this consumer registered, so a reaper can still recover them
+        with self._lock:
+            queue_names = list(self._queues)
+            self._queues.clear()
+        for queue_name in queue_names:
+            _unregister_consumer(self.redis_client, queue_name, self.consumer_id)
+
+    def _state(self, queue_name: str) -> _RedisQueueState:
+        state = self._queues.get(queue_name)
+        if state is not None:
+            return state
+        options = self.get_queue_options(queue_name) or QueueOptions()
+        if options.storage == STORAGE_STREAM:
+            raise ValueError(f"❌ Stream queue \"{queue_name}\" can't be popped from a backend, consume it with consume_message_from_queue")
+        if options.partitions:
+            raise ValueError(f"❌ Partitioned queue \"{queue_name}\" is popped one partition at a time, see cluster.partition_names")
+        preload_scripts(self.redis_client)
+        _register_consumer(self.redis_client, queue_name, self.consumer_id)
+        in_flight_keys = (f"queue_processing:{queue_name}:{self.consumer_id}", f"queue_inflight:{queue_name}:{self.consumer_id}")
+        state = _RedisQueueState(options, priority_queue_keys(queue_name, options.priority_levels), in_flight_keys)
+        with self._lock:
+            return self._queues.setdefault(queue_name, state)
+
+    def _maintain(self, queue_name: str, state: _RedisQueueState) -> None:
+        # Promotion and reaping piggyback on pops instead of running on their own threads
+        now = time.monotonic()
+        if now >= state.next_promotion:
+            moved, next_due = promote_due_messages(self.redis_client, queue_name, state.options.priority_levels)
+            state.next_promotion = now + next_poll_delay(moved, next_due)
+        if now >= state.next_reap:
+            reaped = _reap_expired_messages(self.redis_client, queue_name, self.visibility_timeout)
+            if reaped:
+                logger.info("Reaper requeued %d expired message(s) on queue %s", reaped, queue_name)
+            state.next_reap = now + max(self.visibility_timeout / 4, 0.1)
+
+
+def consume_with_backend(backend: Backend, queue_name: str, callback: Callable[[Any], None], block_timeout: float = DEFAULT_BLOCK_TIMEOUT, concurrency: int = 1, prefetch: int = 0) -> Tuple[Callable, Optional[Exception]]:
+    """
+    Start consuming `queue_name` from any backend.
+
+    Messages are popped one at a time into `concurrency + prefetch` slots and handled on
+    `concurrency` threads. A message is acked once its callback returns and goes through
+    `Backend.fail` when it raises. Returns a cleanup function and an error, like
+    `consume_message_from_queue`.
+    """
+    if not queue_name:
+        return None, Exception("❌ Queue name not provided")
+    if block_timeout <= 0:
+        return None, Exception("❌ block_timeout must be greater than 0")
+    if concurrency < 1:
+        return None, Exception("❌ concurrency must be at least 1")
+    if prefetch < 0:
+        return None, Exception("❌ prefetch can't be negative")
+    try:
+        if backend.get_queue_options(queue_name) is None:
+            return None, Exception(f"❌ Queue \"{queue_name}\" does not exist. Create it first")
+    except Exception as e:
+        return None, Exception(f"Failed to get queue options: {str(e)}")
+
+    should_stop = threading.Event()
+
+    def handle(delivery: Delivery) -> None:
+        started = _callback_started(queue_name, (delivery.envelope,))
+        try:
+            callback(delivery.data)
+        except Exception as err:
+            _callback_finished(queue_name, started, failed=1)
+            logger.warning("Error processing message from queue %s: %s", queue_name, err)
+            try:
+                backend.fail(delivery, err)
+            except Exception as e:
+                logger.error("Failed to requeue message on queue %s: %s", queue_name, e)
+            return
+        _callback_finished(queue_name, started, processed=1)
+        try:
+            backend.ack(delivery)
+        except Exception as e:
+            logger.error("Error acknowledging message on queue %s: %s", queue_name, e)
+
+    slots = threading.BoundedSemaphore(concurrency + prefetch)
+    thread_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"bizzmq-worker-{queue_name}") if concurrency > 1 else None
+
+    def run_job(delivery: Delivery) -> None:
+        try:
+            handle(delivery)
+        finally:
+            slots.release()
+
+    def worker_thread():
+        while not should_stop.is_set():
+            if not slots.acquire(timeout=block_timeout):
+                continue
+            try:
+                delivery = backend.pop(queue_name, block_timeout)
+            except Exception as e:
+                slots.release()
+                logger.error("Error popping message from queue %s: %s", queue_name, e)
+                should_stop.wait(block_timeout)
+                continue
+
+            if delivery is None:
+                slots.release()
+            elif thread_pool is None:
+                run_job(delivery)
+            else:
+                thread_pool.submit(run_job, delivery)
+
+    worker = threading.Thread(target=worker_thread, name=f"bizzmq-consumer-{queue_name}")
+    worker.daemon = True
+    worker.start()
+
+    def cleanup():
+        should_stop.set()
+        if threading.current_thread() is not worker:
+            worker.join(block_timeout + 1)
+        in_worker = threading.current_thread().name.startswith(f"bizzmq-worker-{queue_name}")
+        if thread_pool is not None:
+            thread_pool.shutdown(wait=not in_worker)
+
+    return cleanup, None
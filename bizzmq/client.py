@@ -3,33 +3,130 @@ Main BizzMQ client module providing the primary interface to the message queue s
 """
 
 from .redis_client import RedisClient
+from .backend import Backend, RedisBackend, consume_with_backend
+from .cluster import hash_tag
+from .metadata import DEFAULT_METADATA_TTL, QueueMetadataCache, set_metadata_cache
 from .queue import QueueOptions
 from .message import MessageOptions
-from typing import Optional, Any, Dict, Union, Callable, Tuple
+from typing import Optional, Any, Dict, Union, Callable, Tuple, Iterable, List
 
 class BizzMQ:
-    def __init__(self, redis_url:str)->None:
+    def __init__(self, redis_url:Optional[str] = None, metadata_ttl:float = DEFAULT_METADATA_TTL, validate_metadata_version:bool = False, watch_metadata:bool = False, max_connections:Optional[int] = None, backend:Optional[Backend] = None, socket_keepalive:bool = False, socket_connect_timeout:Optional[float] = None, health_check_interval:int = 0, cluster:bool = False)->None:
+        self.redis = None
+        self.redisInstance = None
+        self._stop_metadata_watch = None
+        # On Redis Cluster every queue name gets a hash tag, so all keys of a queue share a slot
+        self.cluster = cluster
+        if backend is not None:
+            # e.g. MemoryBackend(), which runs the queues in this process without Redis
+            self.backend = backend
+            return
         if not redis_url:
             raise ValueError("Redis URL is required")
+        if cluster and watch_metadata:
+            # Keyspace notifications are only published by the node that owns the key
+            raise ValueError("watch_metadata isn't supported on Redis Cluster")
         
-        self.redis = RedisClient(redis_url)
+        self.redis = RedisClient(redis_url, max_connections, socket_keepalive, socket_connect_timeout, health_check_interval, cluster)
         self.redisInstance = self.redis.get_redis_client()
+
+        # Queue options are cached per client, see metadata.py
+        self.metadata = QueueMetadataCache(metadata_ttl, validate_metadata_version)
+        set_metadata_cache(self.redisInstance, self.metadata)
+        self._stop_metadata_watch = self.metadata.watch_keyspace(self.redisInstance) if watch_metadata else None
+        self.backend = RedisBackend(self.redisInstance)
     
     def close(self) -> None:
+        if getattr(self, '_stop_metadata_watch', None):
+            self._stop_metadata_watch()
+            self._stop_metadata_watch = None
+        if getattr(self, 'backend', None):
+            self.backend.close()
         if hasattr(self, 'redis') and self.redis:
             self.redis.close()
     
     def create_queue(self, queue_name:str, options:Optional[QueueOptions] = None) -> None:
-        from .queue import create_queue
-        return create_queue(self.redisInstance, queue_name, options)
+        self.backend.create_queue(self._name(queue_name), options)
+
+    def invalidate_queue_metadata(self, queue_name:Optional[str] = None) -> None:
+        """Drop cached options of one queue (or all queues) after changing queue_meta outside this client."""
+        self._require_redis("invalidate_queue_metadata")
+        self.metadata.invalidate(self._name(queue_name))
 
     def publish_message_to_queue(self, queue_name:str, message:Any, message_options:Optional[MessageOptions] = None) -> None:
-        from .producer import publish_message_to_queue
-        return publish_message_to_queue(self.redisInstance, queue_name, message, message_options)
+        return self.backend.push(self._name(queue_name), message, message_options)
+
+    def publish_messages_to_queue(self, queue_name:str, messages:Iterable[Any], message_options:Optional[MessageOptions] = None, chunk_size:Optional[int] = None) -> List[str]:
+        return self.backend.push_many(self._name(queue_name), messages, message_options, chunk_size)
+
+    def queue_length(self, queue_name:str) -> int:
+        """Messages waiting to be consumed, over every priority level."""
+        return self.backend.queue_length(self._name(queue_name))
+
+    def queue_depth(self, queue_name:str) -> int:
+        """Ready plus scheduled messages, the count max_length caps. One round trip, cheap enough to poll before publishing."""
+        return self.backend.queue_depth(self._name(queue_name))
     
-    def consume_message_from_queue(self, queue_name :str , callback:Callable[[Dict[str, Any]], None]) -> None:
-        from .consumer import consume_message_from_queue
-        return consume_message_from_queue(self.redisInstance, queue_name, callback)
+    def consume_message_from_queue(self, queue_name :str , callback:Callable[[Dict[str, Any]], None], block_timeout:Optional[float] = None, reliable:bool = False, visibility_timeout:Optional[float] = None, consumer_id:Optional[str] = None, concurrency:int = 1, prefetch:int = 0, executor:str = "thread", batch_size:Optional[int] = None, max_wait_ms:Optional[float] = None) -> None:
+        from .consumer import consume_message_from_queue, DEFAULT_BATCH_MAX_WAIT_MS, DEFAULT_BLOCK_TIMEOUT, DEFAULT_VISIBILITY_TIMEOUT
+        queue_name = self._name(queue_name)
+        if not isinstance(self.backend, RedisBackend):
+            # Other backends settle every message they hand out, so there's no separate reliable mode
+            if executor != "thread" or batch_size is not None:
+                return None, Exception("❌ executor=\"process\" and batch_size need the Redis backend")
+            return consume_with_backend(self.backend, queue_name, callback, block_timeout or DEFAULT_BLOCK_TIMEOUT, concurrency, prefetch)
+        return consume_message_from_queue(
+            self.redisInstance, queue_name, callback,
+            block_timeout=block_timeout or DEFAULT_BLOCK_TIMEOUT,
+            reliable=reliable,
+            visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT if visibility_timeout is None else visibility_timeout,
+            consumer_id=consumer_id,
+            concurrency=concurrency,
+            prefetch=prefetch,
+            executor=executor,
+            batch_size=batch_size,
+            max_wait_ms=DEFAULT_BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms,
+        )
     
-    # TOBEDONE - GET DEAD LETTER QUEUE MESSAGES , RETRY DLQ MESSAGE
+    def consume_from_queues(self, handlers:Dict[str, Callable[[Dict[str, Any]], None]], weights:Optional[Dict[str, float]] = None, block_timeout:Optional[float] = None, concurrency:int = 1, prefetch:int = 0, executor:str = "thread") -> None:
+        from .consumer import DEFAULT_BLOCK_TIMEOUT
+        from .multi_consumer import consume_from_queues
+        self._require_redis("consume_from_queues")
+        return consume_from_queues(
+            self.redisInstance, {self._name(q): handler for q, handler in handlers.items()},
+            weights=weights and {self._name(q): weight for q, weight in weights.items()},
+            block_timeout=block_timeout or DEFAULT_BLOCK_TIMEOUT,
+            concurrency=concurrency,
+            prefetch=prefetch,
+            executor=executor,
+        )
     
+    def start_depth_sampler(self, queue_names:Iterable[str], interval:Optional[float] = None) -> Callable[[], None]:
+        """Report queue, scheduled and DLQ depths of `queue_names` to the metrics sinks every `interval` seconds. Returns a stop function."""
+        from .metrics import DepthSampler, DEFAULT_SAMPLE_INTERVAL
+        self._require_redis("start_depth_sampler")
+        return DepthSampler(self.redisInstance, [self._name(q) for q in queue_names], interval or DEFAULT_SAMPLE_INTERVAL).start()
+
+    def dead_letter_count(self, queue_name:str) -> int:
+        return self.backend.dead_letter_count(self._name(queue_name))
+
+    def get_dead_letter_messages(self, queue_name:str, offset:int = 0, limit:int = 100, error:Optional[str] = None, original_queue:Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.backend.get_dead_letter_messages(self._name(queue_name), offset, limit, error, self._name(original_queue))
+
+    def iter_dead_letter_messages(self, queue_name:str, error:Optional[str] = None, original_queue:Optional[str] = None) -> Iterable[Dict[str, Any]]:
+        return self.backend.iter_dead_letter_messages(self._name(queue_name), error, self._name(original_queue))
+
+    def redrive_dead_letter_messages(self, queue_name:str, error:Optional[str] = None, original_queue:Optional[str] = None, limit:Optional[int] = None, batch_size:Optional[int] = None) -> int:
+        from .dlq import DEFAULT_REDRIVE_BATCH_SIZE
+        return self.backend.redrive_dead_letter_messages(self._name(queue_name), error, self._name(original_queue), limit, batch_size or DEFAULT_REDRIVE_BATCH_SIZE)
+
+    def purge_dead_letter_messages(self, queue_name:str, error:Optional[str] = None, original_queue:Optional[str] = None) -> int:
+        return self.backend.purge_dead_letter_messages(self._name(queue_name), error, self._name(original_queue))
+
+    def _name(self, queue_name:Optional[str]) -> Optional[str]:
+        # Names that already carry a hash tag are kept, so related queues can share a slot on purpose
+        return hash_tag(queue_name) if self.cluster and queue_name else queue_name
+
+    def _require_redis(self, method:str) -> None:
+        if self.redisInstance is None:
+            raise ValueError(f"❌ {method} needs the Redis backend")
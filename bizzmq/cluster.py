@@ -0,0 +1,86 @@
+"""
+Scaling queues past a single Redis node.
+
+Every key of a queue (ready lists, meta, scheduled set, processing lists, DLQ,
+payloads, dedup keys) embeds the queue name. A name with a Redis Cluster hash tag,
+such as `{orders}`, therefore keeps all of a queue's keys on one slot, which the
+multi-key scripts need. `hash_tag` adds one, and `BizzMQ(cluster=True)` applies it
+to every queue name.
+
+A partitioned queue (`QueueOptions(partitions=N)`) spreads one logical queue over N
+physical queues, its partitions, each with its own lists, DLQ and consumers. Every
+partition gets its own hash tag, so on a cluster they land on different slots and
+usually on different nodes. Producers route each message by its partition key, or
+round-robin when it has none.
+"""
+import itertools
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+
+import redis
+
+# Separates a partitioned queue's name from the partition index, e.g. "orders#3"
+PARTITION_SEPARATOR = "#"
+
+# Round-robin position per partitioned queue, shared by every producer in the process
+_round_robin: Dict[str, Iterator[int]] = {}
+
+
+def _tag_of(queue_name: str) -> Optional[str]:
+    # Redis hashes only what's between the first "{" and the next "}", if that's not empty
+    start = queue_name.find("{")
+    if start < 0:
+        return None
+    end = queue_name.find("}", start + 1)
+    if end <= start + 1:
+        return None
+    return queue_name[start + 1:end]
+
+
+def hash_tag(queue_name: str) -> str:
+    """`queue_name` wrapped in a hash tag, unless it already has one."""
+    if _tag_of(queue_name) is not None:
+        return queue_name
+    return f"{{{queue_name}}}"
+
+
+def partition_name(queue_name: str, index: int) -> str:
+    """Name of partition `index` of a partitioned queue."""
+    tag = _tag_of(queue_name)
+    if tag is None:
+        return f"{queue_name}{PARTITION_SEPARATOR}{index}"
+    # The index goes inside the tag, so partitions spread over the cluster instead of sharing a slot
+    start = queue_name.find("{")
+    return f"{queue_name[:start]}{{{tag}{PARTITION_SEPARATOR}{index}}}{queue_name[start + len(tag) + 2:]}"
+
+
+def partition_names(queue_name: str, partitions: int) -> List[str]:
+    """Names of every partition of a queue, or just the queue itself if it isn't partitioned."""
+    if partitions <= 0:
+        return [queue_name]
+    return [partition_name(queue_name, index) for index in range(partitions)]
+
+
+def route_partition(queue_name: str, partitions: int, key: Optional[str] = None) -> int:
+    """
+    Partition a message goes to.
+
+    Messages with the same key always go to the same partition, which keeps their
+    order. CRC32 is used rather than hash() so every process agrees. Messages without
+    a key are spread round-robin.
+    """
+    if key is not None:
+        return zlib.crc32(str(key).encode("utf-8")) % partitions
+    counter = _round_robin.get(queue_name)
+    if counter is None:
+        counter = _round_robin.setdefault(queue_name, itertools.count())
+    # next() on itertools.count is atomic under the GIL, so producer threads can share it
+    return next(counter) % partitions
+
+
+def is_cluster(redis_client: Any) -> bool:
+    return isinstance(redis_client, redis.cluster.RedisCluster)
+
+
+def key_slot(key: str) -> int:
+    return redis.crc.key_slot(key.encode("utf-8"))
@@ -0,0 +1,160 @@
+"""
+Serialization codecs for message envelopes.
+
+A queue picks its codec with `QueueOptions(codec=...)`. JSON envelopes are written
+as plain JSON, exactly like older versions, so `json` and `orjson` are wire
+compatible. Binary codecs prefix the envelope with a two-byte tag (0xC1 followed by
+the codec ID). 0xC1 is never a valid first byte of JSON, UTF-8 text or msgpack, so
+consumers detect the codec from the data itself and keep working while producers
+of a queue are on different versions or settings.
+
+orjson and msgpack are optional: `pip install orjson` / `pip install msgpack`.
+"""
+import json
+import re
+from typing import Any, Dict, Union
+
+# First byte of every tagged envelope
+TAG_MARKER = b"\xc1"
+
+# orjson reads integers outside the 64-bit range as floats. Any run of 19 digits
+# could be one, so such data is read by the stdlib instead.
+_LONG_NUMBER = re.compile(rb"\d{19}")
+_LONG_NUMBER_TEXT = re.compile(r"\d{19}")
+
+
+class Codec:
+    """Encodes envelope dicts to bytes (or str) and back."""
+
+    # Name used in QueueOptions(codec=...)
+    name = ""
+    # Empty for plain JSON, TAG_MARKER + one ID byte otherwise
+    tag = b""
+    # Whether envelopes can hold raw bytes, text codecs get them base64 encoded
+    binary = False
+
+    def encode(self, envelope: Dict[str, Any]) -> Union[bytes, str]:
+        raise NotImplementedError
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    name = "json"
+
+    def encode(self, envelope: Dict[str, Any]) -> str:
+        return json.dumps(envelope, separators=(",", ":"))
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    """
+    JSON through orjson, several times faster than the stdlib and wire compatible with it.
+
+    Whatever orjson can't read exactly (NaN, Infinity, integers beyond 64 bits, all
+    valid for the stdlib) is decoded with `json.loads`, so both read the same values.
+    """
+
+    name = "orjson"
+
+    def __init__(self) -> None:
+        try:
+            import orjson
+        except ImportError as e:
+            raise ImportError("The orjson codec needs the orjson package: pip install orjson") from e
+        self._orjson = orjson
+
+    def encode(self, envelope: Dict[str, Any]) -> bytes:
+        return self._orjson.dumps(envelope)
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        long_number = _LONG_NUMBER if isinstance(data, (bytes, bytearray)) else _LONG_NUMBER_TEXT
+        if long_number.search(data) is None:
+            try:
+                return self._orjson.loads(data)
+            except self._orjson.JSONDecodeError:
+                pass
+        return json.loads(data)
+
+
+class MsgpackCodec(Codec):
+    """Compact binary envelopes, smaller than JSON and cheap to pack."""
+
+    name = "msgpack"
+    tag = TAG_MARKER + b"m"
+    binary = True
+
+    def __init__(self) -> None:
+        try:
+            import msgpack
+        except ImportError as e:
+            raise ImportError("The msgpack codec needs the msgpack package: pip install msgpack") from e
+        self._msgpack = msgpack
+
+    def encode(self, envelope: Dict[str, Any]) -> bytes:
+        return self.tag + self._msgpack.packb(envelope, use_bin_type=True)
+
+    def decode(self, data: Union[bytes, str]) -> Any:
+        return self._msgpack.unpackb(memoryview(data)[len(self.tag):], raw=False)
+
+
+_codec_types = {codec.name: codec for codec in (JsonCodec, OrjsonCodec, MsgpackCodec)}
+_codecs: Dict[str, Codec] = {}
+
+
+def register_codec(codec_type: type) -> None:
+    """Make a Codec subclass available by its name. Tagged codecs need a unique tag."""
+    if codec_type.tag and any(c.tag == codec_type.tag and c.name != codec_type.name for c in _codec_types.values()):
+        raise ValueError(f"Codec tag {codec_type.tag!r} is already taken")
+    _codec_types[codec_type.name] = codec_type
+    _codecs.pop(codec_type.name, None)
+
+
+def get_codec(name: str) -> Codec:
+    """The shared instance of the codec called `name`."""
+    codec = _codecs.get(name)
+    if codec is None:
+        codec_type = _codec_types.get(name)
+        if codec_type is None:
+            raise ValueError(f"Unknown codec \"{name}\", expected one of {', '.join(sorted(_codec_types))}")
+        codec = _codecs[name] = codec_type()
+    return codec
+
+
+def _json_decoder() -> Codec:
+    # Untagged envelopes are JSON, read them with orjson when it's installed (it falls back
+    # to the stdlib for anything it would read differently)
+    try:
+        return get_codec(OrjsonCodec.name)
+    except ImportError:
+        return get_codec(JsonCodec.name)
+
+
+def decode_envelope(data: Union[bytes, str]) -> Dict[str, Any]:
+    """Decode an envelope written by any codec. Raises ValueError if it can't be read."""
+    envelope = decode_value(data)
+    if not isinstance(envelope, dict):
+        raise ValueError(f"Message envelope must be a map, got {type(envelope).__name__}")
+    return envelope
+
+
+def decode_value(data: Union[bytes, str]) -> Any:
+    """Decode anything written by a codec, picking the codec from its tag."""
+    if isinstance(data, (bytes, bytearray)) and data[:1] == TAG_MARKER:
+        tag = bytes(data[:2])
+        codec_type = next((c for c in _codec_types.values() if c.tag == tag), None)
+        if codec_type is None:
+            raise ValueError(f"Unknown codec tag {tag!r}")
+        codec = get_codec(codec_type.name)
+    else:
+        codec = _json_decoder()
+
+    try:
+        return codec.decode(data)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Failed to decode {codec.name} data: {str(e)}") from e
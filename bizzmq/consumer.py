@@ -1,236 +1,1003 @@
+import logging
 import redis
 import time
-from .message import Message, update_lifecycle_status
-from .producer import publish_message_to_queue
-from typing import Any, Dict, Optional, Callable, Tuple
-import json
+from .codecs import decode_envelope, get_codec
+from . import metrics
+from .message import update_lifecycle_status
+from .payloads import PAYLOAD_REF_FIELD, LazyPayload, has_packed_payload
+from .metadata import get_queue_options
+from .queue import STORAGE_STREAM, QueueOptions, partition_queue_names, priority_queue_keys, queue_key
+from .scheduler import SCHEDULER_POLL_INTERVAL, next_poll_delay, promote_due_messages, scheduled_key
+from .scripts import (
+    RESULT_ALREADY_SETTLED,
+    RESULT_DEAD_LETTERED,
+    RESULT_DISCARDED,
+    RESULT_REQUEUED,
+    RESULT_SCHEDULED,
+    SETTLE_ACK,
+    SETTLE_CLAIM,
+    SETTLE_NONE,
+    preload_scripts,
+    run_script,
+)
+from .streams import (
+    DEFAULT_CONSUMER_GROUP,
+    ack_stream_message,
+    claim_stalled_messages,
+    ensure_consumer_group,
+    promote_due_stream_messages,
+    read_stream_messages,
+    stream_key,
+)
+from typing import Any, Dict, List, NamedTuple, Optional, Callable, Tuple
+import functools
+import os
+import pickle
+import socket
 import threading
 import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-def consume_message_from_queue(redis_client: redis.Redis, queue_name: str, callback:Callable[[Dict[str, Any]], None]) -> Tuple[Callable, Optional[Exception]]:
+logger = logging.getLogger(__name__)
+
+# Default number of seconds a blocking pop waits before re-checking the stop flag
+DEFAULT_BLOCK_TIMEOUT = 1.0
+# Default number of seconds a message may stay in flight before the reaper requeues it
+DEFAULT_VISIBILITY_TIMEOUT = 30.0
+# Number of in-flight entries the reaper reads per round trip
+REAPER_BATCH_SIZE = 500
+# Shortest wait between empty polls of a priority queue in reliable mode
+PRIORITY_IDLE_MIN_DELAY = 0.005
+# Default number of milliseconds a batch consumer waits to fill a batch
+DEFAULT_BATCH_MAX_WAIT_MS = 100
+# Shortest blocking pop the consumer issues, Redis treats a timeout of 0 as "forever"
+MIN_BLOCK_TIMEOUT = 0.001
+
+
+def consume_message_from_queue(redis_client: redis.Redis, queue_name: str, callback:Callable[[Dict[str, Any]], None], block_timeout: float = DEFAULT_BLOCK_TIMEOUT, reliable: bool = False, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT, consumer_id: Optional[str] = None, concurrency: int = 1, prefetch: int = 0, executor: str = "thread", batch_size: Optional[int] = None, max_wait_ms: float = DEFAULT_BATCH_MAX_WAIT_MS) -> Tuple[Callable, Optional[Exception]]:
+    """
+    Start consuming messages from a queue on a background thread.
+
+    The worker waits on the queue with BRPOP, so a message is handed to the callback
+    as soon as it's pushed and no CPU is spent while the queue is idle. `block_timeout`
+    bounds how long a single BRPOP waits, which is also the upper bound on how long
+    `cleanup()` takes to stop the worker. Sub-second timeouts need Redis 6 or newer.
+
+    With `reliable=True` messages are delivered at least once: each message is moved
+    atomically with BLMOVE into a processing list owned by this consumer and removed
+    only once the callback has finished. A reaper thread requeues messages that stay
+    in flight longer than `visibility_timeout` seconds, e.g. because a worker crashed.
+
+    With `concurrency` above 1 callbacks run on a thread pool of that size. The fetch
+    loop keeps at most `concurrency + prefetch` messages popped but unfinished, and
+    stops popping once that limit is reached until a worker frees up.
+
+    With `executor="process"` callbacks run in a ProcessPoolExecutor of `concurrency`
+    processes for CPU-bound work. Fetching, acknowledgements and retry/DLQ handling
+    stay in this process. The callback must be picklable (a module-level function),
+    and its exceptions come back as `RemoteCallbackError`.
+
+    With `batch_size` set the callback receives a list of up to `batch_size` messages.
+    Messages that are already queued are popped in one round trip (RPOP with a count,
+    LMPOP for priority queues), and the consumer waits at most `max_wait_ms` to fill a
+    batch once its first message arrived. Raising fails the whole batch. To fail only
+    some messages, return a dict mapping their index in the list to an exception (or
+    error message); only those go through requeue/DLQ handling. Each batch holds one
+    of the `concurrency + prefetch` slots.
+
+    Every consumer also promotes the queue's delayed messages and backed-off retries
+    from its scheduled set once they're due.
+
+    Queues created with `storage="stream"` are read through a consumer group instead:
+    each fetch takes as many entries as there are free slots with XREADGROUP, entries
+    are acknowledged with XACK, and entries left pending for `visibility_timeout`
+    seconds are taken over with XAUTOCLAIM and retried. Delivery is always at least
+    once, so `reliable` has no effect and `consumer_id` names the group consumer.
+    """
     if not queue_name:
         return None, Exception("❌ Queue name not provided")
+    if block_timeout <= 0:
+        return None, Exception("❌ block_timeout must be greater than 0")
+    if reliable and visibility_timeout <= 0:
+        return None, Exception("❌ visibility_timeout must be greater than 0")
+    if executor not in ("thread", "process"):
+        return None, Exception(f"❌ Unknown executor \"{executor}\", expected \"thread\" or \"process\"")
+    if concurrency < 1:
+        return None, Exception("❌ concurrency must be at least 1")
+    if prefetch < 0:
+        return None, Exception("❌ prefetch can't be negative")
+    if batch_size is not None and batch_size < 1:
+        return None, Exception("❌ batch_size must be at least 1")
+    if max_wait_ms < 0:
+        return None, Exception("❌ max_wait_ms can't be negative")
     
-    queue_key = f"queue:{queue_name}"
-    queue_meta_key = f"queue_meta:{queue_name}"
-
-    # Redis client for pub sub operations
-    subscriber = redis_client.client()
-
     try:
-        # Fetching the queue options, it's important to check differnet configs like dlq etc
-        queue_options_map = redis_client.hgetall(queue_meta_key)
+        # Fetching the queue options, it's important to check differnet configs like dlq etc.
+        # Queues without metadata (e.g. a DLQ nobody created) are consumed with the defaults.
+        queue_options = get_queue_options(redis_client, queue_name) or QueueOptions()
     except Exception as e:
         return None, Exception(f"Failed to get queue options: {str(e)}")
+    if queue_options.partitions:
+        # One consumer per partition, so every partition is drained at the same pace
+        return _consume_partitions(
+            redis_client, queue_name, queue_options, callback,
+            block_timeout=block_timeout, reliable=reliable, visibility_timeout=visibility_timeout, consumer_id=consumer_id,
+            concurrency=concurrency, prefetch=prefetch, executor=executor, batch_size=batch_size, max_wait_ms=max_wait_ms,
+        )
     
-    use_dead_letter_queue = queue_options_map.get("config_dead_letter_queue") == "1" or  queue_options_map.get("config_dead_letter_queue") == 1
-    max_retries = 3 
-
-    if "maxRetries" in queue_options_map:
-        try:
-            # Dynamically set the maxRetries in case it's configured in queue options, else default value 3
-            max_retries = int(queue_options_map["maxRetries"])
-        except ValueError:
-            pass
+    use_dead_letter_queue = queue_options.config_dead_letter_queue
+    max_retries = queue_options.max_retries
+    priority_levels = queue_options.priority_levels
+    starvation_limit = queue_options.starvation_limit
+    use_stream = queue_options.storage == STORAGE_STREAM
+    if use_stream:
+        if visibility_timeout <= 0:
+            return None, Exception("❌ visibility_timeout must be greater than 0")
+        # Pending entries of the consumer group already give at-least-once delivery
+        reliable = False
+    # Lists to pop from, most urgent first. A plain queue has exactly one.
+    queue_keys = priority_queue_keys(queue_name, priority_levels)
 
     # flag to control consumer threads
     should_stop = threading.Event()
 
+    invoke_callback = callback
+    process_pool = None
+    if executor == "process":
+        try:
+            # Fail fast on lambdas, closures and bound methods of unpicklable objects
+            pickle.dumps(callback)
+        except Exception as e:
+            return None, Exception(f"❌ executor=\"process\" needs a picklable callback such as a module-level function: {str(e)}")
+
+        process_pool = _ProcessPool(concurrency)
+        invoke_callback = functools.partial(process_pool.run, callback)
+
+    def settle_message(raw: Any) -> bool:
+        # In reliable mode every outcome also settles the copy in our processing list. False when
+        # the message was already requeued or reclaimed, so another delivery of it is on its way.
+        if use_stream:
+            return _ack_stream_entry(redis_client, queue_name, raw) == 1
+        if reliable:
+            return _settle_in_flight(redis_client, _InFlight(processing_key, inflight_key, raw))
+        return True
+
+    # Set when this consumer schedules a retry, which may be due before the scheduler's next pass
+    wake_scheduler = threading.Event()
+
+    def fail_message(message_obj: Dict[str, Any], err: Exception, raw: Any) -> None:
+        # LifeCycle Update
+        message_obj = update_lifecycle_status(message_obj, "failed")
+        in_flight = _InFlight(processing_key, inflight_key, raw) if reliable else None
+        if use_stream:
+            # One script acks the entry and retries, dead-letters or drops it
+            _fail_stream_message(redis_client, queue_name, message_obj, err, raw)
+        elif use_dead_letter_queue:
+            if max_retries > 0:
+                move_err = _requeue_message(redis_client, queue_name, message_obj, err, in_flight)
+            else:
+                move_err = _move_message_to_dlq(redis_client, queue_name, message_obj, err, in_flight)
+            if move_err:
+                _report_failed_move(queue_name, move_err, reliable)
+        else:
+            logger.warning("Message failed on queue %s but no DLQ configured", queue_name)
+            metrics.count(metrics.MESSAGES_DISCARDED, queue_name)
+            _settle_in_flight(redis_client, in_flight)
+        if queue_options.retry is not None:
+            wake_scheduler.set()
+
     # function to process the jobs/messages using the message string
-    def process_job(message_str: str) -> Optional[Exception]:
-        if not message_str:
+    def process_job(data: Any, raw: Any = None) -> Optional[Exception]:
+        if not data:
             return None
-        
+
         try:
-            message_obj = json.loads(message_str)
-            # LifeCycle Update
-            message_obj = update_lifecycle_status(message_obj, "processing")
+            message_obj, message_data = _decode_message(data, redis_client.get)
+        except ValueError as e:
+            logger.error("Failed to parse message from queue %s: %s", queue_name, e)
+            settle_message(raw)
+            return e
 
-            if isinstance(message_obj.get("message"), dict):
-                message_data = message_obj["message"]
+        started = _callback_started(queue_name, (message_obj,))
+        try:
+            invoke_callback(message_data)
+            _callback_finished(queue_name, started, processed=1)
+            # Successful envelopes are dropped, so their lifecycle fields aren't rewritten. A copy
+            # that's being redelivered still needs the payload, it expires with its TTL then.
+            if settle_message(raw):
+                _release_payloads(redis_client, [message_obj])
+            return None
+        except Exception as err:
+            _callback_finished(queue_name, started, failed=1)
+            fail_message(message_obj, err, raw)
+            return err
+
+    def process_batch(messages: list) -> None:
+        decoded = []
+        for data, raw in messages:
+            try:
+                message_obj, message_data = _decode_message(data, redis_client.get)
+            except ValueError as e:
+                logger.error("Failed to parse message from queue %s: %s", queue_name, e)
+                settle_message(raw)
+                continue
+            decoded.append((message_obj, message_data, raw))
+        if not decoded:
+            return
+
+        started = _callback_started(queue_name, [message_obj for message_obj, _, _ in decoded])
+        try:
+            failures = _batch_failures(invoke_callback([message_data for _, message_data, _ in decoded]), len(decoded))
+        except Exception as err:
+            # The whole batch failed, so every message goes through retry/DLQ handling
+            failures = {index: err for index in range(len(decoded))}
+        _callback_finished(queue_name, started, processed=len(decoded) - len(failures), failed=len(failures))
+
+        succeeded = []
+        succeeded_envelopes = []
+        for index, (message_obj, _, raw) in enumerate(decoded):
+            err = failures.get(index)
+            if err is None:
+                succeeded.append(raw)
+                succeeded_envelopes.append(message_obj)
+            else:
+                logger.warning("Error processing message from queue %s: %s", queue_name, err)
+                fail_message(message_obj, err, raw)
+
+        # Successes are acknowledged together, in one round trip. Payloads are only released
+        # for messages this ack settled, redelivered copies still need theirs.
+        if use_stream:
+            # XACK only counts the entries it settled, so a partial count keeps every payload
+            if _ack_stream_entry(redis_client, queue_name, *succeeded) < len(succeeded):
+                succeeded_envelopes = []
+        elif reliable:
+            settled = _settle_in_flight_many(redis_client, [_InFlight(processing_key, inflight_key, raw) for raw in succeeded])
+            succeeded_envelopes = [envelope for envelope, was_settled in zip(succeeded_envelopes, settled) if was_settled]
+        _release_payloads(redis_client, succeeded_envelopes)
+
+    try:
+        # Load every transition script now so the hot path never pays for a NOSCRIPT miss
+        preload_scripts(redis_client)
+    except Exception as e:
+        return None, Exception(f"Failed to load queue scripts: {str(e)}")
+
+    processing_key = inflight_key = consumers_key = None
+    if reliable:
+        consumer_id = consumer_id or _default_consumer_id()
+        processing_key = f"queue_processing:{queue_name}:{consumer_id}"
+        inflight_key = f"queue_inflight:{queue_name}:{consumer_id}"
+        consumers_key = f"queue_consumers:{queue_name}"
+        try:
+            _register_consumer(redis_client, queue_name, consumer_id)
+        except Exception as e:
+            return None, Exception(f"Failed to register consumer: {str(e)}")
+    elif use_stream:
+        consumer_id = consumer_id or _default_consumer_id()
+        try:
+            ensure_consumer_group(redis_client, queue_name)
+        except Exception as e:
+            return None, Exception(f"Failed to create consumer group: {str(e)}")
+
+    pops = 0
+    idle_delay = 0.0
+
+    def pop_order() -> list:
+        # Anti-starvation: every `starvation_limit`-th pop tries the lowest level first,
+        # so low-priority work keeps a guaranteed share while urgent work is queued
+        if len(queue_keys) > 1 and starvation_limit > 0 and pops % starvation_limit == starvation_limit - 1:
+            return queue_keys[::-1]
+        return queue_keys
+
+    def pop_messages(count: int, timeout: float) -> list:
+        if use_stream:
+            # Entries come back as (entry ID, message) pairs
+            return read_stream_messages(redis_client, queue_name, consumer_id, count, timeout)
+        if count > 1:
+            messages = pop_available(count)
+            if messages:
+                return messages
+        message = pop_message(timeout)
+        return [] if message is None else [message]
+
+    def pop_available(count: int) -> list:
+        # Takes up to `count` messages that are already queued, without blocking
+        nonlocal pops
+        keys = pop_order()
+        if reliable:
+            messages = run_script(redis_client, "claim_messages", keys + [processing_key, inflight_key, consumers_key], [int(time.time() * 1000), consumer_id, count])
+        elif len(keys) == 1:
+            # RPOP with a count (Redis 6.2+) takes the whole batch in one round trip
+            messages = redis_client.rpop(keys[0], count)
+        else:
+            # LMPOP (Redis 7+) does the same across every priority level, most urgent first
+            result = redis_client.lmpop(len(keys), *keys, direction="RIGHT", count=count)
+            messages = result[1] if result else None
+        messages = messages or []
+        pops += len(messages)
+        return messages
+
+    def pop_message(timeout: float = block_timeout) -> Optional[Any]:
+        nonlocal pops, idle_delay
+        keys = pop_order()
+
+        if not reliable:
+            # BRPOP parks the connection server-side until a message arrives or the timeout expires,
+            # and with several keys it pops from the first non-empty one
+            result = redis_client.brpop(keys, timeout=timeout)
+            message = result[1] if result else None
+        else:
+            # While there's a backlog the claim script moves and timestamps a message in one atomic round trip
+            message = run_script(redis_client, "claim_message", keys + [processing_key, inflight_key, consumers_key], [int(time.time() * 1000), consumer_id])
+            if message is None and len(keys) == 1:
+                # Queue is empty: BLMOVE parks until the next message and hands it to our processing list.
+                # The heartbeat goes first and the wait stays well inside the visibility timeout, so
+                # reapers never drop this consumer while it's blocked.
+                _register_consumer(redis_client, queue_name, consumer_id)
+                message = redis_client.blmove(keys[0], processing_key, min(timeout, visibility_timeout / 2), src="RIGHT", dest="LEFT")
+                if message is not None:
+                    _track_claimed(redis_client, processing_key, inflight_key, consumers_key, consumer_id, message)
+            elif message is None:
+                # BLMOVE only watches one list, so priority queues back off while every level is empty
+                idle_delay = min(max(idle_delay * 2, PRIORITY_IDLE_MIN_DELAY), timeout)
+                should_stop.wait(idle_delay)
             else:
-                # If it's not a dict, put it in a data field
-                message_data = {"data": message_obj.get("message")}
+                idle_delay = 0.0
+
+        if message is not None:
+            pops += 1
+        return message
+
+    def unpack(message: Any) -> Tuple[Any, Any]:
+        # The encoded envelope and the raw form used to settle it (stream entry ID or list value)
+        if use_stream:
+            raw, message = message
+            return message, raw
+        return message, message
+
+    def handle_message(message: Any) -> None:
+        err = process_job(*unpack(message))
+        if err:
+            logger.warning("Error processing message from queue %s: %s", queue_name, err)
+
+    def handle_batch(messages: list) -> None:
+        process_batch([unpack(message) for message in messages])
+
+    def fetch_batch() -> list:
+        # Wait up to block_timeout for the first messages, then at most max_wait_ms to fill the batch
+        batch = pop_messages(batch_size, block_timeout)
+        deadline = time.monotonic() + max_wait_ms / 1000
+        while batch and len(batch) < batch_size and not should_stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining < MIN_BLOCK_TIMEOUT:
+                # A zero timeout would block forever
+                break
+            batch.extend(pop_messages(batch_size - len(batch), remaining))
+        return batch
+
+    # Each slot is one message (or batch) that has been popped but not finished yet. Popping
+    # only after taking a slot stops the consumer from pulling more work than it can run.
+    slots = threading.BoundedSemaphore(concurrency + prefetch)
+    # In process mode these threads only wait on the process pool and do the Redis round trips
+    thread_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"bizzmq-worker-{queue_name}") if concurrency > 1 else None
+
+    def run_job(message: Any) -> None:
+        try:
+            if batch_size:
+                handle_batch(message)
+            else:
+                handle_message(message)
+        finally:
+            slots.release()
+
+    def worker_thread():
+        while not should_stop.is_set():
+            if not slots.acquire(timeout=block_timeout):
+                continue
+            taken = 1
+            if use_stream and not batch_size:
+                # XREADGROUP fetches a batch, so ask for every slot that's free right now
+                while slots.acquire(blocking=False):
+                    taken += 1
 
             try:
-                callback(message_data)
-                # LifeCycle Update
-                message_obj = update_lifecycle_status(message_obj, "processed")
-                return None
-            except Exception as e :
-                # LifeCycle Update
-                message_obj = update_lifecycle_status(message_obj, "failed")
-                if use_dead_letter_queue:
-                    if max_retries > 0:
-                        self._requeue_message(ctx, queuename, message_obj, err)
-                    else:
-                        self._move_message_to_dlq(ctx, queuename, message_obj, err)
+                if batch_size:
+                    # The whole batch is one job holding one slot
+                    batch = fetch_batch()
+                    messages = [batch] if batch else []
                 else:
-                    print("⚠️ Message failed but no DLQ configured")
-                    
-                return err
+                    messages = pop_messages(taken, block_timeout)
+            except Exception as e:
+                for _ in range(taken):
+                    slots.release()
+                logger.error("Error popping message from queue %s: %s", queue_name, e)
+                # Back off briefly so a lost connection doesn't turn into a busy loop
+                should_stop.wait(block_timeout)
+                continue
 
-        except json.JSONDecodeError as e:
-            print(f"❌ Failed to parse message: {str(e)}")
-            return e
+            for _ in range(taken - len(messages)):
+                slots.release()
 
-        return None
-    
-    """ Function to Process any existing jobs in the queue"""
-    def process_existing_jobs():
-        
-        while True:
+            for message in messages:
+                if thread_pool is None:
+                    run_job(message)
+                else:
+                    thread_pool.submit(run_job, message)
+
+    def reaper_thread():
+        # Sweep a few times per visibility window so expired messages don't linger for long
+        interval = max(visibility_timeout / 4, 0.1)
+        while not should_stop.wait(interval):
             try:
-                message = redis_client.rpop(queue_key)
-                if not message:
-                    break
-                        
-                err = process_job(message.decode('utf-8') if isinstance(message, bytes) else message)
-                if err:
-                    print(f"❌ Error processing message: {str(err)}")
+                if use_stream:
+                    reaped = _reclaim_stalled_stream_messages(redis_client, queue_name, consumer_id, visibility_timeout)
+                else:
+                    reaped = _reap_expired_messages(redis_client, queue_name, visibility_timeout)
+                if reaped:
+                    logger.info("Reaper requeued %d expired message(s) on queue %s", reaped, queue_name)
+                    if queue_options.retry is not None:
+                        wake_scheduler.set()
             except Exception as e:
-                print(f"❌ Error popping message from queue: {str(e)}")
-                break
+                logger.error("Error in reaper of queue %s: %s", queue_name, e)
 
-    process_existing_jobs()
-    # Subscribe to the queue for real-time notifications
-    pubsub = subscriber.pubsub()
-    pubsub.subscribe(queue_key)
-    def subscriber_thread():
-        for message in pubsub.listen():
+    def scheduler_thread():
+        # Promotes delayed messages and backed-off retries once they're due
+        delay = 0.0
+        while True:
+            wake_scheduler.wait(delay)
+            # A retry scheduled after this point sets the event again, and one scheduled before
+            # it is already in the sorted set this pass reads
+            wake_scheduler.clear()
             if should_stop.is_set():
                 break
-                
-            if message["type"] == "message":
-                print(f"🔔 New job notification received: {message['data']}")
-                
-                # Pop a message from the queue and process it
-                try:
-                    message = redis_client.rpop(queue_key)
-                    if message:
-                        message_str = message.decode('utf-8') if isinstance(message, bytes) else message
-                        err = process_job(message_str)
-                        if err:
-                            print(f"❌ Error processing message: {str(err)}")
-                except Exception as e:
-                    print(f"❌ Error popping message after notification: {str(e)}")
-        
-    thread = threading.Thread(target=subscriber_thread)
-    thread.daemon = True
-    thread.start()
-
-    # Start fallback ticker thread to check for missed messages
-    def fallback_thread():
-        while not should_stop.is_set():
             try:
-                message = redis_client.rpop(queue_key)
-                if message:
-                    print("⚠️ Fallback found unprocessed job")
-                    message_str = message.decode('utf-8') if isinstance(message, bytes) else message
-                    err = process_job(message_str)
-                    if err:
-                        print(f"❌ Error processing message from fallback: {str(err)}")
-                    
-                    # Process any other messages that might be in the queue
-                    process_existing_jobs()
+                if use_stream:
+                    moved, next_due = promote_due_stream_messages(redis_client, queue_name, queue_options.stream_max_length)
+                else:
+                    moved, next_due = promote_due_messages(redis_client, queue_name, priority_levels)
+                delay = next_poll_delay(moved, next_due)
             except Exception as e:
-                print(f"❌ Error in fallback check: {str(e)}")
-                
-            # Sleep for fallback interval
-            time.sleep(5)  # 5 second interval
+                logger.error("Error promoting scheduled messages of queue %s: %s", queue_name, e)
+                delay = SCHEDULER_POLL_INTERVAL
+
+    worker = threading.Thread(target=worker_thread, name=f"bizzmq-consumer-{queue_name}")
+    worker.daemon = True
+    worker.start()
 
-    fallback = threading.Thread(target=fallback_thread)
-    fallback.daemon = True
-    fallback.start()
+    scheduler = threading.Thread(target=scheduler_thread, name=f"bizzmq-scheduler-{queue_name}")
+    scheduler.daemon = True
+    scheduler.start()
+
+    if reliable or use_stream:
+        reaper = threading.Thread(target=reaper_thread, name=f"bizzmq-reaper-{queue_name}")
+        reaper.daemon = True
+        reaper.start()
 
     def cleanup():
         should_stop.set()
-        pubsub.unsubscribe()
-        pubsub.close()
+        wake_scheduler.set()
+        # The worker notices the flag once its current blocking pop returns
+        if threading.current_thread() is not worker:
+            worker.join(block_timeout + 1)
+        in_worker = threading.current_thread().name.startswith(f"bizzmq-worker-{queue_name}")
+        if thread_pool is not None:
+            # Let popped messages finish unless cleanup was called from one of the pool's own callbacks
+            thread_pool.shutdown(wait=not in_worker)
+        if process_pool is not None:
+            process_pool.shutdown(wait=not in_worker)
+        if reliable:
+            _unregister_consumer(redis_client, queue_name, consumer_id)
             
     return cleanup, None
 
 
-# Function to requeue a message
-def _requeue_message(redis_client: redis.Redis, queuename: str, message: dict, processing_err: Exception) -> Optional[Exception]:
-    queue_meta_key = f"queue_meta:{queuename}"
+def _consume_partitions(redis_client: redis.Redis, queue_name: str, queue_options: QueueOptions, callback: Callable[[Any], None], **consumer_options: Any) -> Tuple[Callable, Optional[Exception]]:
+    cleanups = []
+    for name in partition_queue_names(queue_name, queue_options):
+        cleanup, err = consume_message_from_queue(redis_client, name, callback, **consumer_options)
+        if err:
+            for started in cleanups:
+                started()
+            return None, err
+        cleanups.append(cleanup)
+
+    def cleanup_all():
+        for cleanup in cleanups:
+            cleanup()
 
+    return cleanup_all, None
+
+
+class RemoteCallbackError(Exception):
+    """A callback failure raised inside a worker process, carried back to the consumer."""
+
+    def __init__(self, exc_type: str, message: str, remote_traceback: str) -> None:
+        super().__init__(exc_type, message, remote_traceback)
+        self.exc_type = exc_type
+        self.message = message
+        self.remote_traceback = remote_traceback
+
+    def __str__(self) -> str:
+        return f"{self.exc_type}: {self.message}"
+
+
+def _call_in_worker_process(callback: Callable[[Any], Any], message_data: Any) -> Tuple[Any, Optional[RemoteCallbackError]]:
+    # Runs in the child. Exceptions are flattened to strings because user exception
+    # types aren't guaranteed to survive a round trip through pickle.
     try:
-        queue_options_map = redis_client.hgetall(queue_meta_key)
+        return callback(message_data), None
     except Exception as e:
-        return Exception(f"Failed to get queue options: {str(e)}")
-    
+        return None, RemoteCallbackError(type(e).__name__, str(e), traceback.format_exc())
 
-    
-    max_retries = 3 
-    if "maxRetries" in queue_options_map:
+
+class _ProcessPool:
+    """ProcessPoolExecutor wrapper that replaces the pool if a worker process dies."""
+
+    def __init__(self, max_workers: int) -> None:
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pool = ProcessPoolExecutor(max_workers=max_workers)
+
+    def run(self, callback: Callable[[Any], Any], message_data: Any) -> Any:
+        pool = self._pool
         try:
-            max_retries = int(queue_options_map["maxRetries"])
-        except (ValueError, TypeError):
-            pass
+            result, error = pool.submit(_call_in_worker_process, callback, message_data).result()
+        except BrokenProcessPool as e:
+            self._replace(pool)
+            raise RuntimeError(f"Worker process died while running the callback: {str(e)}") from e
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            raise TypeError(f"Message can't be sent to a worker process, callbacks and payloads must be picklable: {str(e)}") from e
+        if error is not None:
+            raise error
+        return result
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+    def _replace(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            # Another thread may already have swapped in a fresh pool
+            if self._pool is broken:
+                broken.shutdown(wait=False)
+                self._pool = ProcessPoolExecutor(max_workers=self._max_workers)
+
+
+def _default_consumer_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class _InFlight(NamedTuple):
+    """Where a reliable consumer holds a message while its callback runs."""
+    processing_key: str
+    inflight_key: str
+    raw: Any
+    settle_mode: int = SETTLE_ACK
+
+
+def _settle_in_flight_many(redis_client: redis.Redis, in_flights: List[_InFlight]) -> List[bool]:
+    """`_settle_in_flight` for several messages in one round trip, with one result per message."""
+    if not in_flights:
+        return []
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for in_flight in in_flights:
+            run_script(pipe, "ack_message", [in_flight.processing_key, in_flight.inflight_key], [in_flight.raw])
+        return [bool(settled) for settled in pipe.execute()]
+    except Exception as e:
+        logger.error("Error acknowledging messages: %s", e)
+        return [False] * len(in_flights)
 
-    
-    retry_count = 0
-    if "options" in message and isinstance(message["options"], dict):
-        retry_count = message["options"].get("retryCount", 0)
-    
-    # Now the retry count needs to be updated
-    retry_count += 1
-    if retry_count <= max_retries:
-        if "options" not in message or not isinstance(message["options"], dict):
-            message["options"] = {}
-    
-        message["options"]["retryCount"] = retry_count
-        message["options"]["timestamp_updated"] = int(time.time() * 1000)
-        message = update_lifecycle_status(message, "requeued")
 
-        message_json = json.dumps(message)
-        queue_key = f"queue:{queuename}"
-        redis_client.lpush(queue_key, message_json)
+def _batch_failures(result: Any, batch_len: int) -> Dict[int, Exception]:
+    """Normalize what a batch callback returned into {index: exception}."""
+    if not result:
+        return {}
+    if not isinstance(result, dict):
+        raise TypeError(f"Batch callbacks must return None or a dict of failed indexes, got {type(result).__name__}")
+    failures = {}
+    for index, err in result.items():
+        if not 0 <= index < batch_len:
+            logger.warning("Batch callback reported a failure for unknown index %s", index)
+            continue
+        failures[index] = err if isinstance(err, Exception) else Exception(str(err))
+    return failures
 
-        print(f"🔄 Message Requeued for retry (attempt {retry_count}/{max_retries})")
+
+def _callback_started(queue_name: str, envelopes: Any) -> Optional[float]:
+    # None while no metrics sink is registered, so the hot path skips the clock reads
+    if not metrics.enabled():
         return None
-    
-    else:
-        return _move_message_to_dlq(redis_client, queuename, message, processing_err)
+    metrics.observe_queue_wait(queue_name, envelopes)
+    return time.perf_counter()
+
+
+def _callback_finished(queue_name: str, started: Optional[float], processed: int = 0, failed: int = 0) -> None:
+    if started is None:
+        return
+    metrics.observe(metrics.CALLBACK_DURATION, queue_name, time.perf_counter() - started)
+    if processed:
+        metrics.count(metrics.MESSAGES_PROCESSED, queue_name, processed)
+    if failed:
+        metrics.count(metrics.MESSAGES_FAILED, queue_name, failed)
 
 
-def _move_message_to_dlq(redis_client: redis.Redis, queuename: str, message: dict, processing_err: Exception) -> Optional[Exception]:
-    queue_meta_key = f"queue_meta:{queuename}"
+def _settle_in_flight(redis_client: redis.Redis, in_flight: Optional[_InFlight]) -> bool:
+    """
+    Remove a message from its consumer's processing list and in-flight set.
+
+    Returns False if a reaper had already requeued it (or the ack failed), True if this
+    call settled it or there was nothing in flight.
+    """
+    if in_flight is None:
+        return True
     try:
-        queue_options_map = redis_client.hgetall(queue_meta_key)
+        return bool(run_script(redis_client, "ack_message", [in_flight.processing_key, in_flight.inflight_key], [in_flight.raw]))
     except Exception as e:
-        return Exception(f"Failed to get queue options: {str(e)}")
+        logger.error("Error acknowledging message: %s", e)
+        return False
+
+
+def _track_claimed(redis_client: redis.Redis, processing_key: str, inflight_key: str, consumers_key: str, consumer_id: str, message: Any) -> None:
+    # BLMOVE can't record the claim time or register the consumer itself. The message sits
+    # in the processing list meanwhile, so reapers neither miss it nor unregister its owner.
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zadd(inflight_key, {message: int(time.time() * 1000)})
+    pipe.sadd(consumers_key, consumer_id)
+    pipe.execute()
+
+
+def _register_consumer(redis_client: redis.Redis, queue_name: str, consumer_id: str) -> None:
+    # The heartbeat tells reapers the consumer is alive, see _unregister_consumer
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.sadd(f"queue_consumers:{queue_name}", consumer_id)
+    pipe.zadd(f"queue_heartbeats:{queue_name}", {consumer_id: int(time.time() * 1000)})
+    pipe.execute()
+
 
-    dead_letter_queue_value = False
-    dlq_option = queue_options_map.get("config_dead_letter_queue")
-    if dlq_option:
+def _unregister_consumer(redis_client: redis.Redis, queue_name: str, consumer_id: str, seen_before_ms: Optional[int] = None) -> bool:
+    """
+    Drop `consumer_id` from the queue's consumers unless it still holds messages. Returns True if it was removed.
+
+    With `seen_before_ms`, consumers whose last heartbeat is newer are kept too. Consumers
+    register again right before every BLMOVE, so one that's blocked waiting for a message
+    is never dropped, and a message it gets is always in a processing list reapers scan.
+    """
+    keys = [f"queue_processing:{queue_name}:{consumer_id}", f"queue_inflight:{queue_name}:{consumer_id}", f"queue_consumers:{queue_name}", f"queue_heartbeats:{queue_name}"]
+    try:
+        # Anything still in flight stays registered so another consumer's reaper can recover it
+        return bool(run_script(redis_client, "unregister_consumer", keys, [consumer_id, "" if seen_before_ms is None else seen_before_ms]))
+    except Exception as e:
+        logger.error("Error unregistering consumer %s: %s", consumer_id, e)
+        return False
+
+
+def _reap_expired_messages(redis_client: redis.Redis, queue_name: str, visibility_timeout: float, batch_size: int = REAPER_BATCH_SIZE) -> int:
+    """
+    Requeue messages held by any consumer of `queue_name` for longer than `visibility_timeout`.
+
+    In-flight entries are read from each consumer's sorted set in windows of `batch_size`,
+    so a sweep costs O(log n) per expired message rather than a scan of every processing
+    list. Returns the number of messages that were reaped.
+    """
+    consumers = [
+        c.decode('utf-8') if isinstance(c, bytes) else c
+        for c in redis_client.smembers(f"queue_consumers:{queue_name}")
+    ]
+    if not consumers:
+        return 0
+
+    _adopt_untracked_messages(redis_client, queue_name, consumers, batch_size)
+
+    now_ms = int(time.time() * 1000)
+    deadline = now_ms - int(visibility_timeout * 1000)
+    reaped = 0
+
+    for consumer_id in consumers:
+        processing_key = f"queue_processing:{queue_name}:{consumer_id}"
+        inflight_key = f"queue_inflight:{queue_name}:{consumer_id}"
+
+        while True:
+            expired = redis_client.zrangebyscore(inflight_key, "-inf", deadline, start=0, num=batch_size)
+            if not expired:
+                break
+
+            for message in expired:
+                # Claim mode makes the script a no-op if the consumer acked or another reaper got
+                # there first, so concurrent reapers never requeue the same message twice
+                in_flight = _InFlight(processing_key, inflight_key, message, SETTLE_CLAIM)
+                try:
+                    message_obj = update_lifecycle_status(decode_envelope(message), "failed")
+                except ValueError as e:
+                    logger.error("Failed to parse in-flight message of queue %s: %s", queue_name, e)
+                    _settle_in_flight(redis_client, in_flight)
+                    continue
+                result = _run_retry(redis_client, queue_name, message_obj, TimeoutError(f"Visibility timeout of {visibility_timeout}s exceeded"), in_flight)
+                if result != RESULT_ALREADY_SETTLED:
+                    reaped += 1
+
+            if len(expired) < batch_size:
+                break
+
+        # Crashed consumers never unregister themselves. Once nothing of theirs is left and
+        # they haven't been seen for a visibility timeout they're dropped, so the set doesn't
+        # grow with every crash. Live consumers keep their heartbeat fresh and stay.
+        _unregister_consumer(redis_client, queue_name, consumer_id, deadline)
+
+    return reaped
+
+
+def _reclaim_stalled_stream_messages(redis_client: redis.Redis, queue_name: str, consumer_id: str, visibility_timeout: float) -> int:
+    """
+    Retry entries of a stream queue that stayed pending longer than `visibility_timeout`.
+
+    Stalled entries are first taken over with XAUTOCLAIM, so only one consumer handles
+    each of them, then go through the normal retry/DLQ accounting like reaped list
+    messages. Returns the number of entries that were handled.
+    """
+    reaped = 0
+    for entry_id, message in claim_stalled_messages(redis_client, queue_name, consumer_id, visibility_timeout):
+        try:
+            message_obj = update_lifecycle_status(decode_envelope(message), "failed")
+        except (TypeError, ValueError) as e:
+            logger.error("Failed to parse pending message of queue %s: %s", queue_name, e)
+            _ack_stream_entry(redis_client, queue_name, entry_id)
+            continue
+        result = _fail_stream_message(redis_client, queue_name, message_obj, TimeoutError(f"Visibility timeout of {visibility_timeout}s exceeded"), entry_id)
+        if result != RESULT_ALREADY_SETTLED:
+            reaped += 1
+    return reaped
+
+
+def _adopt_untracked_messages(redis_client: redis.Redis, queue_name: str, consumers: list, batch_size: int) -> None:
+    # A consumer that dies between BLMOVE and ZADD leaves a message in its processing list
+    # with no in-flight entry. Those are rare, so compare list and set sizes first and only
+    # walk a processing list when they disagree.
+    pipe = redis_client.pipeline(transaction=False)
+    for consumer_id in consumers:
+        pipe.llen(f"queue_processing:{queue_name}:{consumer_id}")
+        pipe.zcard(f"queue_inflight:{queue_name}:{consumer_id}")
+    sizes = pipe.execute()
+
+    now_ms = int(time.time() * 1000)
+    for index, consumer_id in enumerate(consumers):
+        if sizes[2 * index] <= sizes[2 * index + 1]:
+            continue
+        processing_key = f"queue_processing:{queue_name}:{consumer_id}"
+        inflight_key = f"queue_inflight:{queue_name}:{consumer_id}"
+        start = 0
+        while True:
+            window = redis_client.lrange(processing_key, start, start + batch_size - 1)
+            if not window:
+                break
+            # NX keeps the original claim time of messages that are already tracked
+            redis_client.zadd(inflight_key, {m: now_ms for m in window}, nx=True)
+            start += batch_size
+
+
+def _message_priority(message: dict) -> int:
+    options = message.get("options")
+    if isinstance(options, dict):
         try:
-            dead_letter_queue_value = dlq_option in ("1", "true", "True")
+            return int(options.get("priority", 0))
         except (ValueError, TypeError):
-            pass
-                
-    if not dead_letter_queue_value:
-            print(f"No Dead Letter Queue configured for this Queue, Failed message discarded")
-            return None
+            return 0
+    return 0
+
+
+def _decode_message(data: Any, fetch_payload: Optional[Callable[[str], Any]] = None) -> Tuple[Dict[str, Any], Any]:
+    """
+    Parse a raw queue entry into its envelope and the data handed to the callback.
+
+    The codec is picked from the entry's tag. Lifecycle fields are only updated once a
+    message fails, since the envelope of a successful message is never written back.
+    Compressed or offloaded payloads come back as a LazyPayload that only decompresses
+    (or fetches them with `fetch_payload`) when the callback reads them.
+    """
+    message_obj = decode_envelope(data)
+    if has_packed_payload(message_obj):
+        return message_obj, LazyPayload(message_obj, fetch_payload)
+
+    if isinstance(message_obj.get("message"), dict):
+        message_data = message_obj["message"]
+    else:
+        # If it's not a dict, put it in a data field
+        message_data = {"data": message_obj.get("message")}
+
+    return message_obj, message_data
 
-    dlq_name = f"{queuename}_dlq"
+
+def _build_requeued_message(message: dict) -> Tuple[dict, int]:
+    """
+    Copy a failed message with its retry counter bumped, ready to go back on the queue.
+
+    Returns the copy and its new retry count. The original is left untouched so it can
+    still be turned into a dead letter if the retry budget turns out to be spent.
+    """
+    options = dict(message["options"]) if isinstance(message.get("options"), dict) else {}
+    # Now the retry count needs to be updated
+    retry_count = options.get("retryCount", 0) + 1
+
+    options["retryCount"] = retry_count
+    options["timestamp_updated"] = int(time.time() * 1000)
+    requeued = dict(message)
+    requeued["options"] = options
+    return update_lifecycle_status(requeued, "requeued"), retry_count
+
+
+def _build_dead_letter_message(queuename: str, message: dict, processing_err: Exception) -> dict:
+    """Annotate a failed message with the error details kept in the Dead Letter Queue."""
     error_message = str(processing_err) if processing_err else "Unknown error"
     if "options" not in message or not isinstance(message["options"], dict):
         message["options"] = {}
     message["options"].update({
         "message": error_message,
-        "stack": traceback.format_exc(),
+        "stack": _format_stack(processing_err),
         "timestamp": int(time.time() * 1000),
         "originalQueue": queuename,
         "failedAt": int(time.time() * 1000)
     })
+    if "message" not in message and not has_packed_payload(message):
+        message["message"] = {"error": "No data found in original message"}
+    message["queue_name"] = f"{queuename}_dlq"
+    return message
 
-    message_data = message.get("message", {"error": "No data found in original message"})
-    options = message.get("options", {})
+
+def _format_stack(processing_err: Optional[Exception]) -> str:
+    if processing_err is None:
+        return ""
+    # Failures from worker processes carry the child's traceback, which is the useful one
+    remote_traceback = getattr(processing_err, "remote_traceback", None)
+    if remote_traceback:
+        return remote_traceback
+    return "".join(traceback.format_exception(type(processing_err), processing_err, processing_err.__traceback__))
+
+
+# Function to requeue a message
+def _requeue_message(redis_client: redis.Redis, queuename: str, message: dict, processing_err: Exception, in_flight: Optional[_InFlight] = None) -> Optional[Exception]:
     try:
-        publish_message_to_queue(redis_client, dlq_name, message_data, options)
-        print(f"⚠️ Message moved to Dead Letter Queue {dlq_name}")
+        _run_retry(redis_client, queuename, message, processing_err, in_flight)
         return None
+    except Exception as e:
+        return Exception(f"Failed to requeue message: {str(e)}")
+
+
+def _run_retry(redis_client: redis.Redis, queuename: str, message: dict, processing_err: Exception, in_flight: Optional[_InFlight] = None) -> int:
+    queue_options = get_queue_options(redis_client, queuename) or QueueOptions()
+    keys, args, retry_count, delay = _retry_script_call(queuename, queue_options, message, processing_err, in_flight)
+    result = int(run_script(redis_client, "retry_message", keys, args))
+    _report_transition(queuename, result, retry_count, queue_options.max_retries, delay)
+    return result
+
+
+def _move_message_to_dlq(redis_client: redis.Redis, queuename: str, message: dict, processing_err: Exception, in_flight: Optional[_InFlight] = None) -> Optional[Exception]:
+    try:
+        queue_options = get_queue_options(redis_client, queuename) or QueueOptions()
+        keys, args = _dead_letter_script_call(queuename, queue_options, message, processing_err, in_flight)
+        result = int(run_script(redis_client, "dead_letter_message", keys, args))
     except Exception as e:
         return Exception(f"Failed to publish message to DLQ: {str(e)}")
+
+    _report_transition(queuename, result, 0, 0, 0)
+    return None
+
+
+def _report_failed_move(queuename: str, move_err: Exception, in_flight_kept: bool) -> None:
+    # The retry/DLQ script didn't run. Only a claimed message is still around for the reaper to redeliver.
+    if in_flight_kept:
+        logger.error("%s on queue %s, the message is redelivered once its visibility timeout expires", move_err, queuename)
+    else:
+        logger.error("%s on queue %s, the message is lost", move_err, queuename)
+        metrics.count(metrics.MESSAGES_DISCARDED, queuename)
+
+
+def _release_payloads(redis_client: redis.Redis, envelopes: List[Dict[str, Any]]) -> None:
+    # Offloaded payloads of handled messages are deleted right away instead of waiting for their TTL
+    keys = [envelope[PAYLOAD_REF_FIELD] for envelope in envelopes if PAYLOAD_REF_FIELD in envelope]
+    if not keys:
+        return
+    try:
+        redis_client.unlink(*keys)
+    except Exception as e:
+        logger.error("Error deleting offloaded payloads: %s", e)
+
+
+def _ack_stream_entry(redis_client: redis.Redis, queue_name: str, *entry_ids: Any) -> int:
+    """Acknowledge stream entries. Returns how many were still pending, 0 if the ack failed."""
+    if not entry_ids:
+        return 0
+    try:
+        return ack_stream_message(redis_client, queue_name, *entry_ids)
+    except Exception as e:
+        logger.error("Error acknowledging message on queue %s: %s", queue_name, e)
+        return 0
+
+
+def _fail_stream_message(redis_client: redis.Redis, queuename: str, message: dict, processing_err: Exception, entry_id: Any) -> Optional[int]:
+    """Acknowledge a failed stream entry and retry, dead-letter or drop it. Returns the script result."""
+    try:
+        queue_options = get_queue_options(redis_client, queuename) or QueueOptions()
+        requeued, dead_letter, retry_count, delay, due_ms = _retry_outcomes(queuename, queue_options, message, processing_err)
+        codec = get_codec(queue_options.codec)
+        # Same decision as for lists: queues without a DLQ don't retry
+        max_retries = queue_options.max_retries if queue_options.config_dead_letter_queue else 0
+        keys = [stream_key(queuename), scheduled_key(queuename), f"queue:{queuename}_dlq"]
+        args = [
+            DEFAULT_CONSUMER_GROUP, entry_id, retry_count, max_retries, int(bool(queue_options.config_dead_letter_queue)),
+            codec.encode(requeued), codec.encode(dead_letter), due_ms, queue_options.stream_max_length or 0,
+        ]
+        result = int(run_script(redis_client, "retry_stream_message", keys, args))
+    except Exception as e:
+        logger.error("Failed to requeue message on queue %s: %s", queuename, e)
+        return None
+
+    _report_transition(queuename, result, retry_count, max_retries, delay)
+    return result
+
+
+def _retry_outcomes(queuename: str, queue_options: QueueOptions, message: dict, processing_err: Exception) -> Tuple[dict, dict, int, float, int]:
+    """Requeued and dead-letter envelopes of a failed message, its retry count, backoff (s) and due time (ms, 0 = now)."""
+    # Both outcomes are prepared up front and the script picks one atomically,
+    # so a retry costs a single round trip
+    requeued, retry_count = _build_requeued_message(message)
+    dead_letter = _build_dead_letter_message(queuename, message, processing_err)
+
+    delay = queue_options.retry.backoff_delay(retry_count) if queue_options.retry is not None else 0.0
+    due_ms = int((time.time() + delay) * 1000) if delay > 0 else 0
+    return requeued, dead_letter, retry_count, delay, due_ms
+
+
+def _retry_script_call(queuename: str, queue_options: QueueOptions, message: dict, processing_err: Exception, in_flight: Optional[_InFlight]) -> Tuple[list, list, int, float]:
+    """KEYS and ARGV for the retry_message script, plus the retry count and backoff in seconds."""
+    requeued, dead_letter, retry_count, delay, due_ms = _retry_outcomes(queuename, queue_options, message, processing_err)
+    # Retries are written with the queue's current codec, whatever the producer used
+    codec = get_codec(queue_options.codec)
+    processing_key, inflight_key, raw, settle_mode = in_flight or _no_in_flight(queuename)
+
+    keys = [
+        # Retries go back to the list matching the message's own priority
+        queue_key(queuename, _message_priority(requeued), queue_options.priority_levels),
+        scheduled_key(queuename),
+        f"queue:{queuename}_dlq",
+        processing_key,
+        inflight_key,
+    ]
+    args = [
+        retry_count, queue_options.max_retries, int(bool(queue_options.config_dead_letter_queue)),
+        codec.encode(requeued), codec.encode(dead_letter), due_ms, raw, settle_mode,
+    ]
+    return keys, args, retry_count, delay
+
+
+def _dead_letter_script_call(queuename: str, queue_options: QueueOptions, message: dict, processing_err: Exception, in_flight: Optional[_InFlight]) -> Tuple[list, list]:
+    """KEYS and ARGV for the dead_letter_message script."""
+    # The envelope is pushed as-is so the DLQ keeps the original message ID and retry history
+    dead_letter = _build_dead_letter_message(queuename, message, processing_err)
+    processing_key, inflight_key, raw, settle_mode = in_flight or _no_in_flight(queuename)
+
+    keys = [f"queue:{queuename}_dlq", processing_key, inflight_key]
+    args = [get_codec(queue_options.codec).encode(dead_letter), int(bool(queue_options.config_dead_letter_queue)), raw, settle_mode]
+    return keys, args
+
+
+def _no_in_flight(queuename: str) -> _InFlight:
+    # The failure scripts always take the in-flight keys; SETTLE_NONE means they're never touched
+    return _InFlight(f"queue_processing:{queuename}", f"queue_inflight:{queuename}", "", SETTLE_NONE)
+
+
+def _report_transition(queuename: str, result: int, retry_count: int, max_retries: int, delay: float) -> None:
+    if result in (RESULT_REQUEUED, RESULT_SCHEDULED):
+        metrics.count(metrics.MESSAGES_RETRIED, queuename)
+    elif result == RESULT_DEAD_LETTERED:
+        metrics.count(metrics.MESSAGES_DEAD_LETTERED, queuename)
+    elif result == RESULT_DISCARDED:
+        metrics.count(metrics.MESSAGES_DISCARDED, queuename)
+
+    if result == RESULT_REQUEUED:
+        logger.debug("Message requeued on queue %s for retry (attempt %d/%d)", queuename, retry_count, max_retries)
+    elif result == RESULT_SCHEDULED:
+        logger.debug("Message on queue %s scheduled for retry in %.2fs (attempt %d/%d)", queuename, delay, retry_count, max_retries)
+    elif result == RESULT_DEAD_LETTERED:
+        logger.warning("Message moved to Dead Letter Queue %s_dlq", queuename)
+    elif result == RESULT_DISCARDED:
+        logger.warning("No Dead Letter Queue configured for queue %s, failed message discarded", queuename)
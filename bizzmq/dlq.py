@@ -0,0 +1,251 @@
+"""
+Inspecting, redriving and purging dead letter queues.
+
+Failed messages end up in `queue:<name>_dlq`, newest first. Everything here reads the
+DLQ oldest first in LRANGE windows, so a DLQ with millions of entries is never loaded
+into memory at once. Entries are removed by value once they've been read, so a
+redrive running next to DLQ consumers, or another redrive, never loses or duplicates
+a message.
+"""
+import logging
+import redis
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .cluster import is_cluster
+from .codecs import decode_envelope, get_codec
+from .metadata import get_queue_options
+from .payloads import PAYLOAD_REF_FIELD
+from .queue import STORAGE_STREAM, QueueOptions, partition_queue_names, queue_key
+from .scripts import preload_scripts, run_script
+from .streams import stream_key
+
+logger = logging.getLogger(__name__)
+
+# Dead letters read per LRANGE call
+DEFAULT_DLQ_WINDOW = 500
+# Dead letters moved per redrive script call
+DEFAULT_REDRIVE_BATCH_SIZE = 100
+
+# Options added by dead-lettering and retries, dropped when a message is redriven
+_FAILURE_FIELDS = ("message", "stack", "timestamp", "originalQueue", "failedAt", "retryCount", "timestamp_updated")
+
+
+def dead_letter_key(queue_name: str) -> str:
+    return f"queue:{queue_name}_dlq"
+
+
+def dead_letter_count(redis_client: redis.Redis, queue_name: str) -> int:
+    return sum(redis_client.llen(dead_letter_key(name)) for name in _dead_letter_queues(redis_client, queue_name))
+
+
+def iter_dead_letter_messages(redis_client: redis.Redis, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None, window: int = DEFAULT_DLQ_WINDOW) -> Iterator[Dict[str, Any]]:
+    """
+    Dead letters of `queue_name`, oldest first, read `window` entries at a time.
+
+    `error` keeps messages whose error message contains it, `original_queue` those that
+    failed on that queue. Entries that can't be decoded are skipped. Partitioned
+    queues are read partition by partition.
+    """
+    for name in _dead_letter_queues(redis_client, queue_name):
+        for _, envelope in _scan(redis_client, name, window):
+            if envelope is not None and _matches(envelope, error, original_queue):
+                yield envelope
+
+
+def get_dead_letter_messages(redis_client: redis.Redis, queue_name: str, offset: int = 0, limit: int = 100, error: Optional[str] = None, original_queue: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    One page of dead letters, oldest first.
+
+    Without filters the page is a single LRANGE. With filters `offset` counts matching
+    messages, so later pages scan the entries before them again.
+    """
+    if offset < 0 or limit < 0:
+        raise ValueError("offset and limit can't be negative")
+    if limit == 0:
+        return []
+    if error is None and original_queue is None and len(_dead_letter_queues(redis_client, queue_name)) == 1:
+        # Index -1 is the oldest entry, so the page is a window counted from the tail
+        entries = redis_client.lrange(dead_letter_key(queue_name), -(offset + limit), -(offset + 1)) if offset + limit else []
+        return [envelope for envelope in (_decode(raw) for raw in reversed(entries)) if envelope is not None]
+
+    page = []
+    for index, envelope in enumerate(iter_dead_letter_messages(redis_client, queue_name, error, original_queue, max(limit, DEFAULT_DLQ_WINDOW))):
+        if index >= offset:
+            page.append(envelope)
+            if len(page) >= limit:
+                break
+    return page
+
+
+def redrive_dead_letter_messages(redis_client: redis.Redis, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None, limit: Optional[int] = None, batch_size: int = DEFAULT_REDRIVE_BATCH_SIZE, window: int = DEFAULT_DLQ_WINDOW) -> int:
+    """
+    Move matching dead letters back to the queue they failed on, oldest first.
+
+    Redriven messages start over with a zeroed retry count and without the failure
+    details. Each batch of `batch_size` messages is moved by one script call, which
+    removes every message from the DLQ and pushes it in the same atomic step, and the
+    batches of a window go out in one pipeline. Returns the number of messages moved.
+    """
+    if batch_size < 1 or window < 1:
+        raise ValueError("batch_size and window must be at least 1")
+    names = _dead_letter_queues(redis_client, queue_name)
+    if len(names) > 1:
+        moved = 0
+        for name in names:
+            moved += redrive_dead_letter_messages(redis_client, name, error, original_queue, None if limit is None else limit - moved, batch_size, window)
+            if limit is not None and moved >= limit:
+                break
+        return moved
+    if is_cluster(redis_client):
+        # Cluster pipelines send EVALSHA as is, unlike plain pipelines they can't load a missing script
+        preload_scripts(redis_client)
+    # Options of every queue messages are redriven to, read once per call
+    targets: Dict[str, QueueOptions] = {}
+
+    def redrive_window(entries: List[Tuple[Any, Optional[Dict[str, Any]]]], remaining: Optional[int]) -> int:
+        moves = []
+        for raw, envelope in entries:
+            if envelope is None or not _matches(envelope, error, original_queue):
+                continue
+            moves.append(_redrive_move(redis_client, queue_name, raw, envelope, targets))
+            if remaining is not None and len(moves) >= remaining:
+                break
+        if not moves:
+            return 0
+
+        pipe = redis_client.pipeline(transaction=False)
+        for start in range(0, len(moves), batch_size):
+            batch = moves[start:start + batch_size]
+            keys = [dead_letter_key(queue_name)] + [target for target, _ in batch]
+            run_script(pipe, "redrive_messages", keys, [arg for _, args in batch for arg in args])
+        return sum(int(moved) for moved in pipe.execute())
+
+    moved = _process_windows(redis_client, queue_name, window, limit, redrive_window)
+    if moved:
+        logger.info("%d message(s) redriven from Dead Letter Queue %s_dlq", moved, queue_name)
+    return moved
+
+
+def purge_dead_letter_messages(redis_client: redis.Redis, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None, window: int = DEFAULT_DLQ_WINDOW) -> int:
+    """
+    Delete dead letters, all of them or only those matching the filters.
+
+    A full purge is a single script that counts and UNLINKs the DLQ, so even a huge one
+    is freed in the background without blocking Redis. Its offloaded payloads expire with their TTL. A filtered
+    purge removes matches window by window and deletes their offloaded payloads right
+    away. Returns the number of messages deleted.
+    """
+    names = _dead_letter_queues(redis_client, queue_name)
+    if len(names) > 1:
+        return sum(purge_dead_letter_messages(redis_client, name, error, original_queue, window) for name in names)
+
+    key = dead_letter_key(queue_name)
+    if error is None and original_queue is None:
+        purged = run_script(redis_client, "purge_dead_letters", [key], [])
+    else:
+        def purge_window(entries: List[Tuple[Any, Optional[Dict[str, Any]]]], remaining: Optional[int]) -> int:
+            matches = [(raw, envelope) for raw, envelope in entries if envelope is not None and _matches(envelope, error, original_queue)]
+            if not matches:
+                return 0
+            pipe = redis_client.pipeline(transaction=False)
+            for raw, _ in matches:
+                pipe.lrem(key, -1, raw)
+            removed = pipe.execute()
+            payload_keys = [envelope[PAYLOAD_REF_FIELD] for (_, envelope), count in zip(matches, removed) if count and PAYLOAD_REF_FIELD in envelope]
+            if payload_keys:
+                redis_client.unlink(*payload_keys)
+            return sum(1 for count in removed if count)
+
+        purged = _process_windows(redis_client, queue_name, window, None, purge_window)
+
+    logger.info("%d message(s) purged from Dead Letter Queue %s_dlq", purged, queue_name)
+    return purged
+
+
+def _dead_letter_queues(redis_client: redis.Redis, queue_name: str) -> List[str]:
+    # Each partition of a partitioned queue has its own DLQ
+    options = get_queue_options(redis_client, queue_name)
+    return partition_queue_names(queue_name, options) if options is not None and options.partitions else [queue_name]
+
+
+def _scan(redis_client: redis.Redis, queue_name: str, window: int) -> Iterator[Tuple[Any, Optional[Dict[str, Any]]]]:
+    # Read-only walk from the tail (oldest) to the head
+    key = dead_letter_key(queue_name)
+    offset = 0
+    while True:
+        entries = redis_client.lrange(key, -(offset + window), -(offset + 1))
+        for raw in reversed(entries):
+            yield raw, _decode(raw)
+        if len(entries) < window:
+            return
+        offset += window
+
+
+def _process_windows(redis_client: redis.Redis, queue_name: str, window: int, limit: Optional[int], handle: Any) -> int:
+    """
+    Walk the DLQ from the tail, calling `handle(entries, remaining)` once per window.
+
+    `handle` returns how many of the window's entries it removed. Entries behind them
+    move that many places towards the tail, so the next window starts that much earlier.
+    """
+    key = dead_letter_key(queue_name)
+    offset = 0
+    total = 0
+    while limit is None or total < limit:
+        entries = redis_client.lrange(key, -(offset + window), -(offset + 1))
+        if not entries:
+            break
+        removed = handle([(raw, _decode(raw)) for raw in reversed(entries)], None if limit is None else limit - total)
+        total += removed
+        if len(entries) < window:
+            break
+        offset += window - removed
+    return total
+
+
+def _decode(raw: Any) -> Optional[Dict[str, Any]]:
+    try:
+        return decode_envelope(raw)
+    except ValueError:
+        return None
+
+
+def _matches(envelope: Dict[str, Any], error: Optional[str], original_queue: Optional[str]) -> bool:
+    options = envelope.get("options") if isinstance(envelope.get("options"), dict) else {}
+    if original_queue is not None and options.get("originalQueue") != original_queue:
+        return False
+    if error is not None and error not in str(options.get("message", "")):
+        return False
+    return True
+
+
+def _reset_for_redrive(envelope: Dict[str, Any], target_queue: str) -> Dict[str, Any]:
+    """Copy of a dead letter with its retry count and failure details dropped."""
+    options = envelope.get("options") if isinstance(envelope.get("options"), dict) else {}
+    redriven = dict(envelope)
+    redriven["options"] = {k: v for k, v in options.items() if k not in _FAILURE_FIELDS}
+    redriven["queue_name"] = target_queue
+    redriven["status"] = "waiting"
+    redriven["timestamp_updated"] = int(time.time() * 1000)
+    return redriven
+
+
+def _redrive_move(redis_client: redis.Redis, queue_name: str, raw: Any, envelope: Dict[str, Any], targets: Dict[str, QueueOptions]) -> Tuple[str, list]:
+    """Target key and script arguments that send one dead letter back to its queue."""
+    options = envelope.get("options") if isinstance(envelope.get("options"), dict) else {}
+    target_queue = options.get("originalQueue") or queue_name
+    if target_queue not in targets:
+        targets[target_queue] = get_queue_options(redis_client, target_queue) or QueueOptions()
+    target_options = targets[target_queue]
+
+    redriven = _reset_for_redrive(envelope, target_queue)
+    data = get_codec(target_options.codec).encode(redriven)
+
+    if target_options.storage == STORAGE_STREAM:
+        return stream_key(target_queue), [raw, data, 1, target_options.stream_max_length or 0]
+    try:
+        priority = int(redriven["options"].get("priority", 0))
+    except (TypeError, ValueError):
+        priority = 0
+    return queue_key(target_queue, priority, target_options.priority_levels), [raw, data, 0, 0]
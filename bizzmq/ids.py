@@ -0,0 +1,121 @@
+"""
+Collision-free, time-sortable message IDs.
+
+IDs are 128-bit values written as 26 Crockford base32 characters, the same text form
+as a ULID:
+
+- 48 bits: Unix time in milliseconds
+- 16 bits: node ID of the producing process
+- 64 bits: sequence, seeded randomly every millisecond and incremented within it
+
+The sequence makes IDs strictly increasing within a process, even when many are
+made in the same millisecond or the clock steps back. The node ID keeps processes
+apart. It's random by default, which keeps collisions vanishingly unlikely. Giving
+every producer process its own node ID (`set_node_id` or the BIZZMQ_NODE_ID
+environment variable) rules them out. Processes that share one, such as forked
+workers inheriting BIZZMQ_NODE_ID, are only kept apart by their random sequence
+seeds, so for them a collision is as unlikely as with random node IDs but not
+impossible. Sorting IDs as strings sorts them by creation time.
+"""
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+# Crockford's base32, no I, L, O or U
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ID_LENGTH = 26
+NODE_ID_BITS = 16
+SEQUENCE_BITS = 64
+MAX_NODE_ID = (1 << NODE_ID_BITS) - 1
+# Fresh sequences start in the lower half, so a millisecond can hold 2^63 IDs before rolling over
+_SEQUENCE_SEED_BITS = SEQUENCE_BITS - 1
+ID_PREFIX = "message:"
+
+
+def _encode(value: int) -> str:
+    chars = [""] * _ID_LENGTH
+    for i in range(_ID_LENGTH - 1, -1, -1):
+        chars[i] = _ALPHABET[value & 31]
+        value >>= 5
+    return "".join(chars)
+
+
+def _node_id_from_env() -> Optional[int]:
+    value = os.environ.get("BIZZMQ_NODE_ID")
+    return int(value) if value else None
+
+
+class MessageIdGenerator:
+    """Thread-safe generator of monotonic IDs for one process."""
+
+    def __init__(self, node_id: Optional[int] = None) -> None:
+        self._lock = threading.Lock()
+        self._random = random.SystemRandom()
+        self._fixed_node_id = node_id is not None
+        self.node_id = self._validate(node_id) if node_id is not None else self._random.getrandbits(NODE_ID_BITS)
+        self._last_ms = 0
+        self._sequence = 0
+
+    @staticmethod
+    def _validate(node_id: int) -> int:
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f"node_id must be between 0 and {MAX_NODE_ID}")
+        return node_id
+
+    def set_node_id(self, node_id: int) -> None:
+        with self._lock:
+            self.node_id = self._validate(node_id)
+            self._fixed_node_id = True
+
+    def new_id(self) -> str:
+        with self._lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = self._random.getrandbits(_SEQUENCE_SEED_BITS)
+            else:
+                # Same millisecond, or the clock went back: stay on the last one and count up
+                self._sequence += 1
+                if self._sequence >> SEQUENCE_BITS:
+                    self._last_ms += 1
+                    self._sequence = self._random.getrandbits(_SEQUENCE_SEED_BITS)
+            value = (self._last_ms << (NODE_ID_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+        return _encode(value)
+
+    def _after_fork(self) -> None:
+        # A forked child would otherwise replay the parent's node and sequence
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        if not self._fixed_node_id:
+            self.node_id = self._random.getrandbits(NODE_ID_BITS)
+
+
+_generator = MessageIdGenerator(_node_id_from_env())
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_generator._after_fork)
+
+
+def set_node_id(node_id: int) -> None:
+    """Pin the node ID of this process, e.g. to a pod ordinal. IDs can't collide across producers that each have their own."""
+    _generator.set_node_id(node_id)
+
+
+def new_message_id() -> str:
+    """A fresh message ID, e.g. "message:01JA2XQ8G3K7M0000000000000"."""
+    return ID_PREFIX + _generator.new_id()
+
+
+def message_id_timestamp(message_id: str) -> int:
+    """Creation time, in Unix milliseconds, of an ID made by `new_message_id`."""
+    text = message_id[len(ID_PREFIX):] if message_id.startswith(ID_PREFIX) else message_id
+    if len(text) != _ID_LENGTH:
+        raise ValueError(f"Not a BizzMQ message ID: {message_id}")
+    value = 0
+    for char in text.upper():
+        digit = _ALPHABET.find(char)
+        if digit < 0:
+            raise ValueError(f"Not a BizzMQ message ID: {message_id}")
+        value = (value << 5) | digit
+    return value >> (NODE_ID_BITS + SEQUENCE_BITS)
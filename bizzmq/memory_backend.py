@@ -0,0 +1,361 @@
+"""
+In-process queue engine.
+
+`MemoryBackend` keeps queues in Python data structures behind one lock, for pipelines
+whose producers and consumers run in the same process and for tests. A message handed
+to `push` reaches a waiting `pop` through a condition variable, with no serialization
+and no network round trip.
+
+Queues follow the same rules as Redis queues: priority levels with the starvation
+limit, delayed messages, retries with backoff, a DLQ per queue, dedup keys, DLQ
+redrive and max_length with its overflow policies. Codec, compression and claim-check options have nothing to do here and are
+ignored. Everything is lost when the process exits.
+"""
+import copy
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import metrics
+from .backend import Backend, Delivery
+from .consumer import _build_dead_letter_message, _message_priority, _report_transition, _retry_outcomes
+from .dlq import DEFAULT_REDRIVE_BATCH_SIZE, _matches, _reset_for_redrive
+from .ids import new_message_id
+from .message import MessageOptions, build_envelope
+from .producer import QueueFullError, _dedup_ttl_ms, _record_publish
+from .queue import OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, STORAGE_STREAM, QueueOptions
+from .scheduler import due_time_ms
+from .scripts import RESULT_ALREADY_SETTLED, RESULT_DEAD_LETTERED, RESULT_DISCARDED, RESULT_REQUEUED, RESULT_SCHEDULED
+
+logger = logging.getLogger(__name__)
+
+
+class _MemoryQueue:
+    __slots__ = ("options", "ready", "scheduled", "dead_letters", "in_flight", "dedup", "not_empty", "not_full", "pops")
+
+    def __init__(self, options: QueueOptions, lock: threading.Lock) -> None:
+        self.options = options
+        # One FIFO per priority level, indexed by level
+        self.ready: List[Deque[Dict[str, Any]]] = [deque() for _ in range(max(options.priority_levels, 1))]
+        # Heap of (due ms, sequence, envelope)
+        self.scheduled: List[Tuple[int, int, Dict[str, Any]]] = []
+        # Oldest first
+        self.dead_letters: Deque[Dict[str, Any]] = deque()
+        self.in_flight: Dict[int, Dict[str, Any]] = {}
+        # dedup key -> (message ID, expiry on the monotonic clock)
+        self.dedup: Dict[str, Tuple[str, float]] = {}
+        self.not_empty = threading.Condition(lock)
+        # Producers blocked on a full queue wait here for pops
+        self.not_full = threading.Condition(lock)
+        self.pops = 0
+
+    def level(self, envelope: Dict[str, Any]) -> int:
+        # Clamped like queue_key does for Redis lists
+        return max(0, min(len(self.ready) - 1, _message_priority(envelope)))
+
+    def length(self) -> int:
+        return sum(len(ready) for ready in self.ready)
+
+    def depth(self) -> int:
+        # What max_length caps
+        return self.length() + len(self.scheduled)
+
+
+class MemoryBackend(Backend):
+    """
+    Thread-safe in-memory backend.
+
+    Messages are passed by reference, so a consumer gets the very object the producer
+    published. Set `copy_messages` to deep-copy them on push instead, which keeps a
+    producer that reuses or mutates its objects from changing queued messages.
+    """
+
+    def __init__(self, copy_messages: bool = False) -> None:
+        self.copy_messages = copy_messages
+        self._lock = threading.Lock()
+        self._queues: Dict[str, _MemoryQueue] = {}
+        # Tie-breaker for scheduled messages due at the same millisecond, and delivery receipts
+        self._sequence = itertools.count()
+
+    def create_queue(self, queue_name: str, options: Optional[QueueOptions] = None) -> None:
+        if not queue_name:
+            raise ValueError("Queue name is required")
+        options = options or QueueOptions()
+        if options.priority_levels < 0:
+            raise ValueError("priority_levels can't be negative")
+        if options.storage == STORAGE_STREAM:
+            raise ValueError("In-memory queues don't support stream storage")
+        if options.partitions:
+            raise ValueError("In-memory queues don't support partitions")
+        if options.max_length is not None and options.max_length < 1:
+            raise ValueError("max_length must be at least 1")
+        with self._lock:
+            if queue_name in self._queues:
+                logger.debug("Queue %s already exists", queue_name)
+                return
+            self._queues[queue_name] = _MemoryQueue(options, self._lock)
+        logger.info("Queue %s created", queue_name)
+
+    def get_queue_options(self, queue_name: str) -> Optional[QueueOptions]:
+        queue = self._queues.get(queue_name)
+        return queue.options if queue is not None else None
+
+    def push(self, queue_name: str, message: Any, options: Optional[MessageOptions] = None) -> str:
+        return self._push(queue_name, [message], options, single=True)[0]
+
+    def push_many(self, queue_name: str, messages: Iterable[Any], options: Optional[MessageOptions] = None, chunk_size: Optional[int] = None) -> List[str]:
+        # Everything is pushed under one lock acquisition, so chunk_size has no use here
+        if options is not None and options.dedup_key is not None:
+            raise ValueError("dedup_key applies to a single message, publish deduplicated messages one at a time")
+        return self._push(queue_name, list(messages), options, single=False)
+
+    def pop(self, queue_name: str, timeout: float) -> Optional[Delivery]:
+        deadline = None
+        with self._lock:
+            queue = self._require(queue_name)
+            while True:
+                now_ms = int(time.time() * 1000)
+                self._promote_due(queue, now_ms)
+                envelope = self._take(queue)
+                if envelope is not None:
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                if queue.scheduled:
+                    # Wake up when the next delayed message is due
+                    remaining = min(remaining, max(queue.scheduled[0][0] - now_ms, 1) / 1000)
+                queue.not_empty.wait(remaining)
+            receipt = next(self._sequence)
+            queue.in_flight[receipt] = envelope
+
+        message = envelope.get("message")
+        data = message if isinstance(message, dict) else {"data": message}
+        return Delivery(queue_name, envelope.get("message_id"), envelope, data, receipt)
+
+    def ack(self, delivery: Delivery) -> None:
+        with self._lock:
+            self._require(delivery.queue_name).in_flight.pop(delivery.receipt, None)
+
+    def requeue(self, delivery: Delivery, err: Exception) -> int:
+        with self._lock:
+            queue = self._require(delivery.queue_name)
+            envelope = queue.in_flight.pop(delivery.receipt, None)
+            if envelope is None:
+                return RESULT_ALREADY_SETTLED
+            options = queue.options
+            requeued, dead_letter, retry_count, delay, due_ms = _retry_outcomes(delivery.queue_name, options, envelope, err)
+            if retry_count <= options.max_retries:
+                if due_ms > 0:
+                    self._schedule(queue, due_ms, requeued)
+                    result = RESULT_SCHEDULED
+                else:
+                    self._ready(queue, requeued)
+                    result = RESULT_REQUEUED
+            elif options.config_dead_letter_queue:
+                queue.dead_letters.append(dead_letter)
+                result = RESULT_DEAD_LETTERED
+            else:
+                result = RESULT_DISCARDED
+        _report_transition(delivery.queue_name, result, retry_count, options.max_retries, delay)
+        return result
+
+    def dead_letter(self, delivery: Delivery, err: Exception) -> int:
+        with self._lock:
+            queue = self._require(delivery.queue_name)
+            envelope = queue.in_flight.pop(delivery.receipt, None)
+            if envelope is None:
+                return RESULT_ALREADY_SETTLED
+            if queue.options.config_dead_letter_queue:
+                queue.dead_letters.append(_build_dead_letter_message(delivery.queue_name, envelope, err))
+                result = RESULT_DEAD_LETTERED
+            else:
+                result = RESULT_DISCARDED
+        _report_transition(delivery.queue_name, result, 0, 0, 0)
+        return result
+
+    def queue_length(self, queue_name: str) -> int:
+        with self._lock:
+            return self._require(queue_name).length()
+
+    def queue_depth(self, queue_name: str) -> int:
+        with self._lock:
+            return self._require(queue_name).depth()
+
+    def in_flight_count(self, queue_name: str) -> int:
+        """Messages popped from the queue and not settled yet."""
+        with self._lock:
+            return len(self._require(queue_name).in_flight)
+
+    def dead_letter_count(self, queue_name: str) -> int:
+        with self._lock:
+            return len(self._require(queue_name).dead_letters)
+
+    def iter_dead_letter_messages(self, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            snapshot = list(self._require(queue_name).dead_letters)
+        for envelope in snapshot:
+            if _matches(envelope, error, original_queue):
+                yield dict(envelope)
+
+    def redrive_dead_letter_messages(self, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None, limit: Optional[int] = None, batch_size: int = DEFAULT_REDRIVE_BATCH_SIZE) -> int:
+        # Every move happens under one lock acquisition, so batch_size has no use here
+        moved = 0
+        with self._lock:
+            queue = self._require(queue_name)
+            kept: Deque[Dict[str, Any]] = deque()
+            for envelope in queue.dead_letters:
+                if (limit is not None and moved >= limit) or not _matches(envelope, error, original_queue):
+                    kept.append(envelope)
+                    continue
+                options = envelope.get("options") if isinstance(envelope.get("options"), dict) else {}
+                target_name = options.get("originalQueue") or queue_name
+                target = self._queues.get(target_name)
+                if target is None:
+                    logger.warning("Dead letter of queue %s kept, its original queue %s does not exist", queue_name, target_name)
+                    kept.append(envelope)
+                    continue
+                self._ready(target, _reset_for_redrive(envelope, target_name))
+                moved += 1
+            queue.dead_letters = kept
+        if moved:
+            logger.info("%d message(s) redriven from Dead Letter Queue %s_dlq", moved, queue_name)
+        return moved
+
+    def purge_dead_letter_messages(self, queue_name: str, error: Optional[str] = None, original_queue: Optional[str] = None) -> int:
+        with self._lock:
+            queue = self._require(queue_name)
+            before = len(queue.dead_letters)
+            if error is None and original_queue is None:
+                queue.dead_letters.clear()
+            else:
+                queue.dead_letters = deque(envelope for envelope in queue.dead_letters if not _matches(envelope, error, original_queue))
+            purged = before - len(queue.dead_letters)
+        logger.info("%d message(s) purged from Dead Letter Queue %s_dlq", purged, queue_name)
+        return purged
+
+    def _require(self, queue_name: str) -> _MemoryQueue:
+        queue = self._queues.get(queue_name)
+        if queue is None:
+            raise ValueError(f"❌ Queue \"{queue_name}\" does not exist. Create it first")
+        return queue
+
+    def _push(self, queue_name: str, messages: List[Any], options: Optional[MessageOptions], single: bool) -> List[str]:
+        if not queue_name:
+            raise ValueError("❌ Queue name not provided")
+        started = time.perf_counter() if metrics.enabled() else None
+        options = options or MessageOptions()
+        if self.copy_messages:
+            messages = copy.deepcopy(messages)
+        now_ms = int(time.time() * 1000)
+        due_ms = due_time_ms(options)
+        envelopes = [build_envelope(queue_name, new_message_id(), message, options, now_ms) for message in messages]
+
+        with self._lock:
+            queue = self._require(queue_name)
+            if single and options.dedup_key is not None:
+                existing_id = self._claim_dedup_key(queue, options, envelopes[0]["message_id"])
+                if existing_id is not None:
+                    logger.debug("Duplicate job skipped on queue %s - ID: %s", queue_name, existing_id)
+                    return [existing_id]
+            # Capped queues take batches in slices of max_length, each one made room for as a whole
+            step = queue.options.max_length or len(envelopes) or 1
+            for first in range(0, len(envelopes), step):
+                chunk = envelopes[first:first + step]
+                try:
+                    self._make_room(queue, queue_name, len(chunk))
+                except QueueFullError as e:
+                    if single and options.dedup_key is not None:
+                        queue.dedup.pop(options.dedup_key, None)
+                    e.message_ids = [envelope["message_id"] for envelope in envelopes[:first]]
+                    _record_publish(queue_name, started, first)
+                    raise
+                for envelope in chunk:
+                    if due_ms is None:
+                        self._ready(queue, envelope)
+                    else:
+                        self._schedule(queue, due_ms, envelope)
+
+        _record_publish(queue_name, started, len(envelopes))
+        return [envelope["message_id"] for envelope in envelopes]
+
+    def _claim_dedup_key(self, queue: _MemoryQueue, options: MessageOptions, message_id: str) -> Optional[str]:
+        now = time.monotonic()
+        existing = queue.dedup.get(options.dedup_key)
+        if existing is not None and existing[1] > now:
+            return existing[0]
+        if len(queue.dedup) > 1024:
+            # Drop expired keys now and then, so the map doesn't grow with every key ever used
+            queue.dedup = {key: entry for key, entry in queue.dedup.items() if entry[1] > now}
+        queue.dedup[options.dedup_key] = (message_id, now + _dedup_ttl_ms(options) / 1000)
+        return None
+
+    def _make_room(self, queue: _MemoryQueue, queue_name: str, count: int) -> None:
+        # Caller holds the lock. Same rules as the push_bounded script for Redis queues.
+        options = queue.options
+        if not options.max_length:
+            return
+        deadline = None
+        while queue.depth() + count > options.max_length:
+            if options.overflow == OVERFLOW_DROP_OLDEST:
+                dropped = self._drop_oldest(queue, queue.depth() + count - options.max_length)
+                logger.warning("Queue %s is full, dropped its %d oldest messages", queue_name, dropped)
+                metrics.count(metrics.MESSAGES_DROPPED, queue_name, dropped)
+                return
+            if options.overflow == OVERFLOW_BLOCK:
+                if deadline is None:
+                    deadline = time.monotonic() + options.overflow_timeout
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    queue.not_full.wait(remaining)
+                    continue
+            logger.debug("Queue %s is full, rejected %d messages", queue_name, count)
+            metrics.count(metrics.MESSAGES_REJECTED, queue_name, count)
+            raise QueueFullError(queue_name, options.max_length)
+
+    def _drop_oldest(self, queue: _MemoryQueue, excess: int) -> int:
+        # Oldest of the least urgent level first, then the scheduled messages due soonest
+        dropped = 0
+        for ready in queue.ready:
+            while ready and dropped < excess:
+                ready.popleft()
+                dropped += 1
+        while queue.scheduled and dropped < excess:
+            heapq.heappop(queue.scheduled)
+            dropped += 1
+        return dropped
+
+    def _ready(self, queue: _MemoryQueue, envelope: Dict[str, Any]) -> None:
+        # Caller holds the lock
+        queue.ready[queue.level(envelope)].append(envelope)
+        queue.not_empty.notify()
+
+    def _schedule(self, queue: _MemoryQueue, due_ms: int, envelope: Dict[str, Any]) -> None:
+        # Caller holds the lock. Waiters recompute how long to sleep, the new message may be due first
+        heapq.heappush(queue.scheduled, (due_ms, next(self._sequence), envelope))
+        queue.not_empty.notify_all()
+
+    def _promote_due(self, queue: _MemoryQueue, now_ms: int) -> None:
+        while queue.scheduled and queue.scheduled[0][0] <= now_ms:
+            _, _, envelope = heapq.heappop(queue.scheduled)
+            self._ready(queue, envelope)
+
+    def _take(self, queue: _MemoryQueue) -> Optional[Dict[str, Any]]:
+        # Most urgent level first, except every starvation_limit-th pop, as in the Redis consumer
+        levels = range(len(queue.ready) - 1, -1, -1)
+        limit = queue.options.starvation_limit
+        if len(queue.ready) > 1 and limit > 0 and queue.pops % limit == limit - 1:
+            levels = reversed(levels)
+        for level in levels:
+            if queue.ready[level]:
+                queue.pops += 1
+                if queue.options.max_length:
+                    queue.not_full.notify_all()
+                return queue.ready[level].popleft()
+        return None
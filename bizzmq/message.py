@@ -1,34 +1,64 @@
 from typing import Any, Dict, Optional, Union
 from dataclasses import dataclass, field
 import time
+
+# Default window, in seconds, in which a dedup_key rejects repeated publishes
+DEFAULT_DEDUP_TTL = 24 * 3600
+
 @dataclass
 class MessageOptions:
     priority: int  = 0
     retries: int = 1
+    # Seconds to hold the message back before consumers can see it
+    delay: float = 0
+    # Unix timestamp (seconds) to deliver the message at, takes precedence over delay
+    run_at: Optional[float] = None
+    # Publishes with the same key within dedup_ttl seconds enqueue the message only once
+    dedup_key: Optional[str] = None
+    dedup_ttl: float = DEFAULT_DEDUP_TTL
+    # Routes the message on partitioned queues, messages with the same key keep their order
+    partition_key: Optional[str] = None
 
 class Message:
-    def __init__(self, queue_name: str, message_id: str, message: Any, options:MessageOptions):
+    # Slots keep per-message overhead down when producers build many of them
+    __slots__ = ("queue_name", "message_id", "message", "options", "timestamp_created", "timestamp_updated", "status")
+
+    def __init__(self, queue_name: str, message_id: str, message: Any, options:MessageOptions, timestamp_created: Optional[int] = None):
         self.queue_name = queue_name
         self.message_id = message_id
         self.message = message
         self.options = options
-        self.timestamp_created = int(time.time() * 1000)
+        self.timestamp_created = timestamp_created if timestamp_created is not None else int(time.time() * 1000)
         self.timestamp_updated = self.timestamp_created
         self.status = "waiting"
     
     def to_json(self) -> Dict[str, Any]:
-        return {
-            "queue_name": self.queue_name,
-            "message_id": self.message_id,
-            "message": self.message,
-            "options": {
-                "priority": self.options.priority,
-                "retries": self.options.retries
-            },
-            "timestamp_created": self.timestamp_created,
-            "timestamp_updated": self.timestamp_updated,
-            "status": self.status
-        }
+        return build_envelope(self.queue_name, self.message_id, self.message, self.options, self.timestamp_created, self.timestamp_updated, self.status)
+
+    def pack(self, codec) -> Union[bytes, str]:
+        """The message serialized with `codec`, ready to be stored in Redis."""
+        return codec.encode(self.to_json())
+
+
+def build_envelope(queue_name: str, message_id: str, message: Any, options: MessageOptions, timestamp_created: int, timestamp_updated: Optional[int] = None, status: str = "waiting") -> Dict[str, Any]:
+    """
+    The envelope stored in Redis for a message.
+
+    Producers call this directly, so publishing builds a single envelope per message
+    without going through a Message object.
+    """
+    return {
+        "queue_name": queue_name,
+        "message_id": message_id,
+        "message": message,
+        "options": {
+            "priority": options.priority,
+            "retries": options.retries
+        },
+        "timestamp_created": timestamp_created,
+        "timestamp_updated": timestamp_created if timestamp_updated is None else timestamp_updated,
+        "status": status
+    }
 
 def update_lifecycle_status(message_obj, new_status):
     valid_states = ["waiting", "processing", "processed", "failed", "requeued"]
@@ -0,0 +1,150 @@
+"""
+Client-side cache of queue metadata.
+
+Publishing, consuming and failure handling all need a queue's options. Reading
+`queue_meta:<name>` on every call costs a round trip each time, so each Redis client
+gets a cache of parsed `QueueOptions` that is refreshed after a TTL. Entries can
+also be revalidated through the meta hash's `version` field, or dropped as soon as
+the hash changes through Redis keyspace notifications.
+"""
+import redis
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from .queue import QueueOptions
+
+# Seconds a cached entry is trusted without asking Redis
+DEFAULT_METADATA_TTL = 30.0
+
+
+class _Entry(NamedTuple):
+    options: QueueOptions
+    version: Optional[str]
+    expires_at: float
+
+
+class QueueMetadataCache:
+    """
+    Parsed queue options keyed by queue name.
+
+    With `validate_version=True` an expired entry is revalidated with a single-field
+    HGET of `version` and only re-read in full when the version changed. Missing
+    queues are never cached, so a queue created after a failed lookup is seen at once.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_METADATA_TTL, validate_version: bool = False) -> None:
+        if ttl < 0:
+            raise ValueError("ttl can't be negative")
+        self.ttl = ttl
+        self.validate_version = validate_version
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def get(self, redis_client: redis.Redis, queue_name: str) -> Optional[QueueOptions]:
+        """Options of `queue_name`, or None if the queue doesn't exist."""
+        entry = self._entries.get(queue_name)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry.options
+
+        meta_key = f"queue_meta:{queue_name}"
+        if entry is not None and self._can_revalidate(entry):
+            if _decode(redis_client.hget(meta_key, "version")) == entry.version:
+                return self._refresh(queue_name, entry)
+
+        return self._store(queue_name, redis_client.hgetall(meta_key))
+
+    async def get_async(self, redis_client: Any, queue_name: str) -> Optional[QueueOptions]:
+        """Same as `get` for a redis.asyncio client."""
+        entry = self._entries.get(queue_name)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry.options
+
+        meta_key = f"queue_meta:{queue_name}"
+        if entry is not None and self._can_revalidate(entry):
+            if _decode(await redis_client.hget(meta_key, "version")) == entry.version:
+                return self._refresh(queue_name, entry)
+
+        return self._store(queue_name, await redis_client.hgetall(meta_key))
+
+    def invalidate(self, queue_name: Optional[str] = None) -> None:
+        """Forget one queue, or every queue when no name is given."""
+        with self._lock:
+            if queue_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(queue_name, None)
+
+    def watch_keyspace(self, redis_client: redis.Redis) -> Callable[[], None]:
+        """
+        Invalidate entries as soon as their meta hash changes.
+
+        Needs keyspace notifications for hashes and generic commands enabled on the
+        server, e.g. `CONFIG SET notify-keyspace-events Khg`. Returns a function that
+        stops listening.
+        """
+        db = redis_client.connection_pool.connection_kwargs.get("db", 0)
+        prefix = f"__keyspace@{db}__:queue_meta:"
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+
+        def on_event(message: Dict[str, Any]) -> None:
+            self.invalidate(_decode(message["channel"])[len(prefix):])
+
+        pubsub.psubscribe(**{f"{prefix}*": on_event})
+        listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+        def stop() -> None:
+            listener.stop()
+            pubsub.close()
+
+        return stop
+
+    def _can_revalidate(self, entry: _Entry) -> bool:
+        return self.validate_version and entry.version is not None
+
+    def _refresh(self, queue_name: str, entry: _Entry) -> QueueOptions:
+        with self._lock:
+            self._entries[queue_name] = entry._replace(expires_at=time.monotonic() + self.ttl)
+        return entry.options
+
+    def _store(self, queue_name: str, queue_meta: Dict[Any, Any]) -> Optional[QueueOptions]:
+        if not queue_meta:
+            self.invalidate(queue_name)
+            return None
+
+        options = QueueOptions.from_meta(queue_meta)
+        version = _decode(queue_meta.get("version", queue_meta.get(b"version")))
+        with self._lock:
+            self._entries[queue_name] = _Entry(options, version, time.monotonic() + self.ttl)
+        return options
+
+
+def _decode(value: Any) -> Any:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+_caches: "weakref.WeakKeyDictionary[Any, QueueMetadataCache]" = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def metadata_cache(redis_client: Any) -> QueueMetadataCache:
+    """The metadata cache attached to `redis_client`, created with defaults on first use."""
+    cache = _caches.get(redis_client)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(redis_client)
+            if cache is None:
+                cache = _caches[redis_client] = QueueMetadataCache()
+    return cache
+
+
+def set_metadata_cache(redis_client: Any, cache: QueueMetadataCache) -> None:
+    """Attach a custom-configured cache to `redis_client`."""
+    with _caches_lock:
+        _caches[redis_client] = cache
+
+
+def get_queue_options(redis_client: redis.Redis, queue_name: str) -> Optional[QueueOptions]:
+    """Cached options of `queue_name` for a sync client, or None if the queue doesn't exist."""
+    return metadata_cache(redis_client).get(redis_client, queue_name)
@@ -0,0 +1,354 @@
+"""
+Metrics for BizzMQ producers and consumers.
+
+Instrumented code reports to every registered `MetricsSink`. With no sink registered
+(the default) each report is a single check of a module global, so the hot path pays
+nothing measurable. Register a sink to collect the metrics:
+
+    from bizzmq.metrics import InMemoryMetrics, add_metrics_sink
+    stats = InMemoryMetrics()
+    add_metrics_sink(stats)
+
+`PrometheusMetrics` and `OpenTelemetryMetrics` forward everything to those libraries.
+Other backends subclass `MetricsSink` and implement `counter`, `histogram` and `gauge`.
+Every metric carries a single `queue` label.
+"""
+import bisect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Counters
+MESSAGES_PUBLISHED = "bizzmq_messages_published_total"
+MESSAGES_PROCESSED = "bizzmq_messages_processed_total"
+MESSAGES_FAILED = "bizzmq_messages_failed_total"
+MESSAGES_RETRIED = "bizzmq_messages_retried_total"
+MESSAGES_DEAD_LETTERED = "bizzmq_messages_dead_lettered_total"
+MESSAGES_DISCARDED = "bizzmq_messages_discarded_total"
+MESSAGES_REJECTED = "bizzmq_messages_rejected_total"
+MESSAGES_DROPPED = "bizzmq_messages_dropped_total"
+# Histograms, in seconds
+PUBLISH_DURATION = "bizzmq_publish_duration_seconds"
+QUEUE_WAIT = "bizzmq_queue_wait_seconds"
+CALLBACK_DURATION = "bizzmq_callback_duration_seconds"
+# Gauges, sampled by `DepthSampler`
+QUEUE_DEPTH = "bizzmq_queue_depth"
+SCHEDULED_DEPTH = "bizzmq_scheduled_depth"
+DEAD_LETTER_DEPTH = "bizzmq_dead_letter_depth"
+
+DESCRIPTIONS = {
+    MESSAGES_PUBLISHED: "Messages published",
+    MESSAGES_PROCESSED: "Messages whose callback succeeded",
+    MESSAGES_FAILED: "Messages whose callback failed",
+    MESSAGES_RETRIED: "Failed messages requeued or scheduled for a retry",
+    MESSAGES_DEAD_LETTERED: "Messages moved to the dead letter queue",
+    MESSAGES_DISCARDED: "Failed messages dropped because the queue has no dead letter queue, or because moving them failed",
+    MESSAGES_REJECTED: "Messages not published because the queue was at its max_length",
+    MESSAGES_DROPPED: "Queued messages dropped to make room under the drop_oldest overflow policy",
+    PUBLISH_DURATION: "Time taken by a publish call",
+    QUEUE_WAIT: "Time from publish to the start of processing",
+    CALLBACK_DURATION: "Time spent in consumer callbacks",
+    QUEUE_DEPTH: "Messages ready to be consumed, plus unacknowledged ones on stream queues",
+    SCHEDULED_DEPTH: "Delayed messages and backed-off retries",
+    DEAD_LETTER_DEPTH: "Messages in the dead letter queue",
+}
+
+# Histogram buckets, in seconds, shared by the built-in sinks
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# Default seconds between two queue depth samples
+DEFAULT_SAMPLE_INTERVAL = 15.0
+
+
+class MetricsSink:
+    """Receives metrics. Methods are called from producer and consumer threads and must not block."""
+
+    def counter(self, name: str, queue: str, value: float = 1) -> None:
+        pass
+
+    def histogram(self, name: str, queue: str, value: float) -> None:
+        pass
+
+    def gauge(self, name: str, queue: str, value: float) -> None:
+        pass
+
+
+# Replaced, never mutated, so readers don't need the lock
+_sinks: Tuple[MetricsSink, ...] = ()
+_sinks_lock = threading.Lock()
+
+
+def add_metrics_sink(sink: MetricsSink) -> None:
+    global _sinks
+    with _sinks_lock:
+        _sinks = _sinks + (sink,)
+
+
+def remove_metrics_sink(sink: MetricsSink) -> None:
+    global _sinks
+    with _sinks_lock:
+        _sinks = tuple(s for s in _sinks if s is not sink)
+
+
+def enabled() -> bool:
+    """Whether anything collects metrics. Call sites skip timing work when it's False."""
+    return bool(_sinks)
+
+
+def count(name: str, queue: str, value: float = 1) -> None:
+    for sink in _sinks:
+        try:
+            sink.counter(name, queue, value)
+        except Exception:
+            logger.exception("Metrics sink %r failed", sink)
+
+
+def observe(name: str, queue: str, value: float) -> None:
+    for sink in _sinks:
+        try:
+            sink.histogram(name, queue, value)
+        except Exception:
+            logger.exception("Metrics sink %r failed", sink)
+
+
+def set_gauge(name: str, queue: str, value: float) -> None:
+    for sink in _sinks:
+        try:
+            sink.gauge(name, queue, value)
+        except Exception:
+            logger.exception("Metrics sink %r failed", sink)
+
+
+def observe_queue_wait(queue: str, envelopes: Iterable[Any]) -> None:
+    """Record how long each message waited, from its `timestamp_created` until now."""
+    if not _sinks:
+        return
+    now_ms = time.time() * 1000
+    for envelope in envelopes:
+        created = envelope.get("timestamp_created") if isinstance(envelope, dict) else None
+        if isinstance(created, (int, float)):
+            observe(QUEUE_WAIT, queue, max(now_ms - created, 0.0) / 1000)
+
+
+class InMemoryMetrics(MetricsSink):
+    """Keeps metrics in process, e.g. for tests, benchmarks or a custom /metrics endpoint."""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, str], float] = {}
+        self.gauges: Dict[Tuple[str, str], float] = {}
+        # (name, queue) -> [count, sum, per-bucket counts (last one is +Inf)]
+        self.histograms: Dict[Tuple[str, str], List[Any]] = {}
+
+    def counter(self, name: str, queue: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[(name, queue)] = self.counters.get((name, queue), 0) + value
+
+    def histogram(self, name: str, queue: str, value: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get((name, queue))
+            if histogram is None:
+                histogram = self.histograms[(name, queue)] = [0, 0.0, [0] * (len(self.buckets) + 1)]
+            histogram[0] += 1
+            histogram[1] += value
+            histogram[2][bisect.bisect_left(self.buckets, value)] += 1
+
+    def gauge(self, name: str, queue: str, value: float) -> None:
+        with self._lock:
+            self.gauges[(name, queue)] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Plain-data copy of every metric, keyed by "name{queue}"."""
+        with self._lock:
+            return {
+                "counters": {f"{n}{{{q}}}": v for (n, q), v in self.counters.items()},
+                "gauges": {f"{n}{{{q}}}": v for (n, q), v in self.gauges.items()},
+                "histograms": {
+                    f"{n}{{{q}}}": {"count": h[0], "sum": h[1], "buckets": dict(zip(self.buckets + (float("inf"),), h[2]))}
+                    for (n, q), h in self.histograms.items()
+                },
+            }
+
+
+class PrometheusMetrics(MetricsSink):
+    """Forwards metrics to prometheus_client. Needs `pip install prometheus-client`."""
+
+    def __init__(self, registry: Any = None, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        try:
+            import prometheus_client
+        except ImportError as e:
+            raise ImportError("PrometheusMetrics needs the prometheus-client package: pip install prometheus-client") from e
+        self._prometheus = prometheus_client
+        self._registry = registry if registry is not None else prometheus_client.REGISTRY
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+
+    def _metric(self, kind: str, name: str) -> Any:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    description = DESCRIPTIONS.get(name, name)
+                    if kind == "counter":
+                        # prometheus_client appends _total itself
+                        metric = self._prometheus.Counter(name[:-len("_total")] if name.endswith("_total") else name, description, ["queue"], registry=self._registry)
+                    elif kind == "histogram":
+                        metric = self._prometheus.Histogram(name, description, ["queue"], buckets=self._buckets, registry=self._registry)
+                    else:
+                        metric = self._prometheus.Gauge(name, description, ["queue"], registry=self._registry)
+                    self._metrics[name] = metric
+        return metric
+
+    def counter(self, name: str, queue: str, value: float = 1) -> None:
+        self._metric("counter", name).labels(queue).inc(value)
+
+    def histogram(self, name: str, queue: str, value: float) -> None:
+        self._metric("histogram", name).labels(queue).observe(value)
+
+    def gauge(self, name: str, queue: str, value: float) -> None:
+        self._metric("gauge", name).labels(queue).set(value)
+
+
+class OpenTelemetryMetrics(MetricsSink):
+    """Forwards metrics to an OpenTelemetry meter. Needs `pip install opentelemetry-api`."""
+
+    def __init__(self, meter: Any = None) -> None:
+        if meter is None:
+            try:
+                from opentelemetry import metrics as otel_metrics
+            except ImportError as e:
+                raise ImportError("OpenTelemetryMetrics needs the opentelemetry-api package: pip install opentelemetry-api") from e
+            meter = otel_metrics.get_meter("bizzmq")
+        self._meter = meter
+        self._lock = threading.Lock()
+        self._instruments: Dict[str, Any] = {}
+        # Sampled gauges are reported through observable gauges, which read the last sample
+        self._gauge_values: Dict[str, Dict[str, float]] = {}
+
+    def _instrument(self, kind: str, name: str) -> Any:
+        instrument = self._instruments.get(name)
+        if instrument is None:
+            with self._lock:
+                instrument = self._instruments.get(name)
+                if instrument is None:
+                    description = DESCRIPTIONS.get(name, name)
+                    if kind == "counter":
+                        instrument = self._meter.create_counter(name, description=description)
+                    elif kind == "histogram":
+                        instrument = self._meter.create_histogram(name, unit="s", description=description)
+                    else:
+                        values = self._gauge_values.setdefault(name, {})
+                        instrument = self._meter.create_observable_gauge(name, callbacks=[self._gauge_callback(values)], description=description)
+                    self._instruments[name] = instrument
+        return instrument
+
+    def _gauge_callback(self, values: Dict[str, float]) -> Callable[[Any], List[Any]]:
+        from opentelemetry.metrics import Observation
+
+        def callback(options: Any) -> List[Any]:
+            return [Observation(value, {"queue": queue}) for queue, value in list(values.items())]
+        return callback
+
+    def counter(self, name: str, queue: str, value: float = 1) -> None:
+        self._instrument("counter", name).add(value, {"queue": queue})
+
+    def histogram(self, name: str, queue: str, value: float) -> None:
+        self._instrument("histogram", name).record(value, {"queue": queue})
+
+    def gauge(self, name: str, queue: str, value: float) -> None:
+        self._instrument("gauge", name)
+        self._gauge_values[name][queue] = value
+
+
+class DepthSampler:
+    """
+    Samples the depth of queues, their scheduled sets and their DLQs into gauges.
+
+    Every `interval` seconds one pipeline reads LLEN of each queue's lists, ZCARD of
+    its scheduled set and LLEN of its DLQ, summed over the partitions of partitioned
+    queues. Stream queues report their consumer group's lag plus pending entries
+    instead, read in a second pipeline. Samples are only taken while a metrics sink is
+    registered.
+    """
+
+    def __init__(self, redis_client: Any, queue_names: Iterable[str], interval: float = DEFAULT_SAMPLE_INTERVAL) -> None:
+        if interval <= 0:
+            raise ValueError("interval must be greater than 0")
+        self.redis_client = redis_client
+        self.queue_names = list(queue_names)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self) -> Dict[str, Dict[str, int]]:
+        """Read every depth once and report it. Returns {queue: {metric: depth}}."""
+        from .dlq import dead_letter_key
+        from .metadata import get_queue_options
+        from .queue import STORAGE_STREAM, QueueOptions, partition_queue_names, priority_queue_keys
+        from .scheduler import scheduled_key
+        from .streams import stream_depths
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        layout = []
+        streams: List[str] = []
+        for queue_name in self.queue_names:
+            options = get_queue_options(self.redis_client, queue_name) or QueueOptions()
+            # A partitioned queue is reported under its own name, summed over its partitions
+            partitions = partition_queue_names(queue_name, options) or [queue_name]
+            if options.storage == STORAGE_STREAM:
+                # Read separately, acknowledged entries still count towards XLEN
+                ready_keys = 0
+                stream_slice = (len(streams), len(streams) + len(partitions))
+                streams.extend(partitions)
+            else:
+                ready_keys = max(options.priority_levels, 1) * len(partitions)
+                stream_slice = None
+                for name in partitions:
+                    for key in priority_queue_keys(name, options.priority_levels):
+                        pipe.llen(key)
+            for name in partitions:
+                pipe.zcard(scheduled_key(name))
+            for name in partitions:
+                pipe.llen(dead_letter_key(name))
+            layout.append((queue_name, ready_keys, len(partitions), stream_slice))
+        results = pipe.execute()
+        stream_ready = stream_depths(self.redis_client, streams) if streams else []
+
+        depths: Dict[str, Dict[str, int]] = {}
+        position = 0
+        for queue_name, ready_keys, partitions, stream_slice in layout:
+            scheduled_at = position + ready_keys
+            dead_letters_at = scheduled_at + partitions
+            ready = results[position:scheduled_at] if stream_slice is None else stream_ready[stream_slice[0]:stream_slice[1]]
+            depths[queue_name] = {
+                QUEUE_DEPTH: sum(ready),
+                SCHEDULED_DEPTH: sum(results[scheduled_at:dead_letters_at]),
+                DEAD_LETTER_DEPTH: sum(results[dead_letters_at:dead_letters_at + partitions]),
+            }
+            position = dead_letters_at + partitions
+            for name, value in depths[queue_name].items():
+                set_gauge(name, queue_name, value)
+        return depths
+
+    def start(self) -> Callable[[], None]:
+        """Sample on a background thread. Returns a function that stops it."""
+        def run():
+            while not self._stop.wait(self.interval):
+                if not _sinks:
+                    continue
+                try:
+                    self.sample()
+                except Exception:
+                    logger.warning("Failed to sample queue depths", exc_info=True)
+
+        self._thread = threading.Thread(target=run, name="bizzmq-depth-sampler", daemon=True)
+        self._thread.start()
+        return self.stop
+
+    def stop(self) -> None:
+        self._stop.set()
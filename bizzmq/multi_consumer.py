@@ -0,0 +1,264 @@
+"""
+One consumer serving many queues.
+
+`consume_from_queues` takes a callback per queue and serves all of them with one
+fetch thread, one scheduler thread and one worker pool, whatever the number of
+queues. The fetch thread waits on every queue at once with a single multi-key BRPOP,
+so idle queues cost nothing, and all Redis calls go through the client's shared
+connection pool.
+
+Queues are served in proportion to their weights while they have a backlog (see
+`WeightedFairOrder`). Queues that are empty never hold the others back.
+"""
+import functools
+import logging
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import redis
+
+from .consumer import (
+    DEFAULT_BLOCK_TIMEOUT,
+    _ProcessPool,
+    _callback_finished,
+    _callback_started,
+    _decode_message,
+    _move_message_to_dlq,
+    _release_payloads,
+    _report_failed_move,
+    _requeue_message,
+)
+from . import metrics
+from .message import update_lifecycle_status
+from .metadata import get_queue_options
+from .cluster import is_cluster, key_slot
+from .queue import STORAGE_STREAM, QueueOptions, partition_options, partition_queue_names, priority_queue_keys
+from .scheduler import SCHEDULER_POLL_INTERVAL, next_poll_delay, promote_due_messages
+from .scripts import preload_scripts
+
+logger = logging.getLogger(__name__)
+
+
+class WeightedFairOrder:
+    """
+    Order in which a multi-queue consumer tries its queues, by start-time fair queuing.
+
+    Each queue has a finish tag that moves forward by 1/weight whenever one of its
+    messages is served, and pops try queues with the smallest tag first. Under a
+    backlog every queue gets a share of pops proportional to its weight. Tags of idle
+    queues are caught up to the current virtual time, so a queue that was empty for a
+    while gets its fair share again instead of a burst.
+    """
+
+    def __init__(self, weights: Dict[str, float]) -> None:
+        self.weights = dict(weights)
+        self._finish = {queue_name: 0.0 for queue_name in self.weights}
+        self._virtual_time = 0.0
+
+    def order(self) -> List[str]:
+        virtual_time = self._virtual_time
+        # Ties go to the heavier queue
+        return sorted(self.weights, key=lambda q: (max(self._finish[q], virtual_time), -self.weights[q]))
+
+    def served(self, queue_name: str) -> None:
+        start = max(self._finish[queue_name], self._virtual_time)
+        self._finish[queue_name] = start + 1.0 / self.weights[queue_name]
+        self._virtual_time = start
+
+
+def consume_from_queues(redis_client: redis.Redis, handlers: Dict[str, Callable[[Dict[str, Any]], None]], weights: Optional[Dict[str, float]] = None, block_timeout: float = DEFAULT_BLOCK_TIMEOUT, concurrency: int = 1, prefetch: int = 0, executor: str = "thread") -> Tuple[Callable, Optional[Exception]]:
+    """
+    Start consuming several queues on shared threads, each with its own callback.
+
+    `handlers` maps queue names to callbacks. `weights` (default 1 per queue) sets
+    each queue's share of pops while several queues have a backlog. Every pop is a
+    single BRPOP over all the queues' lists, ordered by `WeightedFairOrder`, so the
+    consumer holds one blocking connection no matter how many queues it serves.
+
+    `concurrency`, `prefetch` and `executor` work as in `consume_message_from_queue`,
+    and the `concurrency + prefetch` slots are shared by all queues. Delayed messages
+    and retries of every queue are promoted by one scheduler thread. Failed messages
+    are retried or dead-lettered according to their own queue's options. Partitioned
+    queues are served through all of their partitions.
+
+    Messages are popped at most once, like the default mode of
+    `consume_message_from_queue`. Reliable delivery and stream queues need one
+    consumer per queue.
+    """
+    if not handlers:
+        return None, Exception("❌ No queues to consume")
+    if block_timeout <= 0:
+        return None, Exception("❌ block_timeout must be greater than 0")
+    if executor not in ("thread", "process"):
+        return None, Exception(f"❌ Unknown executor \"{executor}\", expected \"thread\" or \"process\"")
+    if concurrency < 1:
+        return None, Exception("❌ concurrency must be at least 1")
+    if prefetch < 0:
+        return None, Exception("❌ prefetch can't be negative")
+
+    weights = weights or {}
+    unknown = set(weights) - set(handlers)
+    if unknown:
+        return None, Exception(f"❌ Weights given for queues without a handler: {', '.join(sorted(unknown))}")
+    if any(weight <= 0 for weight in weights.values()):
+        return None, Exception("❌ Queue weights must be greater than 0")
+
+    queue_options: Dict[str, QueueOptions] = {}
+    try:
+        for queue_name in handlers:
+            queue_options[queue_name] = get_queue_options(redis_client, queue_name) or QueueOptions()
+    except Exception as e:
+        return None, Exception(f"Failed to get queue options: {str(e)}")
+    # Partitioned queues are served through their partitions, which split the queue's weight
+    handlers, weights, queue_options = _expand_partitions(handlers, weights, queue_options)
+    streams = [queue_name for queue_name, options in queue_options.items() if options.storage == STORAGE_STREAM]
+    if streams:
+        return None, Exception(f"❌ Stream queues can't share a consumer, consume them with consume_message_from_queue: {', '.join(streams)}")
+
+    callbacks = dict(handlers)
+    process_pool = None
+    if executor == "process":
+        try:
+            for callback in callbacks.values():
+                pickle.dumps(callback)
+        except Exception as e:
+            return None, Exception(f"❌ executor=\"process\" needs picklable callbacks such as module-level functions: {str(e)}")
+        process_pool = _ProcessPool(concurrency)
+        callbacks = {queue_name: functools.partial(process_pool.run, callback) for queue_name, callback in callbacks.items()}
+
+    try:
+        preload_scripts(redis_client)
+    except Exception as e:
+        return None, Exception(f"Failed to load queue scripts: {str(e)}")
+
+    fair_order = WeightedFairOrder({queue_name: weights.get(queue_name, 1) for queue_name in handlers})
+    # Lists of each queue, most urgent first, and the queue each list belongs to
+    queue_keys = {queue_name: priority_queue_keys(queue_name, options.priority_levels) for queue_name, options in queue_options.items()}
+    queue_of_key = {key: queue_name for queue_name, keys in queue_keys.items() for key in keys}
+    if is_cluster(redis_client) and len({key_slot(key) for key in queue_of_key}) > 1:
+        # A multi-key BRPOP only works within one slot
+        return None, Exception("❌ On Redis Cluster, queues consumed together need a common hash tag such as {jobs}:emails and {jobs}:reports")
+    pops = {queue_name: 0 for queue_name in handlers}
+    should_stop = threading.Event()
+
+    def keys_of(queue_name: str) -> List[str]:
+        # Same anti-starvation rotation as a single-queue consumer, counted per queue
+        keys = queue_keys[queue_name]
+        limit = queue_options[queue_name].starvation_limit
+        if len(keys) > 1 and limit > 0 and pops[queue_name] % limit == limit - 1:
+            return keys[::-1]
+        return keys
+
+    def pop_message() -> Optional[Tuple[str, Any]]:
+        keys = [key for queue_name in fair_order.order() for key in keys_of(queue_name)]
+        # BRPOP takes the first non-empty list in this order, or parks until any of them gets a message
+        result = redis_client.brpop(keys, timeout=block_timeout)
+        if not result:
+            return None
+        key, message = result
+        queue_name = queue_of_key[key.decode('utf-8') if isinstance(key, bytes) else key]
+        pops[queue_name] += 1
+        fair_order.served(queue_name)
+        return queue_name, message
+
+    def process_job(queue_name: str, data: Any) -> None:
+        try:
+            message_obj, message_data = _decode_message(data, redis_client.get)
+        except ValueError as e:
+            logger.error("Failed to parse message from queue %s: %s", queue_name, e)
+            return
+
+        started = _callback_started(queue_name, (message_obj,))
+        try:
+            callbacks[queue_name](message_data)
+        except Exception as err:
+            _callback_finished(queue_name, started, failed=1)
+            logger.warning("Error processing message from queue %s: %s", queue_name, err)
+            message_obj = update_lifecycle_status(message_obj, "failed")
+            options = queue_options[queue_name]
+            if not options.config_dead_letter_queue:
+                logger.warning("Message failed on queue %s but no DLQ configured", queue_name)
+                metrics.count(metrics.MESSAGES_DISCARDED, queue_name)
+            else:
+                if options.max_retries > 0:
+                    move_err = _requeue_message(redis_client, queue_name, message_obj, err)
+                else:
+                    move_err = _move_message_to_dlq(redis_client, queue_name, message_obj, err)
+                if move_err:
+                    _report_failed_move(queue_name, move_err, False)
+            return
+        _callback_finished(queue_name, started, processed=1)
+        _release_payloads(redis_client, [message_obj])
+
+    slots = threading.BoundedSemaphore(concurrency + prefetch)
+    thread_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bizzmq-worker-multi") if concurrency > 1 else None
+
+    def run_job(queue_name: str, message: Any) -> None:
+        try:
+            process_job(queue_name, message)
+        finally:
+            slots.release()
+
+    def worker_thread():
+        while not should_stop.is_set():
+            if not slots.acquire(timeout=block_timeout):
+                continue
+            try:
+                popped = pop_message()
+            except Exception as e:
+                slots.release()
+                logger.error("Error popping message from queues: %s", e)
+                should_stop.wait(block_timeout)
+                continue
+
+            if popped is None:
+                slots.release()
+            elif thread_pool is None:
+                run_job(*popped)
+            else:
+                thread_pool.submit(run_job, *popped)
+
+    def scheduler_thread():
+        # One pass promotes every queue, then sleeps until the earliest one needs another
+        delay = 0.0
+        while not should_stop.wait(delay):
+            delay = SCHEDULER_POLL_INTERVAL
+            for queue_name, options in queue_options.items():
+                try:
+                    moved, next_due = promote_due_messages(redis_client, queue_name, options.priority_levels)
+                    delay = min(delay, next_poll_delay(moved, next_due))
+                except Exception as e:
+                    logger.error("Error promoting scheduled messages of queue %s: %s", queue_name, e)
+
+    worker = threading.Thread(target=worker_thread, name="bizzmq-consumer-multi")
+    worker.daemon = True
+    worker.start()
+
+    scheduler = threading.Thread(target=scheduler_thread, name="bizzmq-scheduler-multi")
+    scheduler.daemon = True
+    scheduler.start()
+
+    def cleanup():
+        should_stop.set()
+        if threading.current_thread() is not worker:
+            worker.join(block_timeout + 1)
+        in_worker = threading.current_thread().name.startswith("bizzmq-worker-multi")
+        if thread_pool is not None:
+            thread_pool.shutdown(wait=not in_worker)
+        if process_pool is not None:
+            process_pool.shutdown(wait=not in_worker)
+
+    return cleanup, None
+
+
+def _expand_partitions(handlers: Dict[str, Callable], weights: Dict[str, float], queue_options: Dict[str, QueueOptions]) -> Tuple[Dict[str, Callable], Dict[str, float], Dict[str, QueueOptions]]:
+    expanded_handlers, expanded_weights, expanded_options = {}, {}, {}
+    for queue_name, options in queue_options.items():
+        names = partition_queue_names(queue_name, options) or [queue_name]
+        for name in names:
+            expanded_handlers[name] = handlers[queue_name]
+            expanded_weights[name] = weights.get(queue_name, 1) / len(names)
+            expanded_options[name] = partition_options(options) if options.partitions else options
+    return expanded_handlers, expanded_weights, expanded_options
@@ -0,0 +1,211 @@
+"""
+Payload compression and claim-check offloading.
+
+Queues can shrink large payloads in two ways, both configured in `QueueOptions`:
+
+- Compression: payloads of at least `compression_threshold` bytes are compressed
+  with zlib, lz4 or zstd and stored inline in the envelope (base64 encoded for the
+  JSON codecs).
+- Claim check: payloads of at least `claim_check_threshold` bytes (after any
+  compression) are written to their own key (`queue_payload:<name>:<id>`) with a
+  TTL of `claim_check_ttl` seconds. The envelope only keeps a reference, so lists,
+  retries and the DLQ never copy the payload again.
+
+Only the payload is transformed, the rest of the envelope stays readable, so retries
+and scheduled promotions never decompress or fetch anything. Consumers hand such
+messages to the callback as a `LazyPayload` that decodes (or fetches) the payload on
+first access.
+"""
+import base64
+import uuid
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from .codecs import Codec, decode_value
+from .message import MessageOptions, build_envelope
+
+# Default smallest payload, in bytes, worth compressing
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+# Default lifetime, in seconds, of an offloaded payload
+DEFAULT_CLAIM_CHECK_TTL = 7 * 24 * 3600
+
+# Envelope fields of a transformed payload. "message" is dropped when they're set.
+PAYLOAD_FIELD = "payload"
+PAYLOAD_REF_FIELD = "payload_ref"
+PAYLOAD_ENCODING_FIELD = "payload_encoding"
+# Encoding of a payload that was offloaded without compression
+IDENTITY_ENCODING = "identity"
+
+
+class ClaimCheckError(LookupError):
+    """The offloaded payload of a message has expired or was deleted."""
+
+
+def _zlib() -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    import zlib
+    return zlib.compress, zlib.decompress
+
+
+def _lz4() -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    try:
+        import lz4.frame
+    except ImportError as e:
+        raise ImportError("lz4 compression needs the lz4 package: pip install lz4") from e
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+def _zstd() -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd compression needs the zstandard package: pip install zstandard") from e
+    return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+
+
+_compressor_loaders = {"zlib": _zlib, "lz4": _lz4, "zstd": _zstd}
+_compressors: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {}
+
+
+def get_compressor(name: str) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    """(compress, decompress) functions of the algorithm called `name`."""
+    compressor = _compressors.get(name)
+    if compressor is None:
+        loader = _compressor_loaders.get(name)
+        if loader is None:
+            raise ValueError(f"Unknown compression \"{name}\", expected one of {', '.join(sorted(_compressor_loaders))}")
+        compressor = _compressors[name] = loader()
+    return compressor
+
+
+def payload_key(queue_name: str) -> str:
+    """A fresh key for an offloaded payload of `queue_name`."""
+    return f"queue_payload:{queue_name}:{uuid.uuid4().hex}"
+
+
+class PayloadPacker:
+    """
+    Builds the envelopes of one publish call, compressing or offloading payloads as configured.
+
+    Offloaded payloads are collected in `offloaded` and must be written with
+    `write_offloaded` before (or in the same pipeline as) the envelopes that reference them.
+    """
+
+    def __init__(self, codec: Codec, queue_name: str, queue_options: Any) -> None:
+        self.codec = codec
+        self.queue_name = queue_name
+        self.compression = queue_options.compression
+        self.compression_threshold = queue_options.compression_threshold
+        self.claim_check_threshold = queue_options.claim_check_threshold
+        self.claim_check_ttl = queue_options.claim_check_ttl
+        thresholds = [t for t in (self.compression_threshold if self.compression else None, self.claim_check_threshold) if t is not None]
+        self.enabled = bool(thresholds)
+        # Payloads below this size are stored as they are
+        self._min_size = min(thresholds) if thresholds else 0
+        self.offloaded: List[Tuple[str, bytes]] = []
+
+    def pack(self, message_id: str, payload: Any, options: MessageOptions, timestamp: int) -> Union[bytes, str]:
+        envelope = build_envelope(self.queue_name, message_id, payload, options, timestamp)
+        if self.enabled:
+            self._shrink(envelope, payload)
+        return self.codec.encode(envelope)
+
+    def write_offloaded(self, redis_client: Any) -> None:
+        """SET every offloaded payload with its TTL. Works on clients and pipelines alike."""
+        for key, data in self.offloaded:
+            redis_client.set(key, data, ex=self.claim_check_ttl)
+        self.offloaded = []
+
+    def _shrink(self, envelope: Dict[str, Any], payload: Any) -> None:
+        data = self.codec.encode(payload)
+        data = data.encode('utf-8') if isinstance(data, str) else data
+        # Small payloads aren't touched at all, so the fast path costs one extra encode
+        if len(data) < self._min_size:
+            return
+
+        encoding = IDENTITY_ENCODING
+        if self.compression and len(data) >= self.compression_threshold:
+            compressed = get_compressor(self.compression)[0](data)
+            # Incompressible payloads (e.g. already compressed media) are kept as they are
+            if len(compressed) < len(data):
+                data, encoding = compressed, self.compression
+
+        if self.claim_check_threshold and len(data) >= self.claim_check_threshold:
+            key = payload_key(self.queue_name)
+            self.offloaded.append((key, data))
+            envelope[PAYLOAD_REF_FIELD] = key
+        elif encoding != IDENTITY_ENCODING:
+            envelope[PAYLOAD_FIELD] = data if self.codec.binary else base64.b64encode(data).decode('ascii')
+        else:
+            return
+
+        envelope[PAYLOAD_ENCODING_FIELD] = encoding
+        del envelope["message"]
+
+
+def has_packed_payload(envelope: Dict[str, Any]) -> bool:
+    return PAYLOAD_ENCODING_FIELD in envelope
+
+
+def unpack_payload(envelope: Dict[str, Any], fetch: Optional[Callable[[str], Optional[bytes]]] = None) -> Any:
+    """
+    The original payload of a compressed or offloaded envelope.
+
+    `fetch` reads an offloaded payload by key (e.g. `redis_client.get`). Raises
+    ClaimCheckError if the payload is gone.
+    """
+    encoding = envelope[PAYLOAD_ENCODING_FIELD]
+    if PAYLOAD_REF_FIELD in envelope:
+        if fetch is None:
+            raise ClaimCheckError("Offloaded payloads need a Redis client to be fetched")
+        data = fetch(envelope[PAYLOAD_REF_FIELD])
+        if data is None:
+            raise ClaimCheckError(f"Payload {envelope[PAYLOAD_REF_FIELD]} has expired or was deleted")
+    else:
+        data = envelope[PAYLOAD_FIELD]
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+
+    if encoding != IDENTITY_ENCODING:
+        data = get_compressor(encoding)[1](data)
+    return decode_value(data)
+
+
+class LazyPayload(Mapping):
+    """
+    Message data whose payload is only decompressed or fetched on first access.
+
+    Behaves like the read-only dict consumers normally receive. Call `load()` (or
+    `dict(data)`) for a plain dict.
+    """
+
+    __slots__ = ("_envelope", "_fetch", "_data")
+
+    def __init__(self, envelope: Dict[str, Any], fetch: Optional[Callable[[str], Optional[bytes]]] = None) -> None:
+        self._envelope = envelope
+        self._fetch = fetch
+        self._data: Optional[Dict[str, Any]] = None
+
+    def load(self) -> Dict[str, Any]:
+        if self._data is None:
+            payload = unpack_payload(self._envelope, self._fetch)
+            # Same shape as uncompressed messages: dicts as they are, anything else under "data"
+            self._data = payload if isinstance(payload, dict) else {"data": payload}
+        return self._data
+
+    def __getitem__(self, key: Any) -> Any:
+        return self.load()[key]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.load())
+
+    def __len__(self) -> int:
+        return len(self.load())
+
+    def __repr__(self) -> str:
+        if self._data is None:
+            return f"LazyPayload(<{self._envelope[PAYLOAD_ENCODING_FIELD]} payload not loaded>)"
+        return f"LazyPayload({self._data!r})"
+
+    def __reduce__(self) -> Any:
+        # Crossing a process boundary loads the payload first, the copy is a plain dict
+        return (dict, (self.load(),))
@@ -1,34 +1,351 @@
+import logging
 import redis
 import time
-from .message import Message
-from typing import Any, Dict, Optional, Union
-import json
+from . import metrics
+from .cluster import partition_name, route_partition
+from .codecs import get_codec
+from .ids import new_message_id
+from .message import MessageOptions
+from .payloads import PayloadPacker
+from .metadata import get_queue_options
+from .queue import OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, STORAGE_STREAM, QueueOptions, partition_queue_names, priority_queue_keys, queue_key
+from .scheduler import due_time_ms, scheduled_key
+from .scripts import run_script
+from .streams import add_to_stream, queue_stream_depth, stream_depth
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Number of messages packed into a single LPUSH call by the batch publisher
+DEFAULT_PUBLISH_CHUNK_SIZE = 500
+# Number of LPUSH chunks queued on a pipeline before it's flushed to Redis
+PIPELINE_CHUNKS_PER_FLUSH = 8
+# Bounds of the backoff between checks while a "block" publish waits for room, in seconds
+OVERFLOW_POLL_MIN_DELAY = 0.005
+OVERFLOW_POLL_MAX_DELAY = 0.1
+
+
+class QueueFullError(RuntimeError):
+    """
+    A publish found the queue at its `max_length` (overflow "reject", or "block" once
+    `overflow_timeout` ran out).
+
+    Nothing of the rejected message or chunk was enqueued. For batch publishes,
+    `message_ids` holds the IDs of the messages published before the queue filled up.
+    """
+    def __init__(self, queue_name: str, max_length: int, message_ids: Optional[List[str]] = None):
+        super().__init__(f"❌ Queue \"{queue_name}\" is full ({max_length} messages)")
+        self.queue_name = queue_name
+        self.max_length = max_length
+        self.message_ids = message_ids or []
+
 
 def publish_message_to_queue(redis_client: redis.Redis , queue_name:str , message:Any , message_options: "MessageOptions") -> str:
     if not queue_name:
         raise ValueError("❌ Queue name not provided")
     
-    queue_meta_key = f"queue_meta:{queue_name}"
-    queue_key = f"queue:{queue_name}"
-
-    exists = redis_client.exists(queue_meta_key)
-
-    if not exists:
-        raise ValueError(f"❌ Queue \"{queue_name}\" does not exist. Create it first")
+    started = time.perf_counter() if metrics.enabled() else None
+    queue_options = _require_queue_options(redis_client, queue_name)
+    options = message_options or MessageOptions()
+    # Duplicates of a dedup key go to the same partition, so the first one's ID can be returned
+    target = target_queue(queue_name, queue_options, options.partition_key or options.dedup_key)
+    target_key = queue_key(target, options.priority, queue_options.priority_levels)
     
-    message_id = f"message:{int(time.time() * 1000)}"
-    message_obj = Message(queue_name, message_id, message, message_options)
+    now_ms = int(time.time() * 1000)
+    message_id = new_message_id()
+    packer = PayloadPacker(get_codec(queue_options.codec), queue_name, queue_options)
+    message_json = _serialize_message(packer, message_id, message, options, now_ms)
 
-    try:
-        message_json = json.dumps(message_obj.to_json())
-    except (TypeError, ValueError) as e:
-        raise RuntimeError(f"Failed to marshal message: {str(e)}")
+    if options.dedup_key is not None:
+        existing_id = _claim_dedup_key(redis_client, queue_name, options, message_id)
+        if existing_id is not None:
+            logger.debug("Duplicate job skipped on queue %s - ID: %s", queue_name, existing_id)
+            return existing_id
     
+    due_ms = due_time_ms(options)
+    payload_keys = [key for key, _ in packer.offloaded]
     try:
-        redis_client.lpush(queue_key, message_json)
+        if packer.offloaded:
+            # Payloads go in first so a consumer never sees a reference it can't resolve
+            packer.write_offloaded(redis_client)
+        if queue_options.max_length:
+            # Capped queues check their length and push in one script, so producers can't race past the cap
+            _push_bounded(redis_client, queue_name, target, queue_options, options.priority, [message_json], due_ms)
+        elif due_ms is None and queue_options.storage == STORAGE_STREAM:
+            add_to_stream(redis_client, target, message_json, queue_options.stream_max_length)
+        elif due_ms is None:
+            redis_client.lpush(target_key, message_json)
+        else:
+            # Delayed messages wait in the scheduled set until a consumer promotes them
+            redis_client.zadd(scheduled_key(target), {message_json: due_ms})
+    except QueueFullError:
+        if options.dedup_key is not None:
+            _release_dedup_key(redis_client, queue_name, options.dedup_key)
+        _delete_payloads(redis_client, payload_keys)
+        raise
     except Exception as e:
+        if options.dedup_key is not None:
+            # Let the caller's retry through, nothing was enqueued under this key
+            _release_dedup_key(redis_client, queue_name, options.dedup_key)
+        _delete_payloads(redis_client, payload_keys)
         raise RuntimeError(f"Failed to push message to queue: {str(e)}")
 
-    print(f"📩 Job added to queue \"{queue_name}\" - ID: {message_id}")
+    _record_publish(queue_name, started, 1)
+    if due_ms is None:
+        logger.debug("Job added to queue %s - ID: %s", queue_name, message_id)
+    else:
+        logger.debug("Job scheduled on queue %s - ID: %s", queue_name, message_id)
     return message_id
 
+
+def publish_messages_to_queue(redis_client: redis.Redis, queue_name: str, messages: Iterable[Any], message_options: Optional["MessageOptions"] = None, chunk_size: int = DEFAULT_PUBLISH_CHUNK_SIZE) -> List[str]:
+    """
+    Publish many messages to a queue using pipelined, multi-value LPUSH calls.
+
+    The queue is looked up once, then messages are consumed from the iterable in
+    chunks of `chunk_size`, so generators are streamed without being loaded into
+    memory. Returns the IDs of all published messages, in publish order.
+    """
+    if not queue_name:
+        raise ValueError("❌ Queue name not provided")
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be a positive integer")
+    if message_options is not None and message_options.dedup_key is not None:
+        raise ValueError("dedup_key identifies a single message, publish deduplicated messages with publish_message_to_queue")
+
+    started = time.perf_counter() if metrics.enabled() else None
+    queue_options = _require_queue_options(redis_client, queue_name)
+    options = message_options or MessageOptions()
+    due_ms = due_time_ms(message_options)
+    if queue_options.max_length:
+        chunk_size = min(chunk_size, queue_options.max_length)
+
+    packer = PayloadPacker(get_codec(queue_options.codec), queue_name, queue_options)
+    message_ids: List[str] = []
+    chunk: List[str] = []
+    pipe = redis_client.pipeline(transaction=False)
+    pending_chunks = 0
+    # Offloaded payloads written by the pipeline's pending chunks
+    pending_payload_keys: List[str] = []
+
+    def push_chunk(chunk: List[str]) -> None:
+        # Every message in a chunk shares the same options, so they all land in one list. Without
+        # a partition key, partitioned queues take whole chunks round-robin to keep multi-value LPUSHes
+        target = target_queue(queue_name, queue_options, options.partition_key)
+        if queue_options.max_length:
+            push_bounded_chunk(target, chunk)
+            return
+        # Offloaded payloads are queued ahead of the envelopes that reference them
+        pending_payload_keys.extend(key for key, _ in packer.offloaded)
+        packer.write_offloaded(pipe)
+        if due_ms is None and queue_options.storage == STORAGE_STREAM:
+            # XADD takes one entry at a time, the pipeline still sends the chunk in one write
+            for message_json in chunk:
+                add_to_stream(pipe, target, message_json, queue_options.stream_max_length)
+        elif due_ms is None:
+            # LPUSH with several values keeps FIFO order for RPOP consumers
+            pipe.lpush(queue_key(target, options.priority, queue_options.priority_levels), *chunk)
+        else:
+            pipe.zadd(scheduled_key(target), {message_json: due_ms for message_json in chunk})
+
+    def push_bounded_chunk(target: str, chunk: List[str]) -> None:
+        # Skips the pipeline: the next chunk must not go out before this one is known to fit
+        payload_keys = [key for key, _ in packer.offloaded]
+        try:
+            packer.write_offloaded(redis_client)
+            _push_bounded(redis_client, queue_name, target, queue_options, options.priority, chunk, due_ms)
+        except QueueFullError as e:
+            _delete_payloads(redis_client, payload_keys)
+            e.message_ids = message_ids[:len(message_ids) - len(chunk)]
+            _record_publish(queue_name, started, len(e.message_ids))
+            raise
+        except Exception as e:
+            _delete_payloads(redis_client, payload_keys)
+            raise RuntimeError(f"Failed to push messages to queue: {str(e)}")
+
+    def flush_pipeline() -> None:
+        nonlocal pending_chunks
+        if not pending_chunks:
+            return
+        try:
+            pipe.execute()
+        except Exception as e:
+            _delete_payloads(redis_client, pending_payload_keys)
+            raise RuntimeError(f"Failed to push messages to queue: {str(e)}")
+        pending_chunks = 0
+        pending_payload_keys.clear()
+
+    for message in messages:
+        message_id = new_message_id()
+        # Stamped one by one, a generator may take a while to yield the whole batch
+        chunk.append(_serialize_message(packer, message_id, message, options, int(time.time() * 1000)))
+        message_ids.append(message_id)
+
+        if len(chunk) >= chunk_size:
+            push_chunk(chunk)
+            chunk = []
+            pending_chunks += 1
+            if pending_chunks >= PIPELINE_CHUNKS_PER_FLUSH:
+                flush_pipeline()
+
+    if chunk:
+        push_chunk(chunk)
+        pending_chunks += 1
+    flush_pipeline()
+
+    _record_publish(queue_name, started, len(message_ids))
+    logger.debug("%d jobs added to queue %s", len(message_ids), queue_name)
+    return message_ids
+
+
+def _require_queue_options(redis_client: redis.Redis, queue_name: str) -> QueueOptions:
+    # Served from the client's metadata cache, so steady-state publishes skip the meta round trip
+    options = get_queue_options(redis_client, queue_name)
+    if options is None:
+        raise ValueError(f"❌ Queue \"{queue_name}\" does not exist. Create it first")
+    return options
+
+
+def queue_depth(redis_client: redis.Redis, queue_name: str) -> int:
+    """
+    Messages counted against the queue's `max_length`: ready plus scheduled, summed
+    over partitions. Stream queues count the entries their consumer group hasn't
+    acknowledged yet, see `streams.stream_depth`.
+
+    Costs one pipelined round trip of O(1) commands, plus the metadata lookup that
+    cached clients serve locally, so producers can poll it to throttle themselves.
+    """
+    queue_options = _require_queue_options(redis_client, queue_name)
+    names = partition_queue_names(queue_name, queue_options) or [queue_name]
+    pipe = redis_client.pipeline(transaction=False)
+    if queue_options.storage == STORAGE_STREAM:
+        for name in names:
+            queue_stream_depth(pipe, name)
+            pipe.zcard(scheduled_key(name))
+        return _stream_queue_depth(pipe.execute(raise_on_error=False))
+    for name in names:
+        for key in priority_queue_keys(name, queue_options.priority_levels):
+            pipe.llen(key)
+        pipe.zcard(scheduled_key(name))
+    return sum(pipe.execute())
+
+
+def _stream_queue_depth(replies: List[Any]) -> int:
+    # Three replies per partition: XLEN, XINFO GROUPS and ZCARD. XINFO GROUPS fails on a
+    # stream nobody published to yet, which stream_depth expects, any other error is raised.
+    depth = 0
+    for length, groups, scheduled in zip(replies[0::3], replies[1::3], replies[2::3]):
+        if isinstance(scheduled, Exception):
+            raise scheduled
+        depth += stream_depth(length, groups) + scheduled
+    return depth
+
+
+def bounded_push_call(target: str, queue_options: QueueOptions, priority: int, messages: List[Any], due_ms: Optional[int]) -> Tuple[List[str], List[Any]]:
+    """KEYS and ARGV of the push_bounded script pushing `messages` to queue `target`."""
+    push_key = queue_key(target, priority, queue_options.priority_levels) if due_ms is None else scheduled_key(target)
+    keys = [push_key, scheduled_key(target)] + priority_queue_keys(target, queue_options.priority_levels)
+    drop_oldest = int(queue_options.overflow == OVERFLOW_DROP_OLDEST)
+    return keys, [queue_options.max_length, drop_oldest, due_ms or 0] + list(messages)
+
+
+def overflow_poll_delay(delay: float, remaining: float) -> float:
+    """Seconds a blocked publish sleeps before its next attempt, doubling from the previous `delay`."""
+    return min(max(delay * 2, OVERFLOW_POLL_MIN_DELAY), OVERFLOW_POLL_MAX_DELAY, remaining)
+
+
+def _bounded_push_done(queue_name: str, result: List[Any]) -> bool:
+    # True if push_bounded pushed the messages. A rejection is only final for the "reject"
+    # policy, so callers report those themselves.
+    pushed, dropped = int(result[0]), int(result[1])
+    if pushed and dropped:
+        logger.warning("Queue %s is full, dropped its %d oldest messages", queue_name, dropped)
+        metrics.count(metrics.MESSAGES_DROPPED, queue_name, dropped)
+    return bool(pushed)
+
+
+def _push_bounded(redis_client: redis.Redis, queue_name: str, target: str, queue_options: QueueOptions, priority: int, messages: List[Any], due_ms: Optional[int]) -> None:
+    """Push `messages` to a capped queue, applying its overflow policy once it's full."""
+    keys, args = bounded_push_call(target, queue_options, priority, messages, due_ms)
+    deadline = time.monotonic() + queue_options.overflow_timeout
+    delay = 0.0
+    while not _bounded_push_done(queue_name, run_script(redis_client, "push_bounded", keys, args)):
+        remaining = deadline - time.monotonic()
+        if queue_options.overflow != OVERFLOW_BLOCK or remaining <= 0:
+            # The caller gets the exception, so this stays quiet
+            logger.debug("Queue %s is full, rejected %d messages", queue_name, len(messages))
+            metrics.count(metrics.MESSAGES_REJECTED, queue_name, len(messages))
+            raise QueueFullError(queue_name, queue_options.max_length)
+        delay = overflow_poll_delay(delay, remaining)
+        time.sleep(delay)
+
+
+def _record_publish(queue_name: str, started: Optional[float], published: int) -> None:
+    # `started` is None while no metrics sink is registered
+    if started is None:
+        return
+    metrics.count(metrics.MESSAGES_PUBLISHED, queue_name, published)
+    metrics.observe(metrics.PUBLISH_DURATION, queue_name, time.perf_counter() - started)
+
+
+def target_queue(queue_name: str, queue_options: QueueOptions, partition_key: Optional[str] = None) -> str:
+    """Queue a message published to `queue_name` is pushed to: a partition of partitioned queues, else the queue itself."""
+    if not queue_options.partitions:
+        return queue_name
+    return partition_name(queue_name, route_partition(queue_name, queue_options.partitions, partition_key))
+
+
+def dedup_key(queue_name: str, key: str) -> str:
+    return f"queue_dedup:{queue_name}:{key}"
+
+
+def _dedup_ttl_ms(options: "MessageOptions") -> int:
+    if options.dedup_ttl <= 0:
+        raise ValueError("dedup_ttl must be greater than 0")
+    return max(int(options.dedup_ttl * 1000), 1)
+
+
+def _claim_dedup_key(redis_client: redis.Redis, queue_name: str, options: "MessageOptions", message_id: str) -> Optional[str]:
+    """
+    SET NX the message's dedup key to its ID.
+
+    Returns None if this publish now owns the key, or the ID of the message published
+    under it earlier in the dedup window.
+    """
+    key = dedup_key(queue_name, options.dedup_key)
+    ttl_ms = _dedup_ttl_ms(options)
+    try:
+        while True:
+            if redis_client.set(key, message_id, nx=True, px=ttl_ms):
+                return None
+            existing_id = redis_client.get(key)
+            # Retry if the key expired between SET and GET
+            if existing_id is not None:
+                return existing_id.decode('utf-8') if isinstance(existing_id, bytes) else existing_id
+    except redis.RedisError as e:
+        raise RuntimeError(f"Failed to check dedup key: {str(e)}")
+
+
+def _release_dedup_key(redis_client: redis.Redis, queue_name: str, key: str) -> None:
+    try:
+        redis_client.delete(dedup_key(queue_name, key))
+    except redis.RedisError:
+        # The key expires on its own, the original error matters more
+        pass
+
+
+def _delete_payloads(redis_client: redis.Redis, payload_keys: List[str]) -> None:
+    # Payloads of messages that were never enqueued, they'd otherwise linger until their TTL
+    if not payload_keys:
+        return
+    try:
+        redis_client.delete(*payload_keys)
+    except redis.RedisError:
+        pass
+
+
+def _serialize_message(packer: PayloadPacker, message_id: str, message: Any, message_options: "MessageOptions", timestamp: int) -> Union[bytes, str]:
+    try:
+        return packer.pack(message_id, message, message_options, timestamp)
+    except (TypeError, ValueError) as e:
+        raise RuntimeError(f"Failed to marshal message: {str(e)}")
@@ -1,19 +1,155 @@
+import copy
+import json
+import logging
+import random
 import redis
 import time
+from .cluster import partition_names
+from .codecs import get_codec
+from .payloads import DEFAULT_CLAIM_CHECK_TTL, DEFAULT_COMPRESSION_THRESHOLD, get_compressor
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default number of consecutive high-priority pops before a lower level is served first
+DEFAULT_STARVATION_LIMIT = 10
+
+# Ready messages live in Redis lists (LPUSH/BRPOP)
+STORAGE_LIST = "list"
+# Ready messages live in a Redis stream read through a consumer group, see streams.py
+STORAGE_STREAM = "stream"
+
+# What a publish does when the queue already holds max_length messages
+OVERFLOW_REJECT = "reject"
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_POLICIES = (OVERFLOW_REJECT, OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST)
+# Default seconds a "block" publish waits for room before giving up
+DEFAULT_OVERFLOW_TIMEOUT = 5.0
+
+class RetryOptions:
+    """
+    Backoff applied before a failed message is retried.
+
+    `strategy` is "fixed" (always `delay` seconds) or "exponential" (`delay` doubled
+    on every attempt). Delays are capped at `max_delay`, and `jitter` spreads them
+    over 50-100% of the computed value so retries of a burst don't line up.
+    """
+    def __init__(self, strategy="exponential", delay=1.0, max_delay=300.0, jitter=True):
+        if strategy not in ("fixed", "exponential"):
+            raise ValueError(f"Unknown retry strategy \"{strategy}\", expected \"fixed\" or \"exponential\"")
+        self.strategy = strategy
+        self.delay = delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def backoff_delay(self, retry_count: int) -> float:
+        """Seconds to wait before attempt number `retry_count` (starting at 1)."""
+        if self.strategy == "exponential":
+            delay = self.delay * (2 ** max(retry_count - 1, 0))
+        else:
+            delay = self.delay
+        delay = min(delay, self.max_delay)
+        if self.jitter:
+            delay *= random.uniform(0.5, 1.0)
+        return max(delay, 0.0)
+
+    def to_dict(self):
+        return {
+            "strategy": self.strategy,
+            "delay": self.delay,
+            "max_delay": self.max_delay,
+            "jitter": self.jitter,
+        }
+
+    @classmethod
+    def from_dict(cls, options_dict):
+        return cls(
+            strategy=options_dict.get("strategy", "exponential"),
+            delay=float(options_dict.get("delay", 1.0)),
+            max_delay=float(options_dict.get("max_delay", 300.0)),
+            jitter=bool(options_dict.get("jitter", True)),
+        )
+
+
+def _parse_retry(value) -> Optional[RetryOptions]:
+    # Meta hashes store the retry policy as JSON. Anything else (e.g. the integer
+    # older versions accepted) means no backoff.
+    if value is None or isinstance(value, RetryOptions):
+        return value
+    if isinstance(value, dict):
+        return RetryOptions.from_dict(value)
+    try:
+        decoded = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    return RetryOptions.from_dict(decoded) if isinstance(decoded, dict) else None
+
+
 class QueueOptions:
-    def __init__(self, config_dead_letter_queue=False,  retry=None, max_retries=3):
+    def __init__(self, config_dead_letter_queue=False,  retry=None, max_retries=3, priority_levels=0, starvation_limit=DEFAULT_STARVATION_LIMIT, storage=STORAGE_LIST, stream_max_length=None, codec="json", compression=None, compression_threshold=DEFAULT_COMPRESSION_THRESHOLD, claim_check_threshold=None, claim_check_ttl=DEFAULT_CLAIM_CHECK_TTL, partitions=0, max_length=None, overflow=OVERFLOW_REJECT, overflow_timeout=DEFAULT_OVERFLOW_TIMEOUT):
+        if storage not in (STORAGE_LIST, STORAGE_STREAM):
+            raise ValueError(f"Unknown storage \"{storage}\", expected \"{STORAGE_LIST}\" or \"{STORAGE_STREAM}\"")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy \"{overflow}\", expected one of {', '.join(OVERFLOW_POLICIES)}")
         self.config_dead_letter_queue = config_dead_letter_queue
-        self.retry = retry
+        # RetryOptions (or an equivalent dict) enabling delayed retries, None retries immediately
+        self.retry = _parse_retry(retry)
         self.max_retries = max_retries
+        # 0 keeps a single FIFO list, N > 0 stores messages in N lists by MessageOptions.priority
+        self.priority_levels = priority_levels
+        # Every Nth pop starts from the lowest priority level, 0 means strict priority
+        self.starvation_limit = starvation_limit
+        # "list" or "stream". Streams add consumer groups, acknowledgements and replay.
+        self.storage = storage
+        # Approximate cap (XADD MAXLEN ~) on stream entries, None keeps every entry
+        self.stream_max_length = stream_max_length
+        # Envelope codec used by producers: "json", "orjson" or "msgpack", see codecs.py
+        self.codec = codec
+        # "zlib", "lz4" or "zstd" to compress payloads of at least compression_threshold bytes
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        # Payloads of at least this many bytes are stored under their own key, see payloads.py
+        self.claim_check_threshold = claim_check_threshold
+        # Seconds an offloaded payload is kept, should outlive retries and DLQ inspection
+        self.claim_check_ttl = claim_check_ttl
+        # N > 0 spreads the queue over N partitions, each a queue of its own, see cluster.py
+        self.partitions = partitions
+        # Cap on ready plus scheduled messages, enforced per partition. None leaves the queue unbounded.
+        self.max_length = max_length
+        # "reject", "block" (for up to overflow_timeout seconds) or "drop_oldest" once max_length is reached
+        self.overflow = overflow
+        self.overflow_timeout = overflow_timeout
     
     def to_dict(self):
         options = {
-            "config_dead_letter_queue": self.config_dead_letter_queue,
+            # Redis only stores strings and numbers, so flags are kept as 0/1
+            "config_dead_letter_queue": int(bool(self.config_dead_letter_queue)),
             "max_retries":self.max_retries,
+            "priority_levels": self.priority_levels,
+            "starvation_limit": self.starvation_limit,
+            "storage": self.storage,
+            "codec": self.codec,
+            "compression_threshold": self.compression_threshold,
+            "claim_check_ttl": self.claim_check_ttl,
         }
 
+        if self.compression:
+            options["compression"] = self.compression
+        if self.claim_check_threshold:
+            options["claim_check_threshold"] = self.claim_check_threshold
+
+        if self.stream_max_length:
+            options["stream_max_length"] = self.stream_max_length
+        if self.partitions:
+            options["partitions"] = self.partitions
+        if self.max_length:
+            options["max_length"] = self.max_length
+            options["overflow"] = self.overflow
+            options["overflow_timeout"] = self.overflow_timeout
+
         if self.retry is not None:
-            options["retry"] = self.retry
+            options["retry"] = json.dumps(self.retry.to_dict())
         
         return options
 
@@ -22,10 +158,97 @@ class QueueOptions:
         return cls(
             config_dead_letter_queue=options_dict.get("config_dead_letter_queue", False),
             retry=options_dict.get("retry"),
-            max_retries=options_dict.get("max_retries", 3)
+            max_retries=options_dict.get("max_retries", 3),
+            priority_levels=int(options_dict.get("priority_levels", 0)),
+            starvation_limit=int(options_dict.get("starvation_limit", DEFAULT_STARVATION_LIMIT)),
+            storage=options_dict.get("storage", STORAGE_LIST),
+            stream_max_length=options_dict.get("stream_max_length"),
+            codec=options_dict.get("codec", "json"),
+            compression=options_dict.get("compression"),
+            compression_threshold=int(options_dict.get("compression_threshold", DEFAULT_COMPRESSION_THRESHOLD)),
+            claim_check_threshold=options_dict.get("claim_check_threshold"),
+            claim_check_ttl=int(options_dict.get("claim_check_ttl", DEFAULT_CLAIM_CHECK_TTL)),
+            partitions=int(options_dict.get("partitions", 0)),
+            max_length=int(options_dict["max_length"]) if options_dict.get("max_length") else None,
+            overflow=options_dict.get("overflow", OVERFLOW_REJECT),
+            overflow_timeout=float(options_dict.get("overflow_timeout", DEFAULT_OVERFLOW_TIMEOUT)),
+        )
+
+    @classmethod
+    def from_meta(cls, queue_meta):
+        """
+        Build typed options from a raw `queue_meta:<name>` hash as returned by HGETALL.
+
+        This is the one place the meta hash is decoded. Keys and values may be bytes,
+        numbers arrive as strings, and fields missing from queues created by older
+        versions fall back to their defaults.
+        """
+        meta = {
+            (k.decode('utf-8') if isinstance(k, bytes) else k): (v.decode('utf-8') if isinstance(v, bytes) else v)
+            for k, v in queue_meta.items()
+        }
+
+        def as_int(field, default):
+            try:
+                return int(meta[field])
+            except (KeyError, TypeError, ValueError):
+                return default
+
+        def as_float(field, default):
+            try:
+                return float(meta[field])
+            except (KeyError, TypeError, ValueError):
+                return default
+
+        return cls(
+            config_dead_letter_queue=str(meta.get("config_dead_letter_queue", "0")) in ("1", "true", "True"),
+            retry=meta.get("retry"),
+            # Early clients wrote maxRetries, create_queue writes max_retries
+            max_retries=as_int("max_retries", as_int("maxRetries", 3)),
+            priority_levels=as_int("priority_levels", 0),
+            starvation_limit=as_int("starvation_limit", DEFAULT_STARVATION_LIMIT),
+            storage=meta.get("storage", STORAGE_LIST),
+            stream_max_length=as_int("stream_max_length", 0) or None,
+            codec=meta.get("codec", "json"),
+            compression=meta.get("compression") or None,
+            compression_threshold=as_int("compression_threshold", DEFAULT_COMPRESSION_THRESHOLD),
+            claim_check_threshold=as_int("claim_check_threshold", 0) or None,
+            claim_check_ttl=as_int("claim_check_ttl", DEFAULT_CLAIM_CHECK_TTL),
+            partitions=as_int("partitions", 0),
+            max_length=as_int("max_length", 0) or None,
+            overflow=meta.get("overflow", OVERFLOW_REJECT),
+            overflow_timeout=as_float("overflow_timeout", DEFAULT_OVERFLOW_TIMEOUT),
         )
 
 
+def queue_key(queue_name: str, priority: int = 0, priority_levels: int = 0) -> str:
+    """Redis list holding messages of `queue_name` published with `priority`."""
+    if priority_levels <= 0:
+        return f"queue:{queue_name}"
+    # Out of range priorities are clamped rather than rejected
+    level = max(0, min(priority_levels - 1, int(priority or 0)))
+    return f"queue:{queue_name}:p{level}"
+
+
+def priority_queue_keys(queue_name: str, priority_levels: int) -> List[str]:
+    """All lists of a queue, most urgent (highest priority) first."""
+    if priority_levels <= 0:
+        return [f"queue:{queue_name}"]
+    return [f"queue:{queue_name}:p{level}" for level in reversed(range(priority_levels))]
+
+
+def partition_queue_names(queue_name: str, queue_options: QueueOptions) -> List[str]:
+    """Names of a partitioned queue's partitions, empty for other queues."""
+    return partition_names(queue_name, queue_options.partitions) if queue_options.partitions > 0 else []
+
+
+def partition_options(queue_options: QueueOptions) -> QueueOptions:
+    """Options each partition of a partitioned queue is created with."""
+    options = copy.copy(queue_options)
+    options.partitions = 0
+    return options
+
+
 # Queue related functions - 1. Create a new queue
 
 def create_queue(redis_client : redis.Redis , queue_name: str , queue_options:'QueueOptions') -> None :
@@ -36,23 +259,47 @@ def create_queue(redis_client : redis.Redis , queue_name: str , queue_options:'Q
 
     exists = redis_client.exists(queue_meta_key)
     if exists:
-        print(f"✅ Queue \"{queue_name}\" already exists.")
+        logger.debug("Queue %s already exists", queue_name)
         return
 
     queue_data = {
-        "createdAt": int(time.time() * 1000)  
+        "createdAt": int(time.time() * 1000),
+        # Bumped whenever the stored options change, lets metadata caches revalidate cheaply
+        "version": 1,
     }
 
+    if queue_options is None:
+        queue_options = QueueOptions()
+    if queue_options.priority_levels < 0:
+        raise ValueError("priority_levels can't be negative")
+    if queue_options.storage == STORAGE_STREAM and queue_options.priority_levels > 0:
+        raise ValueError("Stream queues don't support priority_levels")
+    if queue_options.partitions < 0:
+        raise ValueError("partitions can't be negative")
+    if queue_options.max_length is not None:
+        if queue_options.storage == STORAGE_STREAM:
+            raise ValueError("Stream queues don't support max_length, use stream_max_length")
+        if queue_options.max_length < 1:
+            raise ValueError("max_length must be at least 1")
+    # Fails fast on unknown codecs, compressions and missing optional packages
+    get_codec(queue_options.codec)
+    if queue_options.compression:
+        get_compressor(queue_options.compression)
+
     options_dict = queue_options.to_dict()
     for key, value in options_dict.items():
         queue_data[key] = value
 
+    # Partitions exist before the queue does, so a producer never routes to a missing one
+    for name in partition_queue_names(queue_name, queue_options):
+        create_queue(redis_client, name, partition_options(queue_options))
+
     try:
         redis_client.hset(queue_meta_key, mapping=queue_data)
-        print(f"📌 Queue \"{queue_name}\" created successfully.")
+        logger.info("Queue %s created", queue_name)
     
     except Exception as e:
         error_msg = f"Failed to create queue: {str(e)}"
-        print(f"❌ {error_msg}")
+        logger.error("%s", error_msg)
         raise Exception(error_msg)
 
@@ -2,52 +2,55 @@
 Redis client for BizzMQ.
 Handles connections and basic Redis operations.
 """
+import logging
 import redis
 from redis import Redis
+from redis.cluster import RedisCluster
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
 
 
 class RedisClient:
-    def __init__(self, redis_url:str) -> None:
+    def __init__(self, redis_url:str, max_connections:Optional[int] = None, socket_keepalive:bool = False, socket_connect_timeout:Optional[float] = None, health_check_interval:int = 0, cluster:bool = False) -> None:
         if not redis_url:
             raise ValueError("Redis URL is required")
         
+        # No socket_timeout on purpose: blocking pops would hit it while waiting for messages
+        connection_options = {
+            "socket_keepalive": socket_keepalive,
+            "socket_connect_timeout": socket_connect_timeout,
+            "health_check_interval": health_check_interval,
+        }
         try:
-            self.client = redis.from_url(redis_url)
+            if cluster:
+                # Nodes are discovered from the URL's node, and each node gets a pool of up to max_connections
+                if max_connections:
+                    connection_options["max_connections"] = max_connections
+                self.client = RedisCluster.from_url(redis_url, **connection_options)
+            elif max_connections:
+                # Every publish and consumer of the client shares this pool, and callers
+                # wait for a free connection instead of failing once all of them are taken
+                pool = redis.BlockingConnectionPool.from_url(redis_url, max_connections=max_connections, **connection_options)
+                self.client = redis.Redis(connection_pool=pool)
+            else:
+                self.client = redis.from_url(redis_url, **connection_options)
             self.client.ping()
-            self._print_welcome_message()
+            self._log_connected()
         
         except redis.RedisError as err :
             raise ConnectionError(f"Failed to connect to Redis: {str(err)}") from err
 
-    def get_redis_client(self)->Redis:
+    def get_redis_client(self)->Union[Redis, RedisCluster]:
         return self.client
     
     def close(self)->None:
         if hasattr(self, 'client') and self.client:
             self.client.close()
+            # Cluster clients have a pool per node and close them all in close()
+            if getattr(self.client, 'connection_pool', None):
+                self.client.connection_pool.disconnect()
 
-    def _print_welcome_message(self)->None:
-        print("╔════════════════════════════════════════════════════════════╗")
-        print("║                                                            ║")
-        print("║   🚀 BizzMQ Queue System v1.0.0 (Python Edition)           ║")
-        print("║         A lightweight message queue for Python             ║")
-        print("║                                                            ║")
-        print("╠════════════════════════════════════════════════════════════╣")
-        print("║                                                            ║")
-        print("║   ⚠️  EARLY VERSION NOTICE                                  ║")
-        print("║       This is an early version and may contain bugs.       ║")
-        print("║       Please report any issues you encounter to:           ║")
-        print("║       github.com/subhammahanty235/bizzmq-py/issues         ║")
-        print("║                                                            ║")
-        print("║   💡 USAGE                                                 ║")
-        print("║       1. Create queues                                     ║")
-        print("║       2. Publish messages                                  ║")
-        print("║       3. Set up consumers                                  ║")
-        print("║                                                            ║")
-        print("║   📚 For documentation visit:                              ║")
-        print("║       https://bizzmq.vercel.app/docs/py-docs               ║")
-        print("║                                                            ║")
-        print("╚════════════════════════════════════════════════════════════╝")
-        print("🔌 Connected to Redis Database")
-
-
+    def _log_connected(self)->None:
+        # Logged instead of printed, applications decide whether they want to see it
+        logger.info("BizzMQ connected to Redis - docs: https://bizzmq.vercel.app/docs/py-docs")
@@ -0,0 +1,71 @@
+"""
+Scheduled delivery for BizzMQ.
+
+Delayed messages and backed-off retries wait in a per-queue sorted set scored by
+their due time (ms). Consumers periodically promote due messages onto the ready
+list(s) with a single server-side script.
+"""
+import redis
+import time
+from typing import List, Optional, Tuple
+
+from .message import MessageOptions
+from .queue import queue_key
+from .scripts import run_script
+
+# Longest a consumer waits between checks of the scheduled set
+SCHEDULER_POLL_INTERVAL = 1.0
+# Most messages promoted by one script call
+PROMOTE_BATCH_SIZE = 500
+
+def scheduled_key(queue_name: str) -> str:
+    return f"queue_scheduled:{queue_name}"
+
+
+def promote_keys(queue_name: str, priority_levels: int) -> List[str]:
+    """Keys passed to the promotion script for a queue."""
+    if priority_levels <= 0:
+        return [scheduled_key(queue_name), queue_key(queue_name)]
+    return [scheduled_key(queue_name)] + [queue_key(queue_name, level, priority_levels) for level in range(priority_levels)]
+
+
+def due_time_ms(message_options: Optional[MessageOptions]) -> Optional[int]:
+    """When a message should become visible, or None if it's ready right away."""
+    if message_options is None:
+        return None
+
+    now_ms = int(time.time() * 1000)
+    if message_options.run_at is not None:
+        due_ms = int(message_options.run_at * 1000)
+    elif message_options.delay and message_options.delay > 0:
+        due_ms = now_ms + int(message_options.delay * 1000)
+    else:
+        return None
+
+    return due_ms if due_ms > now_ms else None
+
+
+def promote_due_messages(redis_client: redis.Redis, queue_name: str, priority_levels: int, batch_size: int = PROMOTE_BATCH_SIZE) -> Tuple[int, Optional[int]]:
+    """
+    Move messages whose due time has passed onto the queue's ready list(s).
+
+    Runs atomically on the server, so any number of consumers can promote the same
+    queue. Returns the number of promoted messages and the due time (ms) of the next
+    scheduled message, if any.
+    """
+    moved, next_due = run_script(
+        redis_client, "promote_due",
+        keys=promote_keys(queue_name, priority_levels),
+        args=[int(time.time() * 1000), batch_size],
+    )
+    return int(moved), (int(next_due) if int(next_due) >= 0 else None)
+
+
+def next_poll_delay(moved: int, next_due: Optional[int], batch_size: int = PROMOTE_BATCH_SIZE) -> float:
+    """Seconds a promotion loop should sleep after a promotion pass."""
+    if moved >= batch_size:
+        # A full batch means more messages may already be due
+        return 0.0
+    if next_due is None:
+        return SCHEDULER_POLL_INTERVAL
+    return min(max((next_due - time.time() * 1000) / 1000, 0.0), SCHEDULER_POLL_INTERVAL)
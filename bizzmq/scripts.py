@@ -0,0 +1,361 @@
+"""
+Server-side Lua scripts for BizzMQ message state transitions.
+
+Each transition (claim, ack, retry, dead-letter, promotion) runs as one atomic
+script, so it costs a single round trip and can't be left half done by a crashed
+client. Scripts are called with EVALSHA and loaded on first use, or up front with
+`preload_scripts`.
+"""
+import redis
+from typing import Any, Dict, List
+
+# Settle modes for RETRY_MESSAGE / DEAD_LETTER_MESSAGE: what to do with the in-flight copy
+SETTLE_NONE = 0
+# Remove the in-flight copy from the processing list and in-flight set
+SETTLE_ACK = 1
+# Like SETTLE_ACK, but only go ahead if the in-flight entry is still there (reaper)
+SETTLE_CLAIM = 2
+
+# Results of RETRY_MESSAGE / DEAD_LETTER_MESSAGE
+RESULT_ALREADY_SETTLED = -1
+RESULT_REQUEUED = 0
+RESULT_SCHEDULED = 1
+RESULT_DEAD_LETTERED = 2
+RESULT_DISCARDED = 3
+
+# KEYS[1..n-3] are the ready lists in pop order, KEYS[n-2] the processing list, KEYS[n-1]
+# the in-flight set and KEYS[n] the queue's consumer set. ARGV[1] is now (ms), ARGV[2] the
+# consumer ID. Moves the first message found to the processing list and records its claim
+# time, or returns false. A consumer holding a message is always registered, so reapers
+# can unregister idle ones.
+CLAIM_MESSAGE = """
+local processing = KEYS[#KEYS - 2]
+local inflight = KEYS[#KEYS - 1]
+for i = 1, #KEYS - 3 do
+    local message = redis.call('RPOP', KEYS[i])
+    if message then
+        redis.call('LPUSH', processing, message)
+        redis.call('ZADD', inflight, ARGV[1], message)
+        redis.call('SADD', KEYS[#KEYS], ARGV[2])
+        return message
+    end
+end
+return false
+"""
+
+# Batch form of CLAIM_MESSAGE: ARGV[3] is the most messages to claim. Returns the
+# claimed messages in pop order, filling from the first ready list onwards.
+CLAIM_MESSAGES = """
+local processing = KEYS[#KEYS - 2]
+local inflight = KEYS[#KEYS - 1]
+local wanted = tonumber(ARGV[3])
+local claimed = {}
+for i = 1, #KEYS - 3 do
+    local messages = redis.call('RPOP', KEYS[i], wanted - #claimed)
+    if messages then
+        for _, message in ipairs(messages) do
+            redis.call('LPUSH', processing, message)
+            redis.call('ZADD', inflight, ARGV[1], message)
+            claimed[#claimed + 1] = message
+        end
+        if #claimed >= wanted then
+            break
+        end
+    end
+end
+if #claimed > 0 then
+    redis.call('SADD', KEYS[#KEYS], ARGV[2])
+end
+return claimed
+"""
+
+# KEYS[1] processing list, KEYS[2] in-flight set, KEYS[3] consumer set. ARGV[1] consumer ID.
+# KEYS: 1 processing list, 2 in-flight set, 3 consumer set, 4 heartbeat set. ARGV: 1 consumer
+# ID, 2 latest heartbeat (ms) of a consumer that may be dropped, empty to ignore heartbeats.
+# Removes the consumer if it holds no messages and wasn't seen since ARGV[2]. Checked in the
+# script, so a message claimed meanwhile can't be left with an unregistered owner. Returns
+# 1 if removed.
+UNREGISTER_CONSUMER = """
+if ARGV[2] ~= '' then
+    local seen = redis.call('ZSCORE', KEYS[4], ARGV[1])
+    if seen and tonumber(seen) > tonumber(ARGV[2]) then
+        return 0
+    end
+end
+if redis.call('LLEN', KEYS[1]) > 0 or redis.call('ZCARD', KEYS[2]) > 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[4], ARGV[1])
+return redis.call('SREM', KEYS[3], ARGV[1])
+"""
+
+# KEYS[1] processing list, KEYS[2] in-flight set. ARGV[1] raw message.
+ACK_MESSAGE = """
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+return redis.call('ZREM', KEYS[2], ARGV[1])
+"""
+
+# Shared by the failure scripts: removes the in-flight copy of a message once it has been handled.
+_SETTLE_HELPER = """
+local function settle(mode, processing, inflight, raw)
+    if mode >= 1 then
+        redis.call('LREM', processing, 1, raw)
+        redis.call('ZREM', inflight, raw)
+    end
+end
+"""
+
+# KEYS: 1 ready list for the message's priority, 2 scheduled set, 3 dead letter list,
+#       4 processing list, 5 in-flight set
+# ARGV: 1 new retry count, 2 max retries, 3 dead letter queue enabled (1/0),
+#       4 requeued envelope, 5 dead-letter envelope, 6 retry due time in ms (0 = now),
+#       7 raw in-flight message, 8 settle mode
+# Retries within max retries go back to the ready list, or to the scheduled set when
+# they're backed off. Exhausted messages are dead-lettered if the queue has a DLQ and
+# discarded otherwise.
+RETRY_MESSAGE = _SETTLE_HELPER + """
+local mode = tonumber(ARGV[8])
+if mode == 2 and redis.call('ZSCORE', KEYS[5], ARGV[7]) == false then
+    return -1
+end
+
+local result = 3
+if tonumber(ARGV[1]) <= tonumber(ARGV[2]) then
+    local due = tonumber(ARGV[6])
+    if due > 0 then
+        redis.call('ZADD', KEYS[2], due, ARGV[4])
+        result = 1
+    else
+        redis.call('LPUSH', KEYS[1], ARGV[4])
+        result = 0
+    end
+elseif ARGV[3] == '1' then
+    redis.call('LPUSH', KEYS[3], ARGV[5])
+    result = 2
+end
+
+settle(mode, KEYS[4], KEYS[5], ARGV[7])
+return result
+"""
+
+# KEYS: 1 dead letter list, 2 processing list, 3 in-flight set
+# ARGV: 1 dead-letter envelope, 2 dead letter queue enabled (1/0), 3 raw in-flight
+#       message, 4 settle mode
+DEAD_LETTER_MESSAGE = _SETTLE_HELPER + """
+local mode = tonumber(ARGV[4])
+if mode == 2 and redis.call('ZSCORE', KEYS[3], ARGV[3]) == false then
+    return -1
+end
+
+local result = 3
+if ARGV[2] == '1' then
+    redis.call('LPUSH', KEYS[1], ARGV[1])
+    result = 2
+end
+
+settle(mode, KEYS[2], KEYS[3], ARGV[3])
+return result
+"""
+
+# KEYS[1] is the scheduled set, KEYS[2..] the ready lists ordered by priority level
+# (a single list for plain queues). ARGV[1] is now (ms) and ARGV[2] the batch size.
+# Returns the number of promoted messages and the due time of the next one, or -1.
+PROMOTE_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local levels = #KEYS - 1
+local function decode(message)
+    -- Tagged envelopes start with 0xC1 and a codec ID, see codecs.py
+    if string.byte(message, 1) == 193 then
+        if string.sub(message, 2, 2) == 'm' and cmsgpack then
+            return pcall(cmsgpack.unpack, string.sub(message, 3))
+        end
+        return false
+    end
+    return pcall(cjson.decode, message)
+end
+for _, message in ipairs(due) do
+    redis.call('ZREM', KEYS[1], message)
+    local target = KEYS[2]
+    if levels > 1 then
+        local priority = 0
+        local ok, decoded = decode(message)
+        if ok and type(decoded) == 'table' and type(decoded.options) == 'table' and tonumber(decoded.options.priority) then
+            priority = math.floor(tonumber(decoded.options.priority))
+        end
+        priority = math.max(0, math.min(levels - 1, priority))
+        target = KEYS[priority + 2]
+    end
+    redis.call('LPUSH', target, message)
+end
+local upcoming = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if #upcoming == 0 then
+    return {#due, -1}
+end
+return {#due, tonumber(upcoming[2])}
+"""
+
+# Shared by the stream scripts: XADD with an optional approximate MAXLEN cap (0 = none)
+_STREAM_ADD_HELPER = """
+local function stream_add(stream, max_length, message)
+    if tonumber(max_length) > 0 then
+        return redis.call('XADD', stream, 'MAXLEN', '~', max_length, '*', 'message', message)
+    end
+    return redis.call('XADD', stream, '*', 'message', message)
+end
+"""
+
+# KEYS: 1 stream, 2 scheduled set, 3 dead letter list
+# ARGV: 1 consumer group, 2 entry ID, 3 new retry count, 4 max retries,
+#       5 dead letter queue enabled (1/0), 6 requeued envelope, 7 dead-letter envelope,
+#       8 retry due time in ms (0 = now), 9 stream max length (0 = unbounded)
+# Acknowledges and deletes a failed entry, then re-adds, schedules, dead-letters or discards
+# it like RETRY_MESSAGE. Returns -1 without doing anything if the entry was already acknowledged.
+RETRY_STREAM_MESSAGE = _STREAM_ADD_HELPER + """
+if redis.call('XACK', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+    return -1
+end
+redis.call('XDEL', KEYS[1], ARGV[2])
+
+local result = 3
+if tonumber(ARGV[3]) <= tonumber(ARGV[4]) then
+    local due = tonumber(ARGV[8])
+    if due > 0 then
+        redis.call('ZADD', KEYS[2], due, ARGV[6])
+        result = 1
+    else
+        stream_add(KEYS[1], ARGV[9], ARGV[6])
+        result = 0
+    end
+elseif ARGV[5] == '1' then
+    redis.call('LPUSH', KEYS[3], ARGV[7])
+    result = 2
+end
+return result
+"""
+
+# KEYS: 1 scheduled set, 2 stream. ARGV: 1 now (ms), 2 batch size, 3 stream max length.
+# Stream counterpart of PROMOTE_DUE with the same return value.
+PROMOTE_DUE_STREAM = _STREAM_ADD_HELPER + """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, message in ipairs(due) do
+    redis.call('ZREM', KEYS[1], message)
+    stream_add(KEYS[2], ARGV[3], message)
+end
+local upcoming = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if #upcoming == 0 then
+    return {#due, -1}
+end
+return {#due, tonumber(upcoming[2])}
+"""
+
+# KEYS[1] dead letter list. Deletes it and returns how many entries it held. One key, so
+# it runs on Redis Cluster, where transactions aren't available to pipelines.
+PURGE_DEAD_LETTERS = """
+local count = redis.call('LLEN', KEYS[1])
+redis.call('UNLINK', KEYS[1])
+return count
+"""
+
+# KEYS: 1 dead letter list, 1 + i where the i-th message goes
+# ARGV (4 per message): dead letter as stored, redriven envelope, target is a stream (1/0),
+#       stream max length (0 = unbounded)
+# Moves dead letters back to their queues. Each message is only pushed if this call removed
+# it from the DLQ, so concurrent redrives never duplicate one. Returns the number moved.
+REDRIVE_MESSAGES = _STREAM_ADD_HELPER + """
+local moved = 0
+for i = 1, #KEYS - 1 do
+    local base = (i - 1) * 4
+    -- Scanning from the tail finds the oldest dead letters, which redrives start with, right away
+    if redis.call('LREM', KEYS[1], -1, ARGV[base + 1]) > 0 then
+        if ARGV[base + 3] == '1' then
+            stream_add(KEYS[i + 1], ARGV[base + 4], ARGV[base + 2])
+        else
+            redis.call('LPUSH', KEYS[i + 1], ARGV[base + 2])
+        end
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+# KEYS[1] list or scheduled set the messages go to, KEYS[2] scheduled set, KEYS[3..n] ready
+#       lists, most urgent first
+# ARGV[1] max length, ARGV[2] drop oldest (1/0), ARGV[3] due time (ms, 0 = ready now),
+#       ARGV[4..] messages
+# Pushes the messages if the queue (ready plus scheduled messages) has room for all of them.
+# Without room it pushes nothing, unless ARGV[2] is 1: then the oldest messages are dropped
+# to make room, starting at the tail of the least urgent list. Returns {pushed, dropped,
+# length before the push}.
+PUSH_BOUNDED = """
+local limit = tonumber(ARGV[1])
+local incoming = #ARGV - 3
+local length = redis.call('ZCARD', KEYS[2])
+for i = 3, #KEYS do
+    length = length + redis.call('LLEN', KEYS[i])
+end
+local excess = length + incoming - limit
+if excess > 0 and ARGV[2] ~= '1' then
+    return {0, 0, length}
+end
+if ARGV[3] == '0' then
+    -- unpack() is bounded by the Lua stack, so long chunks go in slices
+    for first = 4, #ARGV, 1000 do
+        redis.call('LPUSH', KEYS[1], unpack(ARGV, first, math.min(first + 999, #ARGV)))
+    end
+else
+    for i = 4, #ARGV do
+        redis.call('ZADD', KEYS[1], ARGV[3], ARGV[i])
+    end
+end
+local dropped = 0
+for i = #KEYS, 3, -1 do
+    if excess <= 0 then
+        break
+    end
+    local removed = redis.call('RPOP', KEYS[i], excess)
+    if removed then
+        dropped = dropped + #removed
+        excess = excess - #removed
+    end
+end
+if excess > 0 then
+    -- Only scheduled messages left, the ones due soonest go first
+    dropped = dropped + #redis.call('ZPOPMIN', KEYS[2], excess) / 2
+end
+return {incoming, dropped, length}
+"""
+
+SCRIPTS = {
+    "claim_message": CLAIM_MESSAGE,
+    "claim_messages": CLAIM_MESSAGES,
+    "ack_message": ACK_MESSAGE,
+    "unregister_consumer": UNREGISTER_CONSUMER,
+    "retry_message": RETRY_MESSAGE,
+    "dead_letter_message": DEAD_LETTER_MESSAGE,
+    "promote_due": PROMOTE_DUE,
+    "retry_stream_message": RETRY_STREAM_MESSAGE,
+    "promote_due_stream": PROMOTE_DUE_STREAM,
+    "redrive_messages": REDRIVE_MESSAGES,
+    "purge_dead_letters": PURGE_DEAD_LETTERS,
+    "push_bounded": PUSH_BOUNDED,
+}
+
+_registered: Dict[str, Any] = {}
+
+
+def register_scripts(redis_client: Any) -> Dict[str, Any]:
+    """Wrap every script for `redis_client` (sync or asyncio), keyed by name."""
+    return {name: redis_client.register_script(source) for name, source in SCRIPTS.items()}
+
+
+def preload_scripts(redis_client: redis.Redis) -> None:
+    """SCRIPT LOAD every script so the first EVALSHA of each doesn't miss."""
+    for source in SCRIPTS.values():
+        redis_client.script_load(source)
+
+
+def run_script(redis_client: redis.Redis, name: str, keys: List[str], args: List[Any]) -> Any:
+    # Script objects only hold the source and its SHA, so one set serves every client
+    if not _registered:
+        _registered.update(register_scripts(redis_client))
+    return _registered[name](keys=keys, args=args, client=redis_client)
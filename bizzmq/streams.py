@@ -0,0 +1,156 @@
+"""
+Redis Streams storage for BizzMQ queues.
+
+Queues created with `QueueOptions(storage="stream")` keep ready messages in a stream
+(`queue_stream:<name>`) instead of a list. Every consumer of the queue reads through
+one consumer group with XREADGROUP, so each entry goes to a single consumer and stays
+in the group's pending list until it's acknowledged with XACK. Entries a consumer
+never acknowledges are taken over by other consumers with XAUTOCLAIM.
+
+Handled entries are acknowledged and deleted (XDEL) in the same round trip, retried
+ones when they're re-added, so the stream only holds unfinished work. The
+`stream_max_length` cap (XADD MAXLEN ~) bounds the backlog on top of that.
+
+Delayed messages, retries and the dead letter queue work as for list queues: the
+scheduled set and the `<name>_dlq` list are shared, only the ready storage changes.
+"""
+import redis
+import time
+from typing import Any, List, Optional, Tuple
+
+from .scheduler import PROMOTE_BATCH_SIZE, scheduled_key
+from .scripts import run_script
+
+# Consumer group shared by every BizzMQ consumer of a stream queue
+DEFAULT_CONSUMER_GROUP = "bizzmq"
+# Number of stalled entries taken over per XAUTOCLAIM call
+CLAIM_BATCH_SIZE = 100
+
+
+def stream_key(queue_name: str) -> str:
+    return f"queue_stream:{queue_name}"
+
+
+def add_to_stream(redis_client: Any, queue_name: str, message_json: str, max_length: Optional[int] = None) -> Any:
+    """XADD a serialized message. Works on clients and pipelines alike."""
+    # "~" lets Redis trim whole macro nodes, which is far cheaper than an exact cap
+    return redis_client.xadd(stream_key(queue_name), {"message": message_json}, maxlen=max_length or None, approximate=True)
+
+
+def ensure_consumer_group(redis_client: redis.Redis, queue_name: str, group: str = DEFAULT_CONSUMER_GROUP) -> None:
+    """Create the queue's stream and consumer group if they don't exist yet."""
+    try:
+        # Starting at 0 delivers entries published before the first consumer started
+        redis_client.xgroup_create(stream_key(queue_name), group, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def read_stream_messages(redis_client: redis.Redis, queue_name: str, consumer_id: str, count: int, block_timeout: float, group: str = DEFAULT_CONSUMER_GROUP) -> List[Tuple[Any, Any]]:
+    """
+    Read up to `count` new entries for `consumer_id`, blocking up to `block_timeout` seconds.
+
+    Returns (entry ID, serialized message) pairs. The entries stay pending in the group
+    until they're acknowledged.
+    """
+    try:
+        response = redis_client.xreadgroup(group, consumer_id, {stream_key(queue_name): ">"}, count=count, block=max(int(block_timeout * 1000), 1))
+    except redis.ResponseError as e:
+        if "NOGROUP" not in str(e):
+            raise
+        # The stream was deleted under us, start over with a fresh group
+        ensure_consumer_group(redis_client, queue_name, group)
+        return []
+
+    if not response:
+        return []
+    return [(entry_id, fields.get(b"message", fields.get("message"))) for entry_id, fields in response[0][1]]
+
+
+def ack_stream_message(redis_client: redis.Redis, queue_name: str, *entry_ids: Any, group: str = DEFAULT_CONSUMER_GROUP) -> int:
+    """Acknowledge and delete entries. Returns how many of them were still pending in the group."""
+    # One XACK settles any number of entries. Handled entries are deleted as well, otherwise
+    # a stream without stream_max_length would keep every message ever published.
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xack(stream_key(queue_name), group, *entry_ids)
+    pipe.xdel(stream_key(queue_name), *entry_ids)
+    return int(pipe.execute()[0])
+
+
+def claim_stalled_messages(redis_client: redis.Redis, queue_name: str, consumer_id: str, min_idle: float, batch_size: int = CLAIM_BATCH_SIZE, group: str = DEFAULT_CONSUMER_GROUP) -> List[Tuple[Any, Any]]:
+    """
+    Take over entries that have been pending for more than `min_idle` seconds.
+
+    XAUTOCLAIM hands each entry to exactly one caller, so any number of consumers can
+    sweep the same queue. Entries trimmed from the stream while pending are
+    acknowledged and skipped.
+    """
+    key = stream_key(queue_name)
+    claimed: List[Tuple[Any, Any]] = []
+    start = "0-0"
+    while True:
+        response = redis_client.xautoclaim(key, group, consumer_id, int(min_idle * 1000), start_id=start, count=batch_size)
+        start, entries = response[0], response[1]
+        for entry_id, fields in entries:
+            if not fields:
+                # Redis 6.2 still returns trimmed entries, with no fields
+                redis_client.xack(key, group, entry_id)
+                continue
+            claimed.append((entry_id, fields.get(b"message", fields.get("message"))))
+        if start in (b"0-0", "0-0"):
+            return claimed
+
+
+def queue_stream_depth(pipe: Any, queue_name: str) -> None:
+    """Queue the XLEN and XINFO GROUPS reads `stream_depth` needs. Run the pipeline with raise_on_error=False."""
+    key = stream_key(queue_name)
+    pipe.xlen(key)
+    pipe.xinfo_groups(key)
+
+
+def stream_depth(length: Any, groups: Any, group: str = DEFAULT_CONSUMER_GROUP) -> int:
+    """
+    Entries of a stream queue still to be handled, from the replies queued by `queue_stream_depth`.
+
+    That's the consumer group's lag (entries no consumer has read yet) plus its pending
+    entries (read but not acknowledged). XLEN alone would also count acknowledged
+    entries that haven't been deleted or trimmed. Until the first consumer creates the
+    group every entry is waiting, so the depth is the length. The length is also used
+    when Redis can't tell the lag (before 7.0, or after entries past the group's
+    position were deleted).
+    """
+    if isinstance(length, Exception):
+        raise length
+    if isinstance(groups, Exception):
+        # XINFO GROUPS fails on streams that don't exist, which hold nothing
+        if length == 0:
+            return 0
+        raise groups
+    for info in groups:
+        name = info.get("name")
+        if (name.decode() if isinstance(name, bytes) else name) != group:
+            continue
+        if info.get("lag") is None:
+            return length
+        return int(info["lag"]) + int(info.get("pending") or 0)
+    return length
+
+
+def stream_depths(redis_client: Any, queue_names: List[str], group: str = DEFAULT_CONSUMER_GROUP) -> List[int]:
+    """`stream_depth` of each of `queue_names`, read in one pipelined round trip."""
+    pipe = redis_client.pipeline(transaction=False)
+    for name in queue_names:
+        queue_stream_depth(pipe, name)
+    replies = pipe.execute(raise_on_error=False)
+    return [stream_depth(replies[2 * index], replies[2 * index + 1], group) for index in range(len(queue_names))]
+
+
+def promote_due_stream_messages(redis_client: redis.Redis, queue_name: str, max_length: Optional[int] = None, batch_size: int = PROMOTE_BATCH_SIZE) -> Tuple[int, Optional[int]]:
+    """Stream counterpart of `scheduler.promote_due_messages`."""
+    moved, next_due = run_script(
+        redis_client, "promote_due_stream",
+        keys=[scheduled_key(queue_name), stream_key(queue_name)],
+        args=[int(time.time() * 1000), batch_size, max_length or 0],
+    )
+    return int(moved), (int(next_due) if int(next_due) >= 0 else None)
@@ -0,0 +1,39 @@
+from bizzmq import AsyncBizzMQ
+from bizzmq.queue import QueueOptions
+from bizzmq.message import MessageOptions
+import asyncio
+import signal
+
+async def message_handler(message):
+    print(f"Processing message: {message}")
+    # Simulate I/O-bound work without blocking the event loop
+    await asyncio.sleep(0.1)
+    print("Processed message successfully!")
+
+async def main():
+    async with AsyncBizzMQ(redis_url="redis://redis:6379") as client:
+        queue_name = "email-queue"
+        options = QueueOptions(config_dead_letter_queue=1, max_retries=3)
+        await client.create_queue(queue_name, options)
+
+        messages = ({"id": i, "content": f"Hello from BizzMQ! Message {i}"} for i in range(100))
+        await client.publish_messages_to_queue(queue_name, messages, MessageOptions())
+
+        print(f"Starting consumer for queue: {queue_name}")
+        cleanup, err = await client.consume_message_from_queue(queue_name, message_handler, concurrency=20)
+        if err:
+            raise err
+
+        # Stop on Ctrl+C or SIGTERM without blocking the loop on a threading.Event
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        print("Consumer running. Press Ctrl+C to stop...")
+        await stop_event.wait()
+        print("\nShutting down...")
+        await cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
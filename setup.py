@@ -4,6 +4,6 @@ from setuptools import setup, find_packages
 # Real metadata is in pyproject.toml
 setup(
     name="bizzmq",
-    packages=find_packages(),
+    packages=find_packages(exclude=("benchmarks", "benchmarks.*", "tests", "tests.*")),
 )
 
@@ -0,0 +1,82 @@
+import time
+
+import fakeredis
+import pytest
+from fakeredis import aioredis as fake_aioredis
+from redis.exceptions import RedisClusterException
+
+from bizzmq import AsyncBizzMQ, BizzMQ
+from bizzmq import client as client_module
+from bizzmq.metadata import QueueMetadataCache, set_metadata_cache
+from bizzmq.scripts import register_scripts
+from bizzmq.metrics import InMemoryMetrics, add_metrics_sink, remove_metrics_sink
+
+
+@pytest.fixture
+def redis_client():
+    # A server per test, FakeRedis() instances would otherwise share one
+    client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    set_metadata_cache(client, QueueMetadataCache())
+    yield client
+    client.close()
+
+
+class ClusterLikeRedis(fakeredis.FakeRedis):
+    """A single node with RedisCluster's pipeline rules: no MULTI/EXEC transactions."""
+
+    def pipeline(self, transaction=None, shard_hint=None):
+        if transaction:
+            raise RedisClusterException("transaction is deprecated in cluster mode")
+        return super().pipeline(transaction=False, shard_hint=shard_hint)
+
+
+@pytest.fixture
+def cluster_redis_client():
+    client = ClusterLikeRedis(server=fakeredis.FakeServer())
+    set_metadata_cache(client, QueueMetadataCache())
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def client(redis_client, monkeypatch):
+    """A BizzMQ client whose connection is `redis_client`."""
+    class FakeRedisClient:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def get_redis_client(self):
+            return redis_client
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(client_module, "RedisClient", FakeRedisClient)
+    bizzmq_client = BizzMQ("redis://localhost")
+    yield bizzmq_client
+    bizzmq_client.close()
+
+
+@pytest.fixture
+def stats():
+    sink = InMemoryMetrics()
+    add_metrics_sink(sink)
+    yield sink
+    remove_metrics_sink(sink)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def fake_async_client():
+    # from_url doesn't connect, so the client's own connection is swapped before first use
+    client = AsyncBizzMQ("redis://localhost")
+    client.redisInstance = fake_aioredis.FakeRedis(server=fakeredis.FakeServer())
+    client._scripts = register_scripts(client.redisInstance)
+    return client
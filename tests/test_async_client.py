@@ -0,0 +1,106 @@
+import asyncio
+import logging
+
+import redis.asyncio as aioredis
+
+from bizzmq import AsyncBizzMQ, QueueOptions
+from bizzmq.metrics import MESSAGES_DISCARDED
+
+from conftest import fake_async_client
+
+
+async def consume_until(client, queue_name, callback, done, timeout=5.0):
+    cleanup, err = await client.consume_message_from_queue(queue_name, callback, block_timeout=0.05)
+    assert err is None
+    try:
+        for _ in range(int(timeout / 0.01)):
+            if await done():
+                return True
+            await asyncio.sleep(0.01)
+        return False
+    finally:
+        await cleanup()
+
+
+def test_publish_and_consume():
+    async def scenario():
+        client = fake_async_client()
+        await client.create_queue("jobs", QueueOptions())
+        await client.publish_messages_to_queue("jobs", [{"n": value} for value in range(5)])
+        received = []
+
+        async def callback(message):
+            received.append(message["n"])
+
+        async def done():
+            return len(received) == 5
+
+        assert await consume_until(client, "jobs", callback, done)
+        return received
+
+    assert sorted(asyncio.run(scenario())) == [0, 1, 2, 3, 4]
+
+
+def test_sync_callbacks_run_in_the_default_executor():
+    async def scenario():
+        client = fake_async_client()
+        await client.create_queue("jobs", QueueOptions())
+        await client.publish_message_to_queue("jobs", {"n": 1})
+        received = []
+
+        async def done():
+            return bool(received)
+
+        assert await consume_until(client, "jobs", received.append, done)
+        return received
+
+    assert asyncio.run(scenario()) == [{"n": 1}]
+
+
+def test_failed_message_is_dead_lettered():
+    async def scenario():
+        client = fake_async_client()
+        await client.create_queue("jobs", QueueOptions(config_dead_letter_queue=True, max_retries=1))
+        await client.publish_message_to_queue("jobs", {"n": 1})
+
+        async def callback(message):
+            raise ValueError("boom")
+
+        async def done():
+            return await client.redisInstance.llen("queue:jobs_dlq") == 1
+
+        return await consume_until(client, "jobs", callback, done)
+
+    assert asyncio.run(scenario())
+
+
+def test_failed_move_is_logged_and_counted(stats, caplog):
+    async def scenario():
+        client = fake_async_client()
+        await client.create_queue("jobs", QueueOptions(config_dead_letter_queue=True, max_retries=0))
+        await client.publish_message_to_queue("jobs", {"n": 1})
+
+        async def broken_move(*args):
+            return Exception("Failed to publish message to DLQ: script failed")
+
+        client._move_message_to_dlq = broken_move
+
+        async def callback(message):
+            raise ValueError("boom")
+
+        async def done():
+            return stats.counters.get((MESSAGES_DISCARDED, "jobs")) == 1
+
+        return await consume_until(client, "jobs", callback, done)
+
+    with caplog.at_level(logging.ERROR, logger="bizzmq"):
+        assert asyncio.run(scenario())
+    assert any("script failed" in record.getMessage() for record in caplog.records)
+
+
+def test_connection_pool_waits_for_a_free_connection():
+    client = AsyncBizzMQ("redis://localhost", max_connections=3)
+    pool = client.redisInstance.connection_pool
+    # A blocking pool queues callers past max_connections instead of raising "Too many connections"
+    assert isinstance(pool, aioredis.BlockingConnectionPool)
+    assert pool.max_connections == 3
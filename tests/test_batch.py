@@ -0,0 +1,104 @@
+import threading
+
+from bizzmq import MessageOptions, QueueOptions, consume_message_from_queue, create_queue, publish_message_to_queue, publish_messages_to_queue
+from bizzmq.dlq import dead_letter_count, get_dead_letter_messages
+
+from conftest import wait_until
+
+
+def consume_batches(redis_client, queue_name, callback, until, **kwargs):
+    cleanup, err = consume_message_from_queue(redis_client, queue_name, callback, block_timeout=0.05, **kwargs)
+    assert err is None
+    try:
+        assert wait_until(until)
+    finally:
+        cleanup()
+
+
+def test_queued_messages_arrive_in_full_batches(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+    publish_messages_to_queue(redis_client, "jobs", [{"n": value} for value in range(10)])
+    batches = []
+
+    consume_batches(redis_client, "jobs", lambda batch: batches.append([message["n"] for message in batch]), lambda: sum(map(len, batches)) == 10, batch_size=4)
+
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_batch_waits_up_to_max_wait_ms_to_fill(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+    batches = []
+    first_seen = threading.Event()
+
+    def callback(batch):
+        batches.append(len(batch))
+        first_seen.set()
+
+    cleanup, err = consume_message_from_queue(redis_client, "jobs", callback, block_timeout=0.05, batch_size=10, max_wait_ms=300)
+    assert err is None
+    try:
+        publish_message_to_queue(redis_client, "jobs", {"n": 1}, None)
+        publish_message_to_queue(redis_client, "jobs", {"n": 2}, None)
+        assert first_seen.wait(2)
+    finally:
+        cleanup()
+    # Neither message waited for a full batch, both came in the first one
+    assert batches == [2]
+
+
+def test_priority_batches_take_the_most_urgent_messages_first(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(priority_levels=3))
+    publish_messages_to_queue(redis_client, "jobs", ["low-1", "low-2"], MessageOptions(priority=0))
+    publish_messages_to_queue(redis_client, "jobs", ["high-1", "high-2"], MessageOptions(priority=2))
+    batches = []
+
+    consume_batches(redis_client, "jobs", lambda batch: batches.append([message["data"] for message in batch]), lambda: batches, batch_size=4)
+
+    assert batches[0] == ["high-1", "high-2", "low-1", "low-2"]
+
+
+def test_returned_failures_only_retry_those_messages(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True, max_retries=0))
+    publish_messages_to_queue(redis_client, "jobs", [{"n": value} for value in range(4)])
+    handled = []
+
+    def callback(batch):
+        handled.extend(message["n"] for message in batch)
+        return {1: ValueError("bad"), 3: "also bad"}
+
+    consume_batches(redis_client, "jobs", callback, lambda: dead_letter_count(redis_client, "jobs") == 2, batch_size=4)
+
+    assert handled == [0, 1, 2, 3]
+    dead_letters = get_dead_letter_messages(redis_client, "jobs")
+    assert sorted(dead_letter["message"]["n"] for dead_letter in dead_letters) == [1, 3]
+    assert {dead_letter["options"]["message"] for dead_letter in dead_letters} == {"bad", "also bad"}
+
+
+def test_raising_fails_the_whole_batch(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True, max_retries=0))
+    publish_messages_to_queue(redis_client, "jobs", [{"n": value} for value in range(3)])
+
+    def callback(batch):
+        raise ValueError("boom")
+
+    consume_batches(redis_client, "jobs", callback, lambda: dead_letter_count(redis_client, "jobs") == 3, batch_size=3)
+
+
+def test_reliable_batches_are_acknowledged(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True, max_retries=0))
+    publish_messages_to_queue(redis_client, "jobs", [{"n": value} for value in range(6)])
+    handled = []
+
+    def callback(batch):
+        handled.extend(message["n"] for message in batch)
+        return {0: ValueError("bad")}
+
+    consume_batches(
+        redis_client, "jobs", callback, lambda: len(handled) == 6 and dead_letter_count(redis_client, "jobs") == 2,
+        batch_size=3, reliable=True, consumer_id="c1",
+    )
+
+    # Successes and failures alike are gone from the processing list and the in-flight set
+    assert wait_until(lambda: redis_client.llen("queue_processing:jobs:c1") == 0)
+    assert redis_client.zcard("queue_inflight:jobs:c1") == 0
+    assert redis_client.llen("queue:jobs") == 0
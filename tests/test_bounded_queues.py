@@ -0,0 +1,159 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from bizzmq import MemoryBackend, MessageOptions, QueueFullError, QueueOptions, create_queue, publish_message_to_queue, publish_messages_to_queue, queue_depth
+from bizzmq.metrics import MESSAGES_DROPPED, MESSAGES_REJECTED
+
+from conftest import fake_async_client
+
+
+def queued(redis_client, key):
+    # Oldest first, the order consumers see
+    return [json.loads(raw)["message"] for raw in reversed(redis_client.lrange(key, 0, -1))]
+
+
+def test_reject_policy_refuses_publishes_past_max_length(redis_client, stats):
+    create_queue(redis_client, "jobs", QueueOptions(max_length=2))
+    publish_message_to_queue(redis_client, "jobs", 1, None)
+    publish_message_to_queue(redis_client, "jobs", 2, None)
+
+    with pytest.raises(QueueFullError) as excinfo:
+        publish_message_to_queue(redis_client, "jobs", 3, None)
+
+    assert excinfo.value.max_length == 2
+    assert queued(redis_client, "queue:jobs") == [1, 2]
+    assert stats.counters[(MESSAGES_REJECTED, "jobs")] == 1
+
+
+def test_scheduled_messages_count_against_max_length(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(max_length=2))
+    publish_message_to_queue(redis_client, "jobs", 1, MessageOptions(delay=60))
+    publish_message_to_queue(redis_client, "jobs", 2, None)
+
+    assert queue_depth(redis_client, "jobs") == 2
+    with pytest.raises(QueueFullError):
+        publish_message_to_queue(redis_client, "jobs", 3, None)
+
+
+def test_rejected_publish_releases_its_dedup_key(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(max_length=1))
+    publish_message_to_queue(redis_client, "jobs", 1, None)
+
+    with pytest.raises(QueueFullError):
+        publish_message_to_queue(redis_client, "jobs", 2, MessageOptions(dedup_key="order-2"))
+
+    assert redis_client.get("queue_dedup:jobs:order-2") is None
+
+
+def test_batch_publish_stops_at_the_first_chunk_that_does_not_fit(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(max_length=5))
+
+    with pytest.raises(QueueFullError) as excinfo:
+        publish_messages_to_queue(redis_client, "jobs", range(12), chunk_size=2)
+
+    # Chunks are all-or-nothing: two chunks of two fit, the third doesn't
+    assert len(excinfo.value.message_ids) == 4
+    assert queued(redis_client, "queue:jobs") == [0, 1, 2, 3]
+
+
+def test_drop_oldest_policy_keeps_the_newest_messages(redis_client, stats):
+    create_queue(redis_client, "jobs", QueueOptions(max_length=3, overflow="drop_oldest"))
+    publish_messages_to_queue(redis_client, "jobs", range(5))
+    for value in range(5, 8):
+        publish_message_to_queue(redis_client, "jobs", value, None)
+
+    assert queued(redis_client, "queue:jobs") == [5, 6, 7]
+    assert stats.counters[(MESSAGES_DROPPED, "jobs")] == 5
+
+
+def test_drop_oldest_drops_the_lowest_priority_first(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(max_length=2, overflow="drop_oldest", priority_levels=2))
+    publish_message_to_queue(redis_client, "jobs", "urgent", MessageOptions(priority=1))
+    publish_message_to_queue(redis_client, "jobs", "low", MessageOptions(priority=0))
+    publish_message_to_queue(redis_client, "jobs", "urgent-2", MessageOptions(priority=1))
+
+    assert queued(redis_client, "queue:jobs:p1") == ["urgent", "urgent-2"]
+    assert redis_client.llen("queue:jobs:p0") == 0
+
+
+def test_block_policy_waits_for_room(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(max_length=1, overflow="block", overflow_timeout=5))
+    publish_message_to_queue(redis_client, "jobs", 1, None)
+    consumer = threading.Timer(0.2, lambda: redis_client.rpop("queue:jobs"))
+    consumer.start()
+
+    started = time.monotonic()
+    publish_message_to_queue(redis_client, "jobs", 2, None)
+
+    assert 0.15 < time.monotonic() - started < 2
+    assert queued(redis_client, "queue:jobs") == [2]
+
+
+def test_block_policy_gives_up_after_overflow_timeout(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(max_length=1, overflow="block", overflow_timeout=0.2))
+    publish_message_to_queue(redis_client, "jobs", 1, None)
+
+    started = time.monotonic()
+    with pytest.raises(QueueFullError):
+        publish_message_to_queue(redis_client, "jobs", 2, None)
+    assert time.monotonic() - started >= 0.2
+
+
+def test_max_length_applies_per_partition(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(max_length=1, partitions=2))
+    publish_message_to_queue(redis_client, "jobs", 1, MessageOptions(partition_key="a"))
+
+    with pytest.raises(QueueFullError):
+        publish_message_to_queue(redis_client, "jobs", 2, MessageOptions(partition_key="a"))
+    assert queue_depth(redis_client, "jobs") == 1
+
+
+@pytest.mark.parametrize("options, error", [
+    (QueueOptions(max_length=0), "at least 1"),
+    (QueueOptions(max_length=5, storage="stream"), "stream_max_length"),
+])
+def test_invalid_max_length_is_rejected(redis_client, options, error):
+    with pytest.raises(ValueError, match=error):
+        create_queue(redis_client, "jobs", options)
+
+
+def test_unknown_overflow_policy_is_rejected():
+    with pytest.raises(ValueError, match="overflow policy"):
+        QueueOptions(max_length=5, overflow="spill")
+
+
+def test_overflow_options_survive_the_meta_hash(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(max_length=7, overflow="block", overflow_timeout=2.5))
+
+    options = QueueOptions.from_meta(redis_client.hgetall("queue_meta:jobs"))
+
+    assert (options.max_length, options.overflow, options.overflow_timeout) == (7, "block", 2.5)
+
+
+def test_memory_backend_applies_the_same_policies():
+    backend = MemoryBackend()
+    backend.create_queue("rejecting", QueueOptions(max_length=2))
+    backend.create_queue("dropping", QueueOptions(max_length=2, overflow="drop_oldest"))
+
+    backend.push_many("rejecting", [1, 2])
+    with pytest.raises(QueueFullError):
+        backend.push("rejecting", 3)
+    backend.push_many("dropping", [1, 2, 3, 4, 5])
+
+    assert backend.queue_depth("rejecting") == 2
+    assert [backend.pop("dropping", 0.1).data for _ in range(2)] == [{"data": 4}, {"data": 5}]
+
+
+def test_async_client_rejects_and_reports_partial_batches():
+    async def scenario():
+        client = fake_async_client()
+        await client.create_queue("jobs", QueueOptions(max_length=3))
+        with pytest.raises(QueueFullError) as excinfo:
+            await client.publish_messages_to_queue("jobs", range(10), chunk_size=2)
+        return len(excinfo.value.message_ids), await client.queue_depth("jobs")
+
+    assert asyncio.run(scenario()) == (2, 2)
@@ -0,0 +1,61 @@
+import json
+import math
+import time
+
+import pytest
+
+from bizzmq import MessageOptions, QueueOptions, consume_message_from_queue, create_queue
+from bizzmq.codecs import decode_envelope, get_codec
+from bizzmq.message import build_envelope
+
+from conftest import wait_until
+
+pytest.importorskip("orjson")
+pytest.importorskip("msgpack")
+
+# The widest integers orjson and msgpack can write
+PAYLOAD = {"max": 2 ** 64 - 1, "min": -2 ** 63, "float": 0.1, "text": "héllo"}
+
+
+def envelope(message_id, payload):
+    return build_envelope("mixed", message_id, payload, MessageOptions(), int(time.time() * 1000))
+
+
+@pytest.mark.parametrize("codec", ["json", "orjson", "msgpack"])
+def test_every_codec_round_trips(codec):
+    data = get_codec(codec).encode(envelope("1", PAYLOAD))
+    assert decode_envelope(data)["message"] == PAYLOAD
+
+
+def test_untagged_json_reads_like_the_stdlib():
+    payload = {"nan": float("nan"), "inf": float("inf"), "big": 2 ** 70, "small": -2 ** 63 - 1}
+    data = json.dumps(envelope("1", payload)).encode()
+    message = decode_envelope(data)["message"]
+    assert math.isnan(message["nan"])
+    assert message["inf"] == float("inf")
+    assert message["big"] == 2 ** 70 and isinstance(message["big"], int)
+    assert message["small"] == -2 ** 63 - 1 and isinstance(message["small"], int)
+
+
+def test_queue_consumes_messages_written_by_every_codec(redis_client):
+    create_queue(redis_client, "mixed", QueueOptions(codec="json"))
+    # Producers on different settings share the queue
+    redis_client.lpush("queue:mixed", json.dumps(envelope("stdlib", {"n": 2 ** 70, "x": float("inf")})))
+    redis_client.lpush("queue:mixed", get_codec("orjson").encode(envelope("orjson", {"n": 1})))
+    redis_client.lpush("queue:mixed", get_codec("msgpack").encode(envelope("msgpack", {"n": b"\x00raw"})))
+
+    received = {}
+
+    def callback(message):
+        received[len(received)] = dict(message)
+
+    cleanup, err = consume_message_from_queue(redis_client, "mixed", callback, block_timeout=0.05)
+    assert err is None
+    try:
+        assert wait_until(lambda: len(received) == 3)
+    finally:
+        cleanup()
+
+    assert received[0] == {"n": 2 ** 70, "x": float("inf")}
+    assert received[1] == {"n": 1}
+    assert received[2] == {"n": b"\x00raw"}
@@ -0,0 +1,133 @@
+import json
+import time
+
+import pytest
+
+from bizzmq import MessageOptions, QueueOptions, create_queue
+from bizzmq.dlq import (
+    dead_letter_count, dead_letter_key, get_dead_letter_messages, iter_dead_letter_messages,
+    purge_dead_letter_messages, redrive_dead_letter_messages,
+)
+from bizzmq.message import build_envelope
+from bizzmq.payloads import PAYLOAD_REF_FIELD
+
+
+def dead_letter(n, error="boom", original_queue="jobs", **fields):
+    envelope = build_envelope(f"{original_queue}_dlq", f"message:{n}", {"n": n}, MessageOptions(), int(time.time() * 1000))
+    envelope["options"].update({"message": error, "originalQueue": original_queue, "retryCount": 3, "failedAt": 1})
+    envelope.update(fields)
+    return json.dumps(envelope)
+
+
+def fill(redis_client, entries, queue_name="jobs"):
+    # Oldest first, pushed to the head like the consumer does
+    for entry in entries:
+        redis_client.lpush(dead_letter_key(queue_name), entry)
+
+
+def numbers(dead_letters):
+    return [dead_letter["message"]["n"] for dead_letter in dead_letters]
+
+
+@pytest.fixture
+def jobs(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True))
+    return redis_client
+
+
+def test_pages_run_oldest_first(jobs):
+    fill(jobs, [dead_letter(n) for n in range(7)])
+
+    assert numbers(get_dead_letter_messages(jobs, "jobs", 0, 3)) == [0, 1, 2]
+    assert numbers(get_dead_letter_messages(jobs, "jobs", 3, 3)) == [3, 4, 5]
+    assert numbers(get_dead_letter_messages(jobs, "jobs", 6, 3)) == [6]
+    assert get_dead_letter_messages(jobs, "jobs", 10, 3) == []
+    assert get_dead_letter_messages(jobs, "jobs", 0, 0) == []
+    with pytest.raises(ValueError):
+        get_dead_letter_messages(jobs, "jobs", -1, 3)
+
+
+def test_filtered_pages_count_only_matches(jobs):
+    fill(jobs, [dead_letter(n, "timeout" if n % 2 else "bad input") for n in range(10)])
+
+    assert numbers(get_dead_letter_messages(jobs, "jobs", 0, 2, error="timeout")) == [1, 3]
+    assert numbers(get_dead_letter_messages(jobs, "jobs", 2, 2, error="timeout")) == [5, 7]
+    assert numbers(get_dead_letter_messages(jobs, "jobs", 4, 2, error="timeout")) == [9]
+    # Matched as a substring of the error message
+    assert numbers(get_dead_letter_messages(jobs, "jobs", 0, 2, error="input")) == [0, 2]
+
+
+def test_filter_by_original_queue(jobs):
+    fill(jobs, [dead_letter(0, original_queue="jobs"), dead_letter(1, original_queue="emails"), dead_letter(2, original_queue="jobs")])
+
+    assert numbers(iter_dead_letter_messages(jobs, "jobs", original_queue="emails")) == [1]
+    assert numbers(get_dead_letter_messages(jobs, "jobs", original_queue="jobs")) == [0, 2]
+    assert numbers(get_dead_letter_messages(jobs, "jobs", error="boom", original_queue="jobs")) == [0, 2]
+
+
+def test_iteration_reads_every_window_and_skips_garbage(jobs):
+    fill(jobs, [dead_letter(0), "not json", dead_letter(1), dead_letter(2), dead_letter(3)])
+
+    assert numbers(iter_dead_letter_messages(jobs, "jobs", window=2)) == [0, 1, 2, 3]
+    assert numbers(get_dead_letter_messages(jobs, "jobs", 0, 10)) == [0, 1, 2, 3]
+
+
+def test_redrive_stops_at_the_limit(jobs):
+    fill(jobs, [dead_letter(n) for n in range(5)])
+
+    assert redrive_dead_letter_messages(jobs, "jobs", limit=2, window=2, batch_size=1) == 2
+
+    assert numbers(get_dead_letter_messages(jobs, "jobs")) == [2, 3, 4]
+    # Oldest dead letters are redriven first and consumed first
+    redriven = [json.loads(raw) for raw in reversed(jobs.lrange("queue:jobs", 0, -1))]
+    assert numbers(redriven) == [0, 1]
+    assert all(set(message["options"]) == {"priority", "retries"} for message in redriven)
+    assert {message["queue_name"] for message in redriven} == {"jobs"}
+
+
+def test_redrive_walks_every_window(jobs):
+    fill(jobs, [dead_letter(n) for n in range(7)])
+
+    assert redrive_dead_letter_messages(jobs, "jobs", window=3, batch_size=2) == 7
+
+    assert dead_letter_count(jobs, "jobs") == 0
+    assert numbers(json.loads(raw) for raw in reversed(jobs.lrange("queue:jobs", 0, -1))) == list(range(7))
+
+
+def test_filtered_redrive_leaves_the_rest(jobs):
+    create_queue(jobs, "emails", QueueOptions())
+    fill(jobs, [dead_letter(n, "timeout" if n % 2 else "bad input", "emails" if n == 3 else "jobs") for n in range(6)])
+
+    assert redrive_dead_letter_messages(jobs, "jobs", error="timeout", limit=2, window=2) == 2
+
+    assert numbers(get_dead_letter_messages(jobs, "jobs")) == [0, 2, 4, 5]
+    # Each message goes back to the queue it failed on
+    assert numbers(json.loads(raw) for raw in jobs.lrange("queue:jobs", 0, -1)) == [1]
+    assert numbers(json.loads(raw) for raw in jobs.lrange("queue:emails", 0, -1)) == [3]
+
+
+def test_purge_deletes_everything(jobs):
+    fill(jobs, [dead_letter(n) for n in range(4)] + ["not json"])
+
+    assert purge_dead_letter_messages(jobs, "jobs") == 5
+
+    assert not jobs.exists(dead_letter_key("jobs"))
+    assert purge_dead_letter_messages(jobs, "jobs") == 0
+
+
+def test_filtered_purge_keeps_the_rest_and_their_payloads(jobs):
+    jobs.set("queue_payload:a", "big")
+    jobs.set("queue_payload:b", "big")
+    fill(jobs, [
+        dead_letter(0, "timeout", **{PAYLOAD_REF_FIELD: "queue_payload:a"}),
+        dead_letter(1, "bad input", **{PAYLOAD_REF_FIELD: "queue_payload:b"}),
+        "not json",
+    ] + [dead_letter(n, "timeout" if n % 2 else "bad input") for n in range(2, 7)])
+
+    assert purge_dead_letter_messages(jobs, "jobs", error="timeout", window=2) == 3
+
+    assert numbers(get_dead_letter_messages(jobs, "jobs")) == [1, 2, 4, 6]
+    # Entries that can't be decoded never match a filter
+    assert jobs.llen(dead_letter_key("jobs")) == 5
+    assert not jobs.exists("queue_payload:a")
+    assert jobs.exists("queue_payload:b")
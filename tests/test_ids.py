@@ -0,0 +1,140 @@
+import time
+
+import pytest
+
+from bizzmq import MessageOptions, QueueOptions, create_queue, publish_message_to_queue, publish_messages_to_queue
+from bizzmq import ids
+from bizzmq.ids import ID_PREFIX, NODE_ID_BITS, SEQUENCE_BITS, MessageIdGenerator, message_id_timestamp, new_message_id
+from bizzmq.producer import dedup_key
+
+NOW_MS = 1_700_000_000_000
+
+
+def decode(message_id):
+    value = 0
+    for char in message_id[len(ID_PREFIX):]:
+        value = (value << 5) | ids._ALPHABET.index(char)
+    return value
+
+
+def node_of(message_id):
+    return (decode(message_id) >> SEQUENCE_BITS) & ((1 << NODE_ID_BITS) - 1)
+
+
+def freeze_clock(monkeypatch, now_ms):
+    monkeypatch.setattr(ids.time, "time", lambda: now_ms / 1000)
+
+
+def test_ids_increase_within_a_millisecond(monkeypatch):
+    freeze_clock(monkeypatch, NOW_MS)
+    generator = MessageIdGenerator(node_id=7)
+
+    made = [generator.new_id() for _ in range(1000)]
+
+    assert made == sorted(made)
+    assert len(set(made)) == len(made)
+    assert {message_id_timestamp(message_id) for message_id in made} == {NOW_MS}
+
+
+def test_ids_keep_increasing_when_the_clock_steps_back(monkeypatch):
+    generator = MessageIdGenerator(node_id=7)
+    freeze_clock(monkeypatch, NOW_MS)
+    before = generator.new_id()
+    freeze_clock(monkeypatch, NOW_MS - 5_000)
+
+    after = generator.new_id()
+
+    assert after > before
+    # Stays on the last millisecond it handed out instead of going back in time
+    assert message_id_timestamp(after) == NOW_MS
+
+
+def test_ids_sort_by_creation_time(monkeypatch):
+    generator = MessageIdGenerator()
+    freeze_clock(monkeypatch, NOW_MS + 1)
+    earlier = generator.new_id()
+    freeze_clock(monkeypatch, NOW_MS + 2)
+
+    assert generator.new_id() > earlier
+
+
+def test_node_id_is_written_into_every_id():
+    generator = MessageIdGenerator(node_id=42)
+    assert node_of(generator.new_id()) == 42
+
+    generator.set_node_id(ids.MAX_NODE_ID)
+    assert node_of(generator.new_id()) == ids.MAX_NODE_ID
+
+
+@pytest.mark.parametrize("node_id", [-1, ids.MAX_NODE_ID + 1])
+def test_out_of_range_node_ids_are_rejected(node_id):
+    with pytest.raises(ValueError, match="node_id"):
+        MessageIdGenerator(node_id=node_id)
+    with pytest.raises(ValueError, match="node_id"):
+        MessageIdGenerator().set_node_id(node_id)
+
+
+def test_node_id_comes_from_the_environment(monkeypatch):
+    monkeypatch.setenv("BIZZMQ_NODE_ID", "513")
+    assert ids._node_id_from_env() == 513
+    monkeypatch.delenv("BIZZMQ_NODE_ID")
+    assert ids._node_id_from_env() is None
+
+
+def test_forked_child_keeps_a_pinned_node_id_but_restarts_its_sequence():
+    generator = MessageIdGenerator(node_id=42)
+    generator.new_id()
+
+    generator._after_fork()
+
+    assert generator.node_id == 42
+    assert generator._last_ms == 0
+
+
+def test_message_ids_are_prefixed_and_checked():
+    message_id = new_message_id()
+    assert message_id.startswith(ID_PREFIX)
+    assert abs(message_id_timestamp(message_id) - time.time() * 1000) < 5_000
+    with pytest.raises(ValueError):
+        message_id_timestamp("message:not-an-id")
+
+
+def test_duplicate_publish_is_dropped(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+    options = MessageOptions(dedup_key="order-1", dedup_ttl=60)
+
+    first = publish_message_to_queue(redis_client, "jobs", {"n": 1}, options)
+    second = publish_message_to_queue(redis_client, "jobs", {"n": 2}, options)
+
+    assert second == first
+    assert redis_client.llen("queue:jobs") == 1
+    assert redis_client.get(dedup_key("jobs", "order-1")).decode() == first
+    assert 0 < redis_client.pttl(dedup_key("jobs", "order-1")) <= 60_000
+
+
+def test_dedup_key_expires_after_its_ttl(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+    options = MessageOptions(dedup_key="order-1", dedup_ttl=0.05)
+
+    first = publish_message_to_queue(redis_client, "jobs", {"n": 1}, options)
+    time.sleep(0.1)
+    second = publish_message_to_queue(redis_client, "jobs", {"n": 2}, options)
+
+    assert second != first
+    assert redis_client.llen("queue:jobs") == 2
+
+
+def test_different_dedup_keys_are_independent(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+
+    publish_message_to_queue(redis_client, "jobs", 1, MessageOptions(dedup_key="a"))
+    publish_message_to_queue(redis_client, "jobs", 2, MessageOptions(dedup_key="b"))
+
+    assert redis_client.llen("queue:jobs") == 2
+
+
+def test_batch_publish_rejects_a_dedup_key(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+
+    with pytest.raises(ValueError, match="dedup_key"):
+        publish_messages_to_queue(redis_client, "jobs", [1, 2], MessageOptions(dedup_key="a"))
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+from bizzmq import MemoryBackend, MessageOptions, QueueOptions, RetryOptions
+from bizzmq.scripts import RESULT_ALREADY_SETTLED, RESULT_DEAD_LETTERED, RESULT_DISCARDED, RESULT_REQUEUED, RESULT_SCHEDULED
+
+
+def make_backend(**options):
+    backend = MemoryBackend()
+    backend.create_queue("jobs", QueueOptions(**options))
+    return backend
+
+
+def fail_next(backend, err="boom"):
+    delivery = backend.pop("jobs", 1)
+    assert delivery is not None
+    return backend.fail(delivery, ValueError(err))
+
+
+def test_failures_are_retried_then_dead_lettered():
+    backend = make_backend(config_dead_letter_queue=True, max_retries=2)
+    message_id = backend.push("jobs", {"n": 1})
+
+    assert fail_next(backend) == RESULT_REQUEUED
+    retried = backend.pop("jobs", 1)
+    assert retried.message_id == message_id
+    assert retried.envelope["options"]["retryCount"] == 1
+    assert backend.fail(retried, ValueError("boom")) == RESULT_REQUEUED
+    assert fail_next(backend) == RESULT_DEAD_LETTERED
+
+    assert backend.queue_length("jobs") == 0
+    assert backend.in_flight_count("jobs") == 0
+    [dead_letter] = backend.iter_dead_letter_messages("jobs")
+    assert dead_letter["message_id"] == message_id
+    assert dead_letter["message"] == {"n": 1}
+    assert dead_letter["options"]["originalQueue"] == "jobs"
+    assert dead_letter["options"]["message"] == "boom"
+
+
+def test_retries_wait_for_their_backoff():
+    backend = make_backend(config_dead_letter_queue=True, max_retries=1, retry=RetryOptions(strategy="fixed", delay=0.2, jitter=False))
+    backend.push("jobs", "x")
+
+    failed_at = time.monotonic()
+    assert fail_next(backend) == RESULT_SCHEDULED
+    assert (backend.queue_length("jobs"), backend.queue_depth("jobs")) == (0, 1)
+    assert backend.pop("jobs", 0.05) is None
+
+    retried = backend.pop("jobs", 2)
+    assert retried.data == {"data": "x"}
+    assert time.monotonic() - failed_at >= 0.15
+
+
+def test_failures_skip_retries_without_them_and_are_dropped_without_a_dlq():
+    dead_lettering = make_backend(config_dead_letter_queue=True, max_retries=0)
+    dead_lettering.push("jobs", 1)
+    assert fail_next(dead_lettering) == RESULT_DEAD_LETTERED
+    assert dead_lettering.dead_letter_count("jobs") == 1
+
+    discarding = make_backend(max_retries=3)
+    discarding.push("jobs", 1)
+    assert fail_next(discarding) == RESULT_DISCARDED
+    assert (discarding.queue_depth("jobs"), discarding.in_flight_count("jobs"), discarding.dead_letter_count("jobs")) == (0, 0, 0)
+
+
+def test_a_delivery_is_settled_once():
+    backend = make_backend(config_dead_letter_queue=True, max_retries=1)
+    backend.push("jobs", 1)
+    delivery = backend.pop("jobs", 1)
+
+    backend.ack(delivery)
+
+    assert backend.requeue(delivery, ValueError("late")) == RESULT_ALREADY_SETTLED
+    assert backend.dead_letter(delivery, ValueError("late")) == RESULT_ALREADY_SETTLED
+    assert (backend.queue_depth("jobs"), backend.dead_letter_count("jobs")) == (0, 0)
+
+
+def test_delayed_messages_wait_until_due():
+    backend = make_backend()
+    backend.push("jobs", "later", MessageOptions(delay=0.2))
+    backend.push("jobs", "at", MessageOptions(run_at=time.time() + 0.1))
+    backend.push("jobs", "now")
+
+    assert (backend.queue_length("jobs"), backend.queue_depth("jobs")) == (1, 3)
+    assert backend.pop("jobs", 1).data == {"data": "now"}
+    assert backend.pop("jobs", 0.01) is None
+    # A waiting pop wakes up as soon as the next one is due
+    assert backend.pop("jobs", 1).data == {"data": "at"}
+    assert backend.pop("jobs", 1).data == {"data": "later"}
+
+
+def test_redrive_resets_matching_dead_letters():
+    backend = make_backend(config_dead_letter_queue=True, max_retries=0, priority_levels=2)
+    for n, error in enumerate(["timeout", "bad input", "timeout", "timeout"]):
+        backend.push("jobs", n, MessageOptions(priority=1))
+        fail_next(backend, error)
+
+    assert backend.redrive_dead_letter_messages("jobs", error="timeout", limit=2) == 2
+
+    assert [dead_letter["message"] for dead_letter in backend.iter_dead_letter_messages("jobs")] == [1, 3]
+    redriven = [backend.pop("jobs", 1) for _ in range(2)]
+    assert [delivery.data for delivery in redriven] == [{"data": 0}, {"data": 2}]
+    # Failure details are gone and the priority is kept
+    assert [delivery.envelope["options"] for delivery in redriven] == [{"priority": 1, "retries": MessageOptions().retries}] * 2
+    assert backend.redrive_dead_letter_messages("jobs", original_queue="elsewhere") == 0
+
+
+def test_purge_with_and_without_filters():
+    backend = make_backend(config_dead_letter_queue=True, max_retries=0)
+    for n, error in enumerate(["timeout", "bad input", "timeout"]):
+        backend.push("jobs", n)
+        fail_next(backend, error)
+
+    assert backend.purge_dead_letter_messages("jobs", error="timeout") == 2
+    assert [dead_letter["message"] for dead_letter in backend.iter_dead_letter_messages("jobs")] == [1]
+    assert backend.purge_dead_letter_messages("jobs") == 1
+    assert backend.dead_letter_count("jobs") == 0
+
+
+def test_unknown_queues_and_unsupported_options_are_rejected():
+    backend = MemoryBackend()
+
+    with pytest.raises(ValueError, match="does not exist"):
+        backend.push("missing", 1)
+    with pytest.raises(ValueError):
+        backend.create_queue("streamed", QueueOptions(storage="stream"))
+    with pytest.raises(ValueError):
+        backend.create_queue("partitioned", QueueOptions(partitions=2))
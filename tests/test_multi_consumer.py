@@ -0,0 +1,58 @@
+import logging
+
+from bizzmq import QueueOptions, consume_from_queues, create_queue, publish_message_to_queue
+from bizzmq import multi_consumer
+from bizzmq.dlq import dead_letter_count
+from bizzmq.metrics import MESSAGES_DISCARDED
+
+from conftest import wait_until
+
+
+def test_every_queue_is_served(redis_client):
+    create_queue(redis_client, "emails", QueueOptions())
+    create_queue(redis_client, "reports", QueueOptions())
+    for value in range(3):
+        publish_message_to_queue(redis_client, "emails", {"n": value}, None)
+        publish_message_to_queue(redis_client, "reports", {"n": value}, None)
+    received = {"emails": [], "reports": []}
+
+    cleanup, err = consume_from_queues(redis_client, {name: received[name].append for name in received}, weights={"emails": 3, "reports": 1}, block_timeout=0.05)
+    assert err is None
+    try:
+        assert wait_until(lambda: all(len(messages) == 3 for messages in received.values()))
+    finally:
+        cleanup()
+
+
+def test_failed_message_goes_to_its_queue_dlq(redis_client):
+    create_queue(redis_client, "emails", QueueOptions(config_dead_letter_queue=True, max_retries=0))
+    publish_message_to_queue(redis_client, "emails", {"n": 1}, None)
+
+    def callback(message):
+        raise ValueError("boom")
+
+    cleanup, err = consume_from_queues(redis_client, {"emails": callback}, block_timeout=0.05)
+    assert err is None
+    try:
+        assert wait_until(lambda: dead_letter_count(redis_client, "emails") == 1)
+    finally:
+        cleanup()
+
+
+def test_failed_move_is_logged_and_counted(redis_client, stats, caplog, monkeypatch):
+    create_queue(redis_client, "emails", QueueOptions(config_dead_letter_queue=True, max_retries=0))
+    publish_message_to_queue(redis_client, "emails", {"n": 1}, None)
+    monkeypatch.setattr(multi_consumer, "_move_message_to_dlq", lambda *args, **kwargs: Exception("Failed to publish message to DLQ: script failed"))
+
+    def callback(message):
+        raise ValueError("boom")
+
+    with caplog.at_level(logging.ERROR, logger="bizzmq"):
+        cleanup, err = consume_from_queues(redis_client, {"emails": callback}, block_timeout=0.05)
+        assert err is None
+        try:
+            assert wait_until(lambda: stats.counters.get((MESSAGES_DISCARDED, "emails")) == 1)
+        finally:
+            cleanup()
+
+    assert any("script failed" in record.getMessage() for record in caplog.records)
@@ -0,0 +1,77 @@
+from bizzmq import MessageOptions, QueueOptions, consume_message_from_queue, create_queue, partition_names, publish_message_to_queue, publish_messages_to_queue, queue_depth
+from bizzmq.backend import RedisBackend
+from bizzmq.cluster import hash_tag, partition_name
+from bizzmq.dlq import dead_letter_count, purge_dead_letter_messages, redrive_dead_letter_messages
+from bizzmq.metrics import DEAD_LETTER_DEPTH, QUEUE_DEPTH, SCHEDULED_DEPTH, DepthSampler
+
+from conftest import wait_until
+
+
+def test_partition_names_keep_the_index_inside_the_hash_tag():
+    assert partition_names("orders", 2) == ["orders#0", "orders#1"]
+    assert partition_name("{orders}", 3) == "{orders#3}"
+    assert hash_tag("orders") == "{orders}"
+    assert hash_tag("{billing}:invoices") == "{billing}:invoices"
+
+
+def test_messages_with_the_same_key_share_a_partition(redis_client):
+    create_queue(redis_client, "orders", QueueOptions(partitions=4))
+    for value in range(10):
+        publish_message_to_queue(redis_client, "orders", value, MessageOptions(partition_key="customer-1"))
+
+    lengths = [redis_client.llen(f"queue:{name}") for name in partition_names("orders", 4)]
+    assert sorted(lengths) == [0, 0, 0, 10]
+
+
+def test_depth_is_summed_over_partitions(redis_client, stats):
+    create_queue(redis_client, "orders", QueueOptions(partitions=3, priority_levels=2))
+    publish_messages_to_queue(redis_client, "orders", range(7), chunk_size=1)
+    publish_messages_to_queue(redis_client, "orders", range(2), MessageOptions(delay=60), chunk_size=1)
+    redis_client.lpush("queue:orders#1_dlq", "{}")
+
+    assert queue_depth(redis_client, "orders") == 9
+    assert RedisBackend(redis_client).queue_length("orders") == 7
+    assert dead_letter_count(redis_client, "orders") == 1
+
+    depths = DepthSampler(redis_client, ["orders"]).sample()
+    assert depths["orders"] == {QUEUE_DEPTH: 7, SCHEDULED_DEPTH: 2, DEAD_LETTER_DEPTH: 1}
+    assert stats.gauges[(QUEUE_DEPTH, "orders")] == 7
+
+
+def test_consumer_drains_every_partition(redis_client):
+    create_queue(redis_client, "orders", QueueOptions(partitions=3))
+    publish_messages_to_queue(redis_client, "orders", range(9), chunk_size=1)
+    received = []
+
+    cleanup, err = consume_message_from_queue(redis_client, "orders", received.append, block_timeout=0.05)
+    assert err is None
+    try:
+        assert wait_until(lambda: len(received) == 9)
+    finally:
+        cleanup()
+    assert queue_depth(redis_client, "orders") == 0
+
+
+def test_dead_letter_lifecycle_runs_without_transactions(cluster_redis_client):
+    # RedisCluster pipelines reject transaction=True, every path here must do without
+    redis_client = cluster_redis_client
+    queue_name = hash_tag("orders")
+    create_queue(redis_client, queue_name, QueueOptions(partitions=2, config_dead_letter_queue=True, max_retries=0))
+    publish_messages_to_queue(redis_client, queue_name, range(6), chunk_size=1)
+
+    def callback(message):
+        raise ValueError("boom")
+
+    cleanup, err = consume_message_from_queue(redis_client, queue_name, callback, block_timeout=0.05, reliable=True, consumer_id="c1")
+    assert err is None
+    try:
+        assert wait_until(lambda: dead_letter_count(redis_client, queue_name) == 6)
+    finally:
+        cleanup()
+
+    assert DepthSampler(redis_client, [queue_name]).sample()[queue_name][DEAD_LETTER_DEPTH] == 6
+    assert redrive_dead_letter_messages(redis_client, queue_name, limit=2) == 2
+    assert queue_depth(redis_client, queue_name) == 2
+    assert purge_dead_letter_messages(redis_client, queue_name, error="timeout") == 0
+    assert purge_dead_letter_messages(redis_client, queue_name) == 4
+    assert dead_letter_count(redis_client, queue_name) == 0
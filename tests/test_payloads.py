@@ -0,0 +1,143 @@
+import asyncio
+import json
+import time
+
+import pytest
+import redis
+
+from bizzmq import QueueFullError, QueueOptions, consume_message_from_queue, create_queue, publish_message_to_queue, publish_messages_to_queue
+from bizzmq.dlq import dead_letter_count
+from bizzmq.payloads import PAYLOAD_REF_FIELD
+
+from conftest import fake_async_client, wait_until
+
+BIG = {"body": "x" * 4096}
+
+
+def payload_keys(redis_client):
+    return redis_client.keys("queue_payload:*")
+
+
+def test_large_payload_is_offloaded_and_restored(redis_client):
+    create_queue(redis_client, "reports", QueueOptions(claim_check_threshold=1024))
+    publish_message_to_queue(redis_client, "reports", BIG, None)
+
+    envelope = json.loads(redis_client.lindex("queue:reports", 0))
+    assert PAYLOAD_REF_FIELD in envelope
+    assert redis_client.ttl(envelope[PAYLOAD_REF_FIELD]) > 0
+
+    received = []
+    cleanup, err = consume_message_from_queue(redis_client, "reports", lambda message: received.append(dict(message)), block_timeout=0.05)
+    assert err is None
+    try:
+        assert wait_until(lambda: received)
+    finally:
+        cleanup()
+    assert received == [BIG]
+    # Handled successfully, so the payload goes right away instead of at its TTL
+    assert payload_keys(redis_client) == []
+
+
+def test_compressed_payload_round_trips(redis_client):
+    create_queue(redis_client, "reports", QueueOptions(compression="zlib", compression_threshold=256))
+    publish_message_to_queue(redis_client, "reports", BIG, None)
+
+    assert len(redis_client.lindex("queue:reports", 0)) < 1024
+    received = []
+    cleanup, err = consume_message_from_queue(redis_client, "reports", lambda message: received.append(dict(message)), block_timeout=0.05)
+    assert err is None
+    try:
+        assert wait_until(lambda: received)
+    finally:
+        cleanup()
+    assert received == [BIG]
+
+
+def test_dead_lettered_message_keeps_its_payload(redis_client):
+    create_queue(redis_client, "reports", QueueOptions(claim_check_threshold=1024, config_dead_letter_queue=True, max_retries=0))
+    publish_message_to_queue(redis_client, "reports", BIG, None)
+
+    def callback(message):
+        raise ValueError("boom")
+
+    cleanup, err = consume_message_from_queue(redis_client, "reports", callback, block_timeout=0.05)
+    assert err is None
+    try:
+        assert wait_until(lambda: dead_letter_count(redis_client, "reports") == 1)
+    finally:
+        cleanup()
+    assert len(payload_keys(redis_client)) == 1
+
+
+def test_failed_push_deletes_the_offloaded_payload(redis_client, monkeypatch):
+    create_queue(redis_client, "reports", QueueOptions(claim_check_threshold=1024))
+
+    def broken_lpush(*args, **kwargs):
+        raise redis.ConnectionError("connection lost")
+
+    monkeypatch.setattr(redis_client, "lpush", broken_lpush)
+    with pytest.raises(RuntimeError, match="connection lost"):
+        publish_message_to_queue(redis_client, "reports", BIG, None)
+
+    assert payload_keys(redis_client) == []
+
+
+def test_rejected_publish_deletes_the_offloaded_payload(redis_client):
+    create_queue(redis_client, "reports", QueueOptions(claim_check_threshold=1024, max_length=1))
+    publish_message_to_queue(redis_client, "reports", BIG, None)
+
+    with pytest.raises(QueueFullError):
+        publish_message_to_queue(redis_client, "reports", BIG, None)
+    with pytest.raises(QueueFullError):
+        publish_messages_to_queue(redis_client, "reports", [BIG, BIG])
+
+    assert len(payload_keys(redis_client)) == 1
+
+
+def test_failed_batch_publish_deletes_the_offloaded_payloads(redis_client):
+    create_queue(redis_client, "reports", QueueOptions(claim_check_threshold=1024))
+    # LPUSH fails with WRONGTYPE after the payloads were written in the same pipeline
+    redis_client.set("queue:reports", "not a list")
+
+    with pytest.raises(RuntimeError, match="WRONGTYPE"):
+        publish_messages_to_queue(redis_client, "reports", [BIG, BIG])
+
+    assert payload_keys(redis_client) == []
+
+
+def test_failed_async_batch_publish_deletes_the_offloaded_payloads():
+    async def scenario():
+        client = fake_async_client()
+        await client.create_queue("reports", QueueOptions(claim_check_threshold=1024))
+        await client.redisInstance.set("queue:reports", "not a list")
+
+        with pytest.raises(RuntimeError, match="WRONGTYPE"):
+            await client.publish_messages_to_queue("reports", [BIG, BIG])
+
+        assert await client.redisInstance.keys("queue_payload:*") == []
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_redelivered_copy_still_finds_its_payload(redis_client):
+    create_queue(redis_client, "reports", QueueOptions(claim_check_threshold=1024, config_dead_letter_queue=True))
+    publish_message_to_queue(redis_client, "reports", BIG, None)
+    received = []
+
+    def callback(message):
+        received.append(dict(message))
+        if len(received) == 1:
+            # Outlives the visibility timeout, so the reaper requeues a copy meanwhile
+            time.sleep(0.5)
+
+    cleanup, err = consume_message_from_queue(redis_client, "reports", callback, block_timeout=0.05, reliable=True, consumer_id="c1", visibility_timeout=0.2)
+    assert err is None
+    try:
+        assert wait_until(lambda: len(received) == 2)
+        # The copy settles normally and releases the payload
+        assert wait_until(lambda: payload_keys(redis_client) == [])
+    finally:
+        cleanup()
+    assert received == [BIG, BIG]
+    assert dead_letter_count(redis_client, "reports") == 0
@@ -0,0 +1,21 @@
+import json
+import time
+
+from bizzmq import QueueOptions, create_queue, publish_messages_to_queue
+
+
+def test_batch_messages_are_stamped_when_they_are_produced(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+
+    def slow_messages():
+        for value in range(3):
+            yield {"n": value}
+            time.sleep(0.05)
+
+    publish_messages_to_queue(redis_client, "jobs", slow_messages(), chunk_size=10)
+
+    # LPUSH puts the first message at the tail
+    envelopes = [json.loads(raw) for raw in reversed(redis_client.lrange("queue:jobs", 0, -1))]
+    created = [envelope["timestamp_created"] for envelope in envelopes]
+    assert [envelope["message"]["n"] for envelope in envelopes] == [0, 1, 2]
+    assert created[2] - created[0] >= 90
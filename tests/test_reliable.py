@@ -0,0 +1,102 @@
+import time
+
+from bizzmq import QueueOptions, consume_message_from_queue, create_queue, publish_messages_to_queue
+from bizzmq.consumer import _reap_expired_messages
+from bizzmq.scripts import run_script
+
+from conftest import wait_until
+
+
+def claim(redis_client, queue_name, consumer_id, claimed_at_ms):
+    keys = [f"queue:{queue_name}", f"queue_processing:{queue_name}:{consumer_id}", f"queue_inflight:{queue_name}:{consumer_id}", f"queue_consumers:{queue_name}"]
+    return run_script(redis_client, "claim_message", keys, [claimed_at_ms, consumer_id])
+
+
+def consumers(redis_client, queue_name):
+    return {member.decode() for member in redis_client.smembers(f"queue_consumers:{queue_name}")}
+
+
+def test_claim_registers_the_consumer(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+    publish_messages_to_queue(redis_client, "jobs", [1])
+
+    assert claim(redis_client, "jobs", "c1", int(time.time() * 1000)) is not None
+    assert consumers(redis_client, "jobs") == {"c1"}
+    assert redis_client.llen("queue_processing:jobs:c1") == 1
+
+
+def test_reaper_requeues_and_unregisters_a_crashed_consumer(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True, max_retries=3))
+    publish_messages_to_queue(redis_client, "jobs", [1, 2, 3])
+    long_ago = int(time.time() * 1000) - 60_000
+    claim(redis_client, "jobs", "crashed", long_ago)
+    claim(redis_client, "jobs", "crashed", long_ago)
+    claim(redis_client, "jobs", "busy", int(time.time() * 1000))
+
+    assert _reap_expired_messages(redis_client, "jobs", visibility_timeout=30) == 2
+
+    assert redis_client.llen("queue:jobs") == 2
+    assert redis_client.llen("queue_processing:jobs:crashed") == 0
+    # The consumer still inside its visibility timeout keeps its message and its registration
+    assert consumers(redis_client, "jobs") == {"busy"}
+
+
+def register(redis_client, queue_name, consumer_id, seen_ms):
+    redis_client.sadd(f"queue_consumers:{queue_name}", consumer_id)
+    redis_client.zadd(f"queue_heartbeats:{queue_name}", {consumer_id: seen_ms})
+
+
+def test_reaper_keeps_live_idle_consumers(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+    received = []
+    cleanup, err = consume_message_from_queue(redis_client, "jobs", received.append, block_timeout=0.05, reliable=True, consumer_id="live")
+    assert err is None
+    try:
+        # Blocked on an empty queue with nothing in flight, but its heartbeat is fresh
+        time.sleep(0.1)
+        _reap_expired_messages(redis_client, "jobs", visibility_timeout=30)
+        assert consumers(redis_client, "jobs") == {"live"}
+        publish_messages_to_queue(redis_client, "jobs", [1])
+        assert wait_until(lambda: received)
+    finally:
+        cleanup()
+    assert consumers(redis_client, "jobs") == set()
+    assert redis_client.zcard("queue_heartbeats:jobs") == 0
+
+
+def test_reaper_drops_idle_consumers_not_seen_for_a_visibility_timeout(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+    now = int(time.time() * 1000)
+    register(redis_client, "jobs", "gone", now - 60_000)
+    register(redis_client, "jobs", "fresh", now)
+
+    _reap_expired_messages(redis_client, "jobs", visibility_timeout=30)
+
+    assert consumers(redis_client, "jobs") == {"fresh"}
+    assert redis_client.zscore("queue_heartbeats:jobs", "gone") is None
+
+
+def test_message_moved_by_a_consumer_that_crashed_before_tracking_it_is_recovered(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True))
+    publish_messages_to_queue(redis_client, "jobs", [1])
+    register(redis_client, "jobs", "crashed", int(time.time() * 1000) - 60_000)
+    # BLMOVE went through, the crash came before the in-flight entry was written
+    redis_client.lmove("queue:jobs", "queue_processing:jobs:crashed", "RIGHT", "LEFT")
+
+    # The first sweep adopts the message with a fresh claim time, and its owner stays registered
+    assert _reap_expired_messages(redis_client, "jobs", visibility_timeout=30) == 0
+    assert consumers(redis_client, "jobs") == {"crashed"}
+
+    time.sleep(0.02)
+    assert _reap_expired_messages(redis_client, "jobs", visibility_timeout=0.01) == 1
+    assert redis_client.llen("queue:jobs") == 1
+    assert consumers(redis_client, "jobs") == set()
+
+
+def test_zero_visibility_timeout_is_rejected(client):
+    client.create_queue("jobs")
+
+    cleanup, err = client.consume_message_from_queue("jobs", print, reliable=True, visibility_timeout=0)
+
+    assert cleanup is None
+    assert "visibility_timeout" in str(err)
@@ -0,0 +1,103 @@
+import logging
+
+from bizzmq import QueueOptions, consume_message_from_queue, create_queue, publish_message_to_queue
+from bizzmq import consumer
+from bizzmq.dlq import dead_letter_count, get_dead_letter_messages, redrive_dead_letter_messages
+from bizzmq.metrics import MESSAGES_DEAD_LETTERED, MESSAGES_DISCARDED, MESSAGES_RETRIED
+
+from conftest import wait_until
+
+
+def failing_consumer(redis_client, queue_name, **kwargs):
+    attempts = []
+
+    def callback(message):
+        attempts.append(message)
+        raise ValueError("boom")
+
+    cleanup, err = consume_message_from_queue(redis_client, queue_name, callback, block_timeout=0.05, **kwargs)
+    assert err is None
+    return attempts, cleanup
+
+
+def test_failed_message_is_retried_then_dead_lettered(redis_client, stats):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True, max_retries=2))
+    message_id = publish_message_to_queue(redis_client, "jobs", {"n": 1}, None)
+
+    attempts, cleanup = failing_consumer(redis_client, "jobs")
+    try:
+        assert wait_until(lambda: dead_letter_count(redis_client, "jobs") == 1)
+    finally:
+        cleanup()
+
+    assert len(attempts) == 3
+    assert redis_client.llen("queue:jobs") == 0
+    [dead_letter] = get_dead_letter_messages(redis_client, "jobs")
+    assert dead_letter["message_id"] == message_id
+    assert dead_letter["message"] == {"n": 1}
+    assert dead_letter["options"]["originalQueue"] == "jobs"
+    assert dead_letter["options"]["message"] == "boom"
+    assert stats.counters[(MESSAGES_RETRIED, "jobs")] == 2
+    assert stats.counters[(MESSAGES_DEAD_LETTERED, "jobs")] == 1
+
+
+def test_reliable_consumer_settles_dead_lettered_message(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True, max_retries=1))
+    publish_message_to_queue(redis_client, "jobs", {"n": 1}, None)
+
+    _, cleanup = failing_consumer(redis_client, "jobs", reliable=True, consumer_id="c1")
+    try:
+        assert wait_until(lambda: dead_letter_count(redis_client, "jobs") == 1)
+    finally:
+        cleanup()
+
+    assert redis_client.llen("queue_processing:jobs:c1") == 0
+    assert redis_client.zcard("queue_inflight:jobs:c1") == 0
+
+
+def test_failed_message_without_dlq_is_discarded(redis_client, stats):
+    create_queue(redis_client, "jobs", QueueOptions(max_retries=2))
+    publish_message_to_queue(redis_client, "jobs", {"n": 1}, None)
+
+    attempts, cleanup = failing_consumer(redis_client, "jobs")
+    try:
+        assert wait_until(lambda: stats.counters.get((MESSAGES_DISCARDED, "jobs")) == 1)
+    finally:
+        cleanup()
+
+    assert len(attempts) == 1
+    assert dead_letter_count(redis_client, "jobs") == 0
+
+
+def test_failed_move_is_logged_and_counted(redis_client, stats, caplog, monkeypatch):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True, max_retries=2))
+    publish_message_to_queue(redis_client, "jobs", {"n": 1}, None)
+
+    def broken_retry(*args, **kwargs):
+        raise RuntimeError("script failed")
+
+    monkeypatch.setattr(consumer, "_run_retry", broken_retry)
+    with caplog.at_level(logging.ERROR, logger="bizzmq"):
+        _, cleanup = failing_consumer(redis_client, "jobs")
+        try:
+            assert wait_until(lambda: stats.counters.get((MESSAGES_DISCARDED, "jobs")) == 1)
+        finally:
+            cleanup()
+
+    assert any("script failed" in record.getMessage() for record in caplog.records)
+
+
+def test_redrive_returns_dead_letters_to_their_queue(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True, max_retries=0))
+    publish_message_to_queue(redis_client, "jobs", {"n": 1}, None)
+
+    _, cleanup = failing_consumer(redis_client, "jobs")
+    try:
+        assert wait_until(lambda: dead_letter_count(redis_client, "jobs") == 1)
+    finally:
+        cleanup()
+
+    assert redrive_dead_letter_messages(redis_client, "jobs") == 1
+    assert dead_letter_count(redis_client, "jobs") == 0
+    assert redis_client.llen("queue:jobs") == 1
+
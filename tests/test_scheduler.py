@@ -0,0 +1,42 @@
+import time
+
+from bizzmq import MessageOptions, QueueOptions, RetryOptions, consume_message_from_queue, create_queue, publish_message_to_queue
+
+from conftest import wait_until
+
+
+def test_retry_backoff_is_not_rounded_up_to_the_poll_interval(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions(config_dead_letter_queue=True, max_retries=1, retry=RetryOptions("fixed", delay=0.2, jitter=False)))
+    attempts = []
+
+    def callback(message):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise ValueError("boom")
+
+    cleanup, err = consume_message_from_queue(redis_client, "jobs", callback, block_timeout=0.05)
+    assert err is None
+    try:
+        # Let the scheduler settle into its idle poll before anything fails
+        time.sleep(1.1)
+        publish_message_to_queue(redis_client, "jobs", {"n": 1}, None)
+        assert wait_until(lambda: len(attempts) == 2)
+    finally:
+        cleanup()
+
+    assert attempts[1] - attempts[0] < 0.8
+
+
+def test_delayed_message_waits_in_the_scheduled_set(redis_client):
+    create_queue(redis_client, "jobs", QueueOptions())
+    publish_message_to_queue(redis_client, "jobs", {"n": 1}, MessageOptions(delay=0.3))
+    received = []
+
+    assert redis_client.zcard("queue_scheduled:jobs") == 1
+    cleanup, err = consume_message_from_queue(redis_client, "jobs", received.append, block_timeout=0.05)
+    assert err is None
+    try:
+        assert wait_until(lambda: received)
+    finally:
+        cleanup()
+    assert received == [{"n": 1}]
@@ -0,0 +1,122 @@
+import asyncio
+
+from bizzmq import MessageOptions, QueueOptions, consume_message_from_queue, create_queue, publish_messages_to_queue, queue_depth
+from bizzmq.backend import RedisBackend
+from bizzmq.dlq import dead_letter_count, get_dead_letter_messages
+from bizzmq.metrics import QUEUE_DEPTH, DepthSampler
+from bizzmq.streams import DEFAULT_CONSUMER_GROUP, ensure_consumer_group, stream_key
+
+from conftest import fake_async_client, wait_until
+
+
+def consume_all(redis_client, queue_name, count, **kwargs):
+    received = []
+    cleanup, err = consume_message_from_queue(redis_client, queue_name, received.append, block_timeout=0.05, **kwargs)
+    assert err is None
+    try:
+        assert wait_until(lambda: len(received) == count)
+    finally:
+        cleanup()
+    return received
+
+
+def test_depth_gauge_drops_once_entries_are_acknowledged(redis_client):
+    create_queue(redis_client, "events", QueueOptions(storage="stream"))
+    publish_messages_to_queue(redis_client, "events", range(5))
+    sampler = DepthSampler(redis_client, ["events"])
+    # No consumer group yet, every entry is waiting
+    assert sampler.sample()["events"][QUEUE_DEPTH] == 5
+
+    consume_all(redis_client, "events", 5)
+    assert sampler.sample()["events"][QUEUE_DEPTH] == 0
+
+    # Read but not acknowledged yet still counts
+    publish_messages_to_queue(redis_client, "events", range(2))
+    redis_client.xreadgroup(DEFAULT_CONSUMER_GROUP, "other", {stream_key("events"): ">"}, count=1)
+    assert sampler.sample()["events"][QUEUE_DEPTH] == 2
+
+
+def test_queue_length_of_a_drained_stream_is_zero(redis_client):
+    create_queue(redis_client, "events", QueueOptions(storage="stream", partitions=2))
+    publish_messages_to_queue(redis_client, "events", range(4), chunk_size=1)
+    backend = RedisBackend(redis_client)
+    assert backend.queue_length("events") == 4
+
+    consume_all(redis_client, "events", 4)
+    assert backend.queue_length("events") == 0
+
+
+def test_queue_depth_drops_after_consumption(redis_client):
+    create_queue(redis_client, "events", QueueOptions(storage="stream"))
+    assert queue_depth(redis_client, "events") == 0
+    publish_messages_to_queue(redis_client, "events", range(3))
+    publish_messages_to_queue(redis_client, "events", range(2), MessageOptions(delay=60))
+    assert queue_depth(redis_client, "events") == 5
+
+    consume_all(redis_client, "events", 3)
+    assert queue_depth(redis_client, "events") == 2
+
+
+def test_async_queue_depth_drops_after_consumption():
+    async def scenario():
+        client = fake_async_client()
+        await client.create_queue("events", QueueOptions(storage="stream"))
+        await client.publish_messages_to_queue("events", range(3))
+        assert await client.queue_depth("events") == 3
+        # Async clients can't consume streams yet, read and acknowledge the entries directly
+        key = stream_key("events")
+        await client.redisInstance.xgroup_create(key, DEFAULT_CONSUMER_GROUP, id="0")
+        [(_, entries)] = await client.redisInstance.xreadgroup(DEFAULT_CONSUMER_GROUP, "c1", {key: ">"})
+        await client.redisInstance.xack(key, DEFAULT_CONSUMER_GROUP, *[entry_id for entry_id, _ in entries])
+        assert await client.queue_depth("events") == 0
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_consumed_entries_are_deleted_from_the_stream(redis_client):
+    create_queue(redis_client, "events", QueueOptions(storage="stream"))
+    publish_messages_to_queue(redis_client, "events", [{"n": value} for value in range(5)])
+    assert redis_client.xlen(stream_key("events")) == 5
+
+    received = consume_all(redis_client, "events", 5)
+    assert [message["n"] for message in received] == list(range(5))
+    assert wait_until(lambda: redis_client.xlen(stream_key("events")) == 0)
+    assert redis_client.xpending(stream_key("events"), DEFAULT_CONSUMER_GROUP)["pending"] == 0
+
+
+def test_failed_entries_are_retried_then_dead_lettered(redis_client):
+    create_queue(redis_client, "events", QueueOptions(storage="stream", config_dead_letter_queue=True, max_retries=2))
+    publish_messages_to_queue(redis_client, "events", [{"n": 1}])
+    attempts = []
+
+    def callback(message):
+        attempts.append(message)
+        raise ValueError("boom")
+
+    cleanup, err = consume_message_from_queue(redis_client, "events", callback, block_timeout=0.05)
+    assert err is None
+    try:
+        assert wait_until(lambda: dead_letter_count(redis_client, "events") == 1)
+    finally:
+        cleanup()
+
+    assert len(attempts) == 3
+    [dead_letter] = get_dead_letter_messages(redis_client, "events")
+    assert dead_letter["message"] == {"n": 1}
+    assert dead_letter["options"]["message"] == "boom"
+    # Every failed delivery was acknowledged and deleted before its retry went in
+    assert redis_client.xlen(stream_key("events")) == 0
+
+
+def test_entries_of_a_crashed_consumer_are_reclaimed(redis_client):
+    create_queue(redis_client, "events", QueueOptions(storage="stream", config_dead_letter_queue=True))
+    publish_messages_to_queue(redis_client, "events", [{"n": 1}])
+    ensure_consumer_group(redis_client, "events")
+    # Read by a consumer that crashes before acknowledging it
+    redis_client.xreadgroup(DEFAULT_CONSUMER_GROUP, "crashed", {stream_key("events"): ">"}, count=1)
+
+    received = consume_all(redis_client, "events", 1, consumer_id="survivor", visibility_timeout=0.2)
+    assert received == [{"n": 1}]
+    assert wait_until(lambda: redis_client.xlen(stream_key("events")) == 0)
+    assert redis_client.xpending(stream_key("events"), DEFAULT_CONSUMER_GROUP)["pending"] == 0